@@ -53,6 +53,7 @@ export const LlmAgentConfigSchema = BaseAgentConfigSchema.extend({
   security_config: z.record(z.any()).optional(),
   planner_config: z.record(z.any()).optional(),
   code_executor_config: z.record(z.any()).optional(),
+  runtime_config: z.record(z.any()).optional(),
 });
 
 export const SequentialAgentConfigSchema = BaseAgentConfigSchema.extend({
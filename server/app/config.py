@@ -1,7 +1,7 @@
 import os
 from dotenv import load_dotenv
 from pydantic_settings import BaseSettings, SettingsConfigDict
-from typing import Optional
+from typing import List, Optional
 
 # Load .env file from the server directory (server/.env)
 dotenv_path = os.path.join(os.path.dirname(__file__), '..', '.env') 
@@ -23,6 +23,63 @@ class Settings(BaseSettings):
     VERTEX_AI_LOCATION: Optional[str] = None
     # GOOGLE_APPLICATION_CREDENTIALS path is usually set as an environment variable directly
     # and used by the Google client libraries automatically.
+    LLM_MODEL_CACHE_SIZE: int = 64 # Cached GenerativeModel handles (model, instruction, generation config)
+    LLM_DEADLINE_SECONDS: float = 60 # Per-call deadline, overridable in runtime_config["latency"]
+    LLM_STREAM_FIRST_CHUNK_SECONDS: float = 30 # Streaming: max wait for the first chunk
+    LLM_STREAM_IDLE_SECONDS: float = 30 # Streaming: max gap between chunks
+    # Per-model admission control and circuit breaker
+    LLM_MAX_CONCURRENCY_PER_MODEL: int = 16
+    LLM_MAX_QUEUE_PER_MODEL: int = 64
+    LLM_BREAKER_FAILURE_THRESHOLD: int = 5
+    LLM_BREAKER_RESET_SECONDS: float = 30
+    CHAT_HISTORY_CACHE_MAX_BYTES: int = 64 * 1024 * 1024 # Formatted chat history kept in memory across sessions
+    CHAT_HISTORY_FETCH_LIMIT: int = 500 # Latest messages loaded when a session's history is not cached
+    CHAT_HISTORY_REREAD_SECONDS: float = 10 # Incremental fetches re-read this far behind the cursor (late commits)
+    # Context window defaults; the window is opt-in per agent (runtime_config["context_window"]["enabled"] = true)
+    CONTEXT_WINDOW_MAX_HISTORY_TOKENS: int = 16000
+    CONTEXT_WINDOW_MIN_RECENT_MESSAGES: int = 4
+    CONTEXT_SUMMARY_MODEL: str = "gemini-1.5-flash"
+    CONTEXT_SUMMARY_MAX_TOKENS: int = 512
+    # Opt-in response cache (runtime_config["response_cache"])
+    LLM_RESPONSE_CACHE_MAX_BYTES: int = 16 * 1024 * 1024
+    LLM_RESPONSE_CACHE_TTL_SECONDS: int = 3600
+
+    # Workflow store: sqlite:///caminho/arquivo.db (padrão) ou postgresql://... (requer psycopg)
+    WORKFLOW_STORE_URL: str = "sqlite:///" + os.path.join(os.path.dirname(__file__), '..', 'workflows.db')
+    WORKFLOW_SNAPSHOT_INTERVAL: int = 20 # Revisões entre cópias completas da árvore
+
+    # Workflow engine
+    WORKFLOW_MAX_CONCURRENCY: int = 8 # Chamadas de LLM simultâneas por execução de workflow
+    WORKFLOW_NODE_CACHE_MAX_ENTRIES: int = 1024
+    WORKFLOW_COMPILED_CACHE_SIZE: int = 256 # Planos compilados mantidos em memória (LRU)
+    WORKFLOW_NODE_CACHE_TTL_SECONDS: float = 3600
+    WORKFLOW_RUN_MAX_WORKERS: int = 4 # Execuções em segundo plano simultâneas por instância
+    WORKFLOW_RUN_MAX_QUEUED: int = 100
+    WORKFLOW_RUN_RETENTION: int = 1000 # Execuções finalizadas mantidas para consulta
+    WORKFLOW_BATCH_CONCURRENCY: int = 16 # Registros em execução simultânea em um lote
+    WORKFLOW_BATCH_SPOOL_MEMORY_BYTES: int = 8 * 1024 * 1024 # Acima disso o lote é gravado em disco
+    WORKFLOW_LLM_BACKEND: str = "fake" # "fake" (local, sem rede) ou "vertex" (LLMService)
+    WORKFLOW_LLM_DEFAULT_MODEL: str = "gemini-1.5-flash" # Usado quando o nó não define "model"
+    WORKFLOW_FAKE_LLM_LATENCY: str = "fixed" # "fixed", "normal" ou "long_tail"
+    WORKFLOW_FAKE_LLM_MEAN_SECONDS: float = 1.0
+    WORKFLOW_FAKE_LLM_STDDEV_SECONDS: float = 0.25
+    WORKFLOW_FAKE_LLM_TAIL_SIGMA: float = 1.0
+    WORKFLOW_FAKE_LLM_FAILURE_RATE: float = 0.0
+    WORKFLOW_FAKE_LLM_SEED: Optional[int] = None
+
+    # Code executor (nós codeExecutor); os limites podem ser sobrescritos por code_executor_config,
+    # sempre dentro dos máximos abaixo
+    CODE_EXECUTOR_ENABLED: bool = False # Executa código enviado pelo usuário: habilitar só em ambientes confiáveis
+    CODE_EXECUTOR_POOL_SIZE: int = 2 # Workers pré-aquecidos por faixa de memória
+    CODE_EXECUTOR_CPU_TIME_SECONDS: float = 5
+    CODE_EXECUTOR_MEMORY_LIMIT_MB: int = 256
+    CODE_EXECUTOR_TIMEOUT_SECONDS: float = 10
+    CODE_EXECUTOR_MAX_CPU_TIME_SECONDS: float = 30
+    CODE_EXECUTOR_MAX_TIMEOUT_SECONDS: float = 60
+    CODE_EXECUTOR_MEMORY_TIERS_MB: List[int] = [128, 256, 512, 1024] # Um pool por faixa; pedidos são arredondados para cima
+    CODE_EXECUTOR_MAX_SNIPPETS_PER_WORKER: int = 1 # Worker é reciclado após N snippets (1 = processo novo a cada execução)
+    CODE_EXECUTOR_MAX_OUTPUT_CHARS: int = 65536
+    CODE_EXECUTOR_MAX_RESULT_BYTES: int = 1024 * 1024 # Resultados maiores (em pickle) voltam como repr truncado
 
     # Encryption
     ENCRYPTION_KEY_FILE: str = os.path.join(os.path.dirname(__file__), '..', '..', 'secret.key')
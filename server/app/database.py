@@ -4,7 +4,6 @@ from datetime import datetime, timedelta
 from .models.agent import Agent
 from .models.audit import AuditLog, AuditLogActor
 from .models.governance import ApprovalItem, HistoryItem
-from .models.workflow import WorkflowStored
 
 # --- In-Memory Storage (Substituir por um banco de dados real em produção) ---
 
@@ -14,9 +13,6 @@ _agents: Dict[str, Agent] = {}
 # Secret storage (armazena valores criptografados)
 _secrets: Dict[str, bytes] = {}
 
-# Workflow storage
-_workflows: Dict[str, WorkflowStored] = {}
-
 # Audit log storage com dados mockados
 _audit_logs: List[AuditLog] = [
     AuditLog(
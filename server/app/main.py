@@ -1,9 +1,13 @@
+import asyncio
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware # Adicionar esta importação
 
 # Adicionar importações dos routers que já existem e do novo user_router
 from .routers import agents, tools, auth, users as user_router 
 from .core.config import settings 
+from .services.code_executor_pool import shutdown_code_executor_pools
+from .services.token_estimator import token_estimator
 
 app = FastAPI(
     title=settings.PROJECT_NAME, 
@@ -27,6 +31,17 @@ app.add_middleware(
     allow_headers=["*"],    # Permite todos os cabeçalhos
 )
 
+@app.on_event("startup")
+async def startup_event():
+    # Calibração do estimador de tokens em segundo plano, fora do caminho das requisições
+    app.state.token_calibration = asyncio.create_task(token_estimator.run_refresh_loop())
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    app.state.token_calibration.cancel()
+    # Encerra os workers pré-aquecidos do codeExecutor para não deixá-los órfãos em reloads
+    await shutdown_code_executor_pools()
+
 @app.get("/", tags=["Root"])
 async def read_root():
     return {"message": f"Bem-vindo à API da Plataforma {settings.PROJECT_NAME}"} 
@@ -29,6 +29,7 @@ class Agent(BaseModel):
     security_config: Optional[Dict[str, Any]] = None
     planner_config: Optional[Dict[str, Any]] = None
     code_executor_config: Optional[Dict[str, Any]] = None
+    runtime_config: Optional[Dict[str, Any]] = None
 
     tools: List[ToolResponseSchema] = [] # Changed to ToolResponseSchema
     knowledge_base_ids: Optional[List[str]] = Field(default_factory=list)
@@ -61,6 +62,7 @@ class AgentUpdate(BaseModel):
     security_config: Optional[Dict[str, Any]] = None
     planner_config: Optional[Dict[str, Any]] = None
     code_executor_config: Optional[Dict[str, Any]] = None
+    runtime_config: Optional[Dict[str, Any]] = None
 
     tool_ids: Optional[List[str]] = None # Accepts a list of tool UUIDs for update
     knowledge_base_ids: Optional[List[str]] = None
@@ -83,6 +85,7 @@ class AgentCreate(BaseModel):
     security_config: Optional[Dict[str, Any]] = None
     planner_config: Optional[Dict[str, Any]] = None
     code_executor_config: Optional[Dict[str, Any]] = None
+    runtime_config: Optional[Dict[str, Any]] = None
     tool_ids: Optional[List[str]] = Field(default_factory=list)
     knowledge_base_ids: Optional[List[str]] = Field(default_factory=list)
 
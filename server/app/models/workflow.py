@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Any, List, Dict
+from typing import Any, List, Dict, Literal, Optional
 
 class WorkflowNode(BaseModel):
     id: str
@@ -11,9 +11,64 @@ class WorkflowNode(BaseModel):
 WorkflowNode.update_forward_refs()
 
 class WorkflowPayload(BaseModel):
+    name: Optional[str] = None
     workflow: List[WorkflowNode]
 
 class WorkflowStored(BaseModel):
     id: str
+    name: Optional[str] = None
     created_at: str
     workflow_tree: List[WorkflowNode]
+    revision: int = 1
+    updated_at: Optional[str] = None
+
+class WorkflowPatch(BaseModel):
+    base_revision: int # Revisão sobre a qual as operações foram geradas
+    ops: List[Dict[str, Any]] # Ver `services/workflow_versioning`
+
+class WorkflowRevision(BaseModel):
+    revision: int
+    kind: Literal['snapshot', 'delta']
+    op_count: int # Operações do delta ou, em snapshots, nós da árvore
+    created_at: str
+    name: Optional[str] = None # Nome do workflow nesta revisão
+
+class WorkflowSummary(BaseModel):
+    id: str
+    name: Optional[str] = None
+    node_count: int
+    created_at: str
+
+class WorkflowSummaryPage(BaseModel):
+    items: List[WorkflowSummary]
+    next_cursor: Optional[str] = None # Passe em `cursor` para obter a próxima página
+
+class WorkflowRun(BaseModel):
+    id: str
+    workflow_id: str
+    status: Literal['queued', 'running', 'succeeded', 'failed', 'cancelled'] = 'queued'
+    attempts: int = 1 # Incrementado a cada retomada a partir dos checkpoints
+    created_at: str
+    started_at: Optional[str] = None
+    finished_at: Optional[str] = None
+    final_outputs: Optional[List[Any]] = None
+    error: Optional[str] = None
+
+class WorkflowModelEstimate(BaseModel):
+    llm_calls: int
+    input_tokens: int
+    output_tokens: int
+    estimated_cost: float
+    stats_samples: int # Linhas de usage_metrics usadas; 0 = valores padrão
+
+class WorkflowEstimate(BaseModel):
+    workflow_id: Optional[str] = None
+    critical_path_ms: float
+    llm_calls: int
+    estimated_input_tokens: int
+    estimated_output_tokens: int
+    estimated_cost: float
+    latency_percentile: int
+    latency_budget_ms: Optional[float] = None
+    within_budget: Optional[bool] = None
+    models: Dict[str, WorkflowModelEstimate] = Field(default_factory=dict)
@@ -51,7 +51,7 @@ def create_agent(agent_payload: AgentCreate, current_user: User, jwt_token: str)
     tool_ids_to_associate = agent_dict.pop('tool_ids', [])
     knowledge_base_ids = agent_dict.pop('knowledge_base_ids', [])
 
-    for key in ['security_config', 'planner_config', 'code_executor_config', 'input_schema', 'output_schema']:
+    for key in ['security_config', 'planner_config', 'code_executor_config', 'runtime_config', 'input_schema', 'output_schema']:
         if key in agent_dict and agent_dict[key] is not None:
             agent_dict[key] = json.dumps(agent_dict[key])
 
@@ -117,7 +117,7 @@ def update_agent(agent_id: str, agent_update: AgentUpdate, current_user: User, j
                 "knowledge_base_id": kb_id
             }).execute()
 
-    for key in ['security_config', 'planner_config', 'code_executor_config', 'input_schema', 'output_schema']:
+    for key in ['security_config', 'planner_config', 'code_executor_config', 'runtime_config', 'input_schema', 'output_schema']:
         if key in update_data and update_data[key] is not None:
             update_data[key] = json.dumps(update_data[key])
 
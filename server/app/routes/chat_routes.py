@@ -1,30 +1,35 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from typing import List, Optional
+from fastapi.responses import StreamingResponse
+from typing import Any, AsyncIterator, Dict, List, NamedTuple, Optional, Tuple
 import uuid
+from supabase import PostgrestAPIError
 
 from app.schemas.chat_schemas import (
     ChatSessionCreate, ChatSessionResponse, ChatSessionUpdate, ChatMessageBase,
-    ChatMessageCreate, ChatMessageResponse, ChatSessionDetailResponse
+    ChatMessageCreate, ChatMessageResponse, ChatSessionDetailResponse, ChatCostPreview
 )
 from app.models.user_model import User
 from app.utils.security import get_current_user_and_token
 from app.schemas.auth_schemas import CurrentUserWithToken
 from app.supabase_client import create_supabase_client_with_jwt
-from app.services.llm_service import LLMService
+from app.config import settings
+from app.services.llm_service import LLMResponseStream, LLMService, get_llm_service
+from app.services.llm_pricing import calculate_cost as _calculate_cost
+from app.services.chat_history_cache import chat_history_cache
+from app.services.context_window import (
+    SUMMARY_INSTRUCTION, ContextWindowConfig, build_context_window, parse_context_window_config
+)
+from app.services.llm_call_policy import CallPolicy, parse_call_policy
+from app.services.llm_circuit_breaker import LLMUnavailableError
+from app.services.token_estimator import PromptTooLargeError, token_estimator
+from app.services.model_router import fetch_tool_names, parse_routing_policy, route_message
+from app.services.llm_response_cache import (
+    CachedResponse, make_response_key, parse_response_cache_config, response_cache
+)
 from app.models.agent import Agent as AgentModel
-from datetime import datetime
-
-
-def _calculate_cost(model_name: str, input_tokens: int, output_tokens: int) -> float:
-    MODEL_PRICING = {
-        "gemini-1.5-flash": {"input": 0.50, "output": 1.50},
-        "gemini-1.5-pro": {"input": 7.00, "output": 21.00},
-        "default": {"input": 0.50, "output": 1.50}
-    }
-    pricing = MODEL_PRICING.get(model_name, MODEL_PRICING["default"])
-    input_cost = (input_tokens / 1_000_000) * pricing["input"]
-    output_cost = (output_tokens / 1_000_000) * pricing["output"]
-    return input_cost + output_cost
+import json
+import math
+import time
 
 
 async def create_chat_session(session_data: ChatSessionCreate, current_user: User, jwt_token: str) -> ChatSessionResponse:
@@ -66,6 +71,7 @@ async def update_chat_session(session_id: uuid.UUID, session_data: ChatSessionUp
     response = await db.table('chat_sessions').update(update_payload).eq('id', str(session_id)).eq('user_id', str(current_user.id)).execute()
     if not response.data:
         raise HTTPException(status_code=404, detail="Chat session not found or update failed")
+    chat_history_cache.invalidate(session_id)
     return ChatSessionResponse(**response.data[0])
 
 
@@ -74,6 +80,7 @@ async def delete_chat_session(session_id: uuid.UUID, current_user: User, jwt_tok
     response = await db.table('chat_sessions').delete().eq('id', str(session_id)).eq('user_id', str(current_user.id)).execute()
     if not response.data:
         raise HTTPException(status_code=404, detail="Chat session not found or delete failed")
+    chat_history_cache.invalidate(session_id)
     return None
 
 
@@ -100,23 +107,180 @@ async def list_chat_messages(session_id: uuid.UUID, current_user: User, jwt_toke
     return [ChatMessageResponse(**msg) for msg in response.data]
 
 
-async def _get_or_create_session(user_id: uuid.UUID, agent_id: uuid.UUID, jwt_token: str) -> ChatSessionResponse:
+class _AgentTurn(NamedTuple):
+    db: Any
+    session: ChatSessionResponse
+    conversation_history: List[Any] # Formatted by LLMService.format_message
+    agent: AgentModel
+    context_details: Optional[Dict[str, Any]] # Context window metrics, logged in usage_metrics.details
+    response_cache_key: Optional[str] = None # Set when the agent opted into the response cache
+    response_cache_ttl: Optional[float] = None
+    cached_response: Optional[CachedResponse] = None # Cache hit: no LLM call is needed
+    call_policy: Optional[CallPolicy] = None # Deadline and hedging for the LLM call
+    routing: Optional[Dict[str, Any]] = None # Model routing decision, logged in usage_metrics.details
+
+
+async def _summarize_history(
+    llm_service: LLMService, previous_summary: Optional[str], transcript: str, config: ContextWindowConfig
+) -> Optional[Tuple[str, Dict[str, int]]]:
+    summarizer = AgentModel(
+        name="context-summarizer",
+        instruction=SUMMARY_INSTRUCTION,
+        model=config.summary_model,
+        max_output_tokens=config.summary_max_tokens,
+        temperature=0.2,
+    )
+    prompt = f"New messages:\n{transcript}"
+    if previous_summary:
+        prompt = f"Previous summary:\n{previous_summary}\n\n{prompt}"
+    try:
+        text, token_usage = await llm_service.generate_response(summarizer, [], prompt)
+    except (LLMUnavailableError, PromptTooLargeError) as e:
+        print(f"WARNING: Could not summarize chat history: {e}")
+        return None
+    if not token_usage.get('output_tokens'):
+        return None
+    return text, token_usage
+
+
+async def _begin_agent_turn(
+    agent_id: uuid.UUID,
+    user_id: uuid.UUID,
+    user_message_content: str,
+    user_message_metadata: Optional[Dict[str, Any]],
+    jwt_token: str,
+    llm_service: LLMService,
+) -> _AgentTurn:
+    """Stores the user message and loads the history and agent config needed to answer it.
+
+    Session get-or-create, the user message insert, the agent select and the history fetch run
+    in one `chat_begin_turn` RPC (one transaction). The history is incremental from the cached
+    cursor when the database resolves the same session the cache last saw for this user/agent.
+    """
     db = create_supabase_client_with_jwt(jwt_token)
-    response = await db.table('chat_sessions').select('*').eq('user_id', str(user_id)).eq('agent_id', str(agent_id)).order('updated_at', desc=True).maybe_single().execute()
-    if response.data:
-        updated_session_response = await db.table('chat_sessions').update({'updated_at': datetime.utcnow().isoformat()}).eq('id', str(response.data['id'])).execute()
-        if updated_session_response.data and len(updated_session_response.data) > 0:
-            return ChatSessionResponse(**updated_session_response.data[0])
-        return ChatSessionResponse(**response.data)
-    agent_details_res = await db.table('agents').select('name').eq('id', str(agent_id)).maybe_single().execute()
-    agent_name = agent_details_res.data['name'] if agent_details_res.data else f"Agent {str(agent_id)[:8]}"
-    new_session_data = ChatSessionCreate(agent_id=agent_id, session_title=f"Chat with {agent_name}")
-    insert_payload = new_session_data.dict()
-    insert_payload['user_id'] = str(user_id)
-    insert_response = await db.table('chat_sessions').insert(insert_payload).execute()
-    if not insert_response.data or len(insert_response.data) == 0:
-        raise HTTPException(status_code=500, detail="Failed to create new chat session")
-    return ChatSessionResponse(**insert_response.data[0])
+    owner = (user_id, agent_id)
+    rpc_params: Dict[str, Any] = {
+        'p_agent_id': str(agent_id),
+        'p_content': user_message_content,
+        'p_content_metadata': user_message_metadata,
+        'p_history_limit': settings.CHAT_HISTORY_FETCH_LIMIT,
+    }
+    latest = chat_history_cache.latest_for(owner)
+    history_after = latest[1].fetch_after() if latest is not None else None
+    if history_after is not None:
+        rpc_params['p_session_hint'] = str(latest[0])
+        rpc_params['p_history_after'] = history_after.isoformat()
+    try:
+        turn_res = await db.rpc('chat_begin_turn', rpc_params).execute()
+    except PostgrestAPIError as e:
+        if e.code == 'P0002':
+            raise HTTPException(status_code=404, detail="Agent not found")
+        raise HTTPException(status_code=500, detail=f"Failed to start chat turn: {e.message}")
+    if not turn_res.data:
+        raise HTTPException(status_code=500, detail="Failed to store user message")
+    session = ChatSessionResponse(**turn_res.data['session'])
+    user_message_id = uuid.UUID(str(turn_res.data['user_message']['id']))
+    if not turn_res.data.get('history_incremental'):
+        # A full (bounded) fetch replaces whatever was cached for the session
+        chat_history_cache.invalidate(session.id)
+    new_messages = [ChatMessageResponse(**msg) for msg in turn_res.data.get('history') or []]
+    history = chat_history_cache.extend(session.id, new_messages, llm_service.format_message, owner=owner)
+    agent_data = turn_res.data['agent']
+    try:
+        agent_model_instance = AgentModel(**agent_data)
+    except Exception as e:
+        print(f"Error converting agent data to AgentModel: {e}. Data: {agent_data}")
+        raise HTTPException(status_code=500, detail=f"Invalid agent configuration: {e}")
+    try:
+        context_config = parse_context_window_config(agent_model_instance.runtime_config)
+        cache_config = parse_response_cache_config(agent_model_instance.runtime_config)
+        call_policy = parse_call_policy(agent_model_instance.runtime_config)
+        routing_policy = parse_routing_policy(agent_model_instance.planner_config, agent_model_instance.model)
+    except ValueError as e:
+        raise HTTPException(status_code=500, detail=f"Invalid agent configuration: {e}")
+    upto = history.index_of(user_message_id)
+    routing = None
+    if routing_policy is not None:
+        routing = route_message(
+            routing_policy, user_message_content, upto, turn_res.data.get('tool_names') or []
+        )
+        routing['requested_model'] = agent_model_instance.model
+        # Everything downstream (cache key, context window, LLM call, cost) uses the routed model
+        agent_model_instance = agent_model_instance.model_copy(update={'model': routing['model']})
+    cache_key, cache_ttl = None, None
+    if cache_config is not None:
+        tail_start = max(0, upto - cache_config.history_messages)
+        cache_key, cache_ttl = make_response_key(
+            agent_model_instance.model,
+            agent_model_instance.instruction,
+            llm_service.generation_config(agent_model_instance),
+            list(zip(history.senders[tail_start:upto], history.texts[tail_start:upto])),
+            user_message_content,
+        ), cache_config.ttl_seconds
+        cached_response = response_cache.get(cache_key)
+        if cached_response is not None:
+            return _AgentTurn(db, session, [], agent_model_instance, None, cache_key, cache_ttl, cached_response, routing=routing)
+    if context_config is None:
+        return _AgentTurn(db, session, history.contents[:upto], agent_model_instance, None, cache_key, cache_ttl, call_policy=call_policy, routing=routing)
+    window = await build_context_window(
+        history, upto, context_config,
+        lambda previous, transcript, config: _summarize_history(llm_service, previous, transcript, config),
+    )
+    conversation_history = window.recent
+    if window.summary:
+        conversation_history = [llm_service.format_summary(window.summary), *window.recent]
+    context_details = dict(window.details)
+    if window.summary_usage:
+        context_details['summary_input_tokens'] = window.summary_usage.get('input_tokens', 0)
+        context_details['summary_output_tokens'] = window.summary_usage.get('output_tokens', 0)
+        context_details['summary_cost'] = _calculate_cost(
+            context_config.summary_model, context_details['summary_input_tokens'], context_details['summary_output_tokens']
+        )
+    return _AgentTurn(db, session, conversation_history, agent_model_instance, context_details, cache_key, cache_ttl, call_policy=call_policy, routing=routing)
+
+
+async def _complete_agent_turn(
+    turn: _AgentTurn,
+    user_id: uuid.UUID,
+    llm_response_content: str,
+    token_usage: Dict[str, int],
+    usage_details: Dict[str, Any],
+    event_type: str = 'chat_completion',
+    model_name: Optional[str] = None,
+) -> ChatMessageResponse:
+    """Stores the agent reply and logs its usage metrics (against `model_name` if a fallback answered).
+
+    Both rows are written by one `chat_complete_turn` RPC; a failed usage insert only logs a warning.
+    """
+    db, session, agent_model_instance = turn.db, turn.session, turn.agent
+    model_name = model_name or agent_model_instance.model
+    usage_payload = {
+        'agent_id': str(agent_model_instance.id),
+        'event_type': event_type,
+        'model_name': model_name,
+        'input_tokens': token_usage.get('input_tokens', 0),
+        'output_tokens': token_usage.get('output_tokens', 0),
+        'cost': _calculate_cost(model_name, token_usage.get('input_tokens', 0), token_usage.get('output_tokens', 0)),
+        'details': {'service': 'llm_service', **usage_details}
+    }
+    if turn.context_details and turn.context_details.get('summary_cost'):
+        # The summary call is part of this turn's spend; its own tokens stay in details.context_window
+        usage_payload['cost'] += turn.context_details['summary_cost']
+    if turn.context_details:
+        usage_payload['details']['context_window'] = turn.context_details
+    if turn.routing:
+        usage_payload['details']['routing'] = turn.routing
+    try:
+        agent_msg_db_res = await db.rpc('chat_complete_turn', {
+            'p_session_id': str(session.id),
+            'p_content': llm_response_content,
+            'p_usage': usage_payload,
+        }).execute()
+    except PostgrestAPIError as e:
+        raise HTTPException(status_code=500, detail=f"Failed to store agent message: {e.message}")
+    if not agent_msg_db_res.data:
+        raise HTTPException(status_code=500, detail="Failed to store agent message")
+    return ChatMessageResponse(**agent_msg_db_res.data)
 
 
 async def process_agent_message(
@@ -127,59 +291,177 @@ async def process_agent_message(
     jwt_token: str,
     llm_service: LLMService,
 ) -> ChatMessageResponse:
+    turn = await _begin_agent_turn(agent_id, user_id, user_message_content, user_message_metadata, jwt_token, llm_service)
+    if turn.cached_response is not None:
+        return await _complete_cached_turn(turn, user_id)
+    llm_started_at = time.perf_counter()
+    call_details: Dict[str, Any] = {}
+    try:
+        llm_response_content, token_usage = await llm_service.generate_response(
+            agent_config=turn.agent,
+            conversation_history=turn.conversation_history,
+            user_message_content=user_message_content,
+            call_policy=turn.call_policy,
+            call_details=call_details,
+        )
+    except PromptTooLargeError as e:
+        raise _prompt_too_large_http_error(e)
+    except LLMUnavailableError as e:
+        # Nothing is stored for the agent: the error is not a reply
+        raise _unavailable_http_error(e)
+    latency_ms = round((time.perf_counter() - llm_started_at) * 1000, 1)
+    usage_details = {'action': 'generate_response', 'latency_ms': latency_ms, 'llm_call': call_details}
+    _store_cached_response(turn, llm_response_content, token_usage, usage_details)
+    return await _complete_agent_turn(
+        turn, user_id, llm_response_content, token_usage, usage_details, model_name=call_details.get('model')
+    )
+
+
+def _prompt_too_large_http_error(error: PromptTooLargeError) -> HTTPException:
+    return HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(error))
+
+
+def _unavailable_http_error(error: LLMUnavailableError) -> HTTPException:
+    headers = None
+    if error.retry_after_seconds is not None:
+        headers = {"Retry-After": str(max(1, math.ceil(error.retry_after_seconds)))}
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail=f"The model is temporarily unavailable ({error.reason}). Please retry later.",
+        headers=headers,
+    )
+
+
+def _store_cached_response(turn: _AgentTurn, text: str, token_usage: Dict[str, int], usage_details: Dict[str, Any]) -> None:
+    if turn.response_cache_key is None:
+        return
+    usage_details['cache_hit'] = False
+    # Replies without output tokens (no text was generated) are not cached
+    if token_usage.get('output_tokens'):
+        response_cache.put(turn.response_cache_key, text, token_usage, turn.response_cache_ttl)
+
+
+async def _complete_cached_turn(turn: _AgentTurn, user_id: uuid.UUID) -> ChatMessageResponse:
+    """Stores a reply served from the response cache; it is logged with zero tokens and cost."""
+    cached = turn.cached_response
+    saved_input = cached.token_usage.get('input_tokens', 0)
+    saved_output = cached.token_usage.get('output_tokens', 0)
+    return await _complete_agent_turn(
+        turn, user_id, cached.text, {'input_tokens': 0, 'output_tokens': 0},
+        {
+            'action': 'response_cache',
+            'cache_hit': True,
+            'latency_ms': 0.0,
+            'saved_input_tokens': saved_input,
+            'saved_output_tokens': saved_output,
+            'saved_cost': _calculate_cost(turn.agent.model, saved_input, saved_output),
+        },
+        event_type='chat_completion_cached',
+    )
+
+
+async def preview_agent_message_cost(
+    agent_id: uuid.UUID,
+    user_id: uuid.UUID,
+    user_message_content: str,
+    jwt_token: str,
+) -> ChatCostPreview:
+    """Estimates prompt tokens and cost for a message locally, without storing or sending it."""
     db = create_supabase_client_with_jwt(jwt_token)
-    session = await _get_or_create_session(user_id, agent_id, jwt_token)
-    user_message_to_insert = {
-        "session_id": str(session.id),
-        "sender_type": 'USER',
-        "content": user_message_content,
-        "content_metadata": user_message_metadata
-    }
-    user_msg_db_res = await db.table('chat_messages').insert(user_message_to_insert).execute()
-    if not user_msg_db_res.data or len(user_msg_db_res.data) == 0:
-        raise HTTPException(status_code=500, detail="Failed to store user message")
-    history_response = await db.table('chat_messages').select('*').eq('session_id', str(session.id)).neq('id', str(user_msg_db_res.data[0]['id'])).order('created_at', desc=False).execute()
-    conversation_history: List[ChatMessageResponse] = []
-    if history_response.data:
-        conversation_history = [ChatMessageResponse(**msg) for msg in history_response.data]
     agent_config_res = await db.table('agents').select('*').eq('id', str(agent_id)).maybe_single().execute()
     if not agent_config_res.data:
         raise HTTPException(status_code=404, detail="Agent not found")
     try:
         agent_model_instance = AgentModel(**agent_config_res.data)
+        context_config = parse_context_window_config(agent_model_instance.runtime_config)
+        routing_policy = parse_routing_policy(agent_model_instance.planner_config, agent_model_instance.model)
     except Exception as e:
-        print(f"Error converting agent data to AgentModel: {e}. Data: {agent_config_res.data}")
         raise HTTPException(status_code=500, detail=f"Invalid agent configuration: {e}")
-    llm_response_content, token_usage = await llm_service.generate_response(
-        agent_config=agent_model_instance,
-        conversation_history=conversation_history,
-        user_message_content=user_message_content
+
+    history_chars = 0
+    history_depth = 0
+    session_res = await db.table('chat_sessions').select('id').eq('user_id', str(user_id)).eq('agent_id', str(agent_id)).order('updated_at', desc=True).limit(1).execute()
+    if session_res.data:
+        session_id = uuid.UUID(str(session_res.data[0]['id']))
+        cached_history = chat_history_cache.get(session_id)
+        if cached_history is not None:
+            history_chars = sum(len(text) for text in cached_history.texts)
+            history_depth = len(cached_history.texts)
+        else:
+            messages_res = await db.table('chat_messages').select('content').eq('session_id', str(session_id)).execute()
+            history_chars = sum(len(msg.get('content') or "") for msg in messages_res.data or [])
+            history_depth = len(messages_res.data or [])
+
+    model = agent_model_instance.model
+    if routing_policy is not None:
+        model = route_message(
+            routing_policy, user_message_content, history_depth, await fetch_tool_names(db, agent_id)
+        )['model']
+    if context_config is not None:
+        # Only the context window budget of the history is sent
+        history_chars = min(history_chars, math.ceil(context_config.max_history_tokens * token_estimator.chars_per_token(model)))
+    estimate = token_estimator.estimate_prompt(
+        model,
+        len(agent_model_instance.instruction or "") + history_chars + len(user_message_content),
+        agent_model_instance.max_output_tokens,
     )
-    agent_message_to_insert = {
-        "session_id": str(session.id),
-        "sender_type": 'AGENT',
-        "content": llm_response_content
-    }
-    agent_msg_db_res = await db.table('chat_messages').insert(agent_message_to_insert).execute()
-    if not agent_msg_db_res.data or len(agent_msg_db_res.data) == 0:
-        raise HTTPException(status_code=500, detail="Failed to store agent message")
+    history_tokens = token_estimator.estimate(model, history_chars)
+    return ChatCostPreview(model=model, history_tokens=history_tokens, **estimate)
+
+
+def _format_sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+async def stream_agent_message(
+    turn: _AgentTurn,
+    user_id: uuid.UUID,
+    stream: Optional[LLMResponseStream],
+) -> AsyncIterator[str]:
+    """Forwards the reply as SSE `delta` events as tokens arrive, then persists it.
+
+    Events: `start` (session_id), `delta` (text), `done` (stored agent message and usage)
+    or `error`. The agent message and usage metrics are stored only after the stream ends;
+    if the client disconnects first, generation is cancelled and nothing is stored.
+    """
+    yield _format_sse("start", {"session_id": str(turn.session.id)})
+    if turn.cached_response is not None:
+        yield _format_sse("delta", {"text": turn.cached_response.text})
+        try:
+            agent_message = await _complete_cached_turn(turn, user_id)
+        except HTTPException as e:
+            yield _format_sse("error", {"detail": e.detail})
+            return
+        yield _format_sse("done", {"message": json.loads(agent_message.json()), "usage": {"input_tokens": 0, "output_tokens": 0}})
+        return
+    llm_started_at = time.perf_counter()
+    first_token_ms: Optional[float] = None
     try:
-        cost = _calculate_cost(agent_model_instance.model, token_usage.get('input_tokens', 0), token_usage.get('output_tokens', 0))
-        log_payload = {
-            'user_id': str(user_id),
-            'agent_id': str(agent_model_instance.id),
-            'session_id': str(session.id),
-            'event_type': 'chat_completion',
-            'model_name': agent_model_instance.model,
-            'input_tokens': token_usage.get('input_tokens', 0),
-            'output_tokens': token_usage.get('output_tokens', 0),
-            'cost': cost,
-            'details': {'service': 'llm_service', 'action': 'generate_response'}
-        }
-        await db.table('usage_metrics').insert(log_payload).execute()
+        async for text in stream:
+            if first_token_ms is None:
+                first_token_ms = round((time.perf_counter() - llm_started_at) * 1000, 1)
+            yield _format_sse("delta", {"text": text})
+    except LLMUnavailableError as e:
+        yield _format_sse("error", {"detail": _unavailable_http_error(e).detail, "reason": e.reason})
+        return
     except Exception as e:
-        print(f"ERROR: Could not log usage metrics for session {session.id}: {e}")
-    return ChatMessageResponse(**agent_msg_db_res.data[0])
+        print(f"ERROR: LLM stream failed for session {turn.session.id}: {e}")
+        yield _format_sse("error", {"detail": "Error communicating with LLM."})
+        return
+    latency_ms = round((time.perf_counter() - llm_started_at) * 1000, 1)
+    usage_details = {
+        'action': 'stream_response', 'latency_ms': latency_ms, 'time_to_first_token_ms': first_token_ms,
+        'llm_call': {'preflight': stream.preflight, **stream.details},
+    }
+    _store_cached_response(turn, stream.text, stream.token_usage, usage_details)
+    try:
+        agent_message = await _complete_agent_turn(
+            turn, user_id, stream.text, stream.token_usage, usage_details, model_name=stream.model
+        )
+    except HTTPException as e:
+        yield _format_sse("error", {"detail": e.detail})
+        return
+    yield _format_sse("done", {"message": json.loads(agent_message.json()), "usage": stream.token_usage})
 
 router = APIRouter(
     prefix="/chat",
@@ -254,7 +536,7 @@ async def post_agent_message(
     agent_id: uuid.UUID,
     user_message_payload: ChatMessageBase,
     user_data: CurrentUserWithToken = Depends(get_current_user_and_token),
-    llm_service: LLMService = Depends(LLMService)
+    llm_service: LLMService = Depends(get_llm_service)
 ):
     if user_message_payload.sender_type != 'USER':
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Sender type must be USER for this endpoint.")
@@ -268,3 +550,54 @@ async def post_agent_message(
         llm_service=llm_service
     )
     return agent_response_message
+
+
+@router.post("/{agent_id}/message/stream", summary="Post a message to an agent and stream the response (SSE)")
+async def post_agent_message_stream(
+    agent_id: uuid.UUID,
+    user_message_payload: ChatMessageBase,
+    user_data: CurrentUserWithToken = Depends(get_current_user_and_token),
+    llm_service: LLMService = Depends(get_llm_service)
+):
+    if user_message_payload.sender_type != 'USER':
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Sender type must be USER for this endpoint.")
+
+    # Done before streaming starts so that lookup failures still return proper status codes
+    turn = await _begin_agent_turn(
+        agent_id=agent_id,
+        user_id=user_data.user.id,
+        user_message_content=user_message_payload.content,
+        user_message_metadata=user_message_payload.content_metadata,
+        jwt_token=user_data.jwt_token,
+        llm_service=llm_service,
+    )
+    stream = None
+    if turn.cached_response is None:
+        try:
+            stream = llm_service.stream_response(
+                agent_config=turn.agent,
+                conversation_history=turn.conversation_history,
+                user_message_content=user_message_payload.content,
+                call_policy=turn.call_policy,
+            )
+        except PromptTooLargeError as e:
+            raise _prompt_too_large_http_error(e)
+    return StreamingResponse(
+        stream_agent_message(turn, user_data.user.id, stream),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.post("/{agent_id}/message/preview", response_model=ChatCostPreview, summary="Estimate prompt tokens and cost before sending a message")
+async def preview_agent_message(
+    agent_id: uuid.UUID,
+    user_message_payload: ChatMessageBase,
+    user_data: CurrentUserWithToken = Depends(get_current_user_and_token)
+):
+    return await preview_agent_message_cost(
+        agent_id=agent_id,
+        user_id=user_data.user.id,
+        user_message_content=user_message_payload.content,
+        jwt_token=user_data.jwt_token,
+    )
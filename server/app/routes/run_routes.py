@@ -0,0 +1,69 @@
+from fastapi import APIRouter, HTTPException, status
+from typing import Any, Dict
+
+from ..models.workflow import WorkflowRun
+from ..services.workflow_runs import workflow_run_manager, RunNotActiveError, RunNotResumableError, RunQueueFullError
+
+router = APIRouter(
+    prefix="/runs",
+    tags=["Workflow Runs"],
+)
+
+@router.get("/{run_id}", response_model=WorkflowRun)
+async def get_workflow_run(run_id: str):
+    """Retorna o estado de uma execução de workflow em segundo plano."""
+    run = workflow_run_manager.get(run_id)
+    if not run:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Execução com ID '{run_id}' não encontrada."
+        )
+    return run
+
+@router.get("/{run_id}/trace", response_model=Dict[str, Any])
+async def get_workflow_run_trace(run_id: str):
+    """Exporta os spans da execução no formato `trace_event` do Chrome.
+
+    Disponível apenas para execuções iniciadas com `trace=true`.
+    """
+    run = workflow_run_manager.get(run_id)
+    tracer = workflow_run_manager.get_trace(run_id)
+    if not run or not tracer:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Trace da execução '{run_id}' não encontrado."
+        )
+    return tracer.to_chrome_trace(other_data={"run_id": run.id, "workflow_id": run.workflow_id, "status": run.status})
+
+@router.delete("/{run_id}", response_model=WorkflowRun)
+async def cancel_workflow_run(run_id: str):
+    """Cancela uma execução que ainda está na fila ou em andamento."""
+    try:
+        run = workflow_run_manager.cancel(run_id)
+    except RunNotActiveError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    if not run:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Execução com ID '{run_id}' não encontrada."
+        )
+    return run
+
+@router.post("/{run_id}/resume", response_model=WorkflowRun, status_code=status.HTTP_202_ACCEPTED)
+async def resume_workflow_run(run_id: str):
+    """Retoma uma execução que falhou ou foi cancelada a partir do último checkpoint.
+
+    Nós já concluídos não são executados de novo; a execução volta para a fila.
+    """
+    try:
+        run = workflow_run_manager.resume(run_id)
+    except RunNotResumableError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    except RunQueueFullError as e:
+        raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=str(e))
+    if not run:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Execução com ID '{run_id}' não encontrada."
+        )
+    return run
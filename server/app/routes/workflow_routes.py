@@ -1,11 +1,24 @@
-from fastapi import APIRouter, HTTPException, status, Body
-from typing import List, Dict, Any
+from fastapi import APIRouter, Depends, HTTPException, status, Body, Query, Request
+from fastapi.responses import StreamingResponse
+from typing import AsyncIterator, List, Dict, Any, Literal, Optional
 from uuid import uuid4
 from datetime import datetime
+import asyncio
+import json
+import tempfile
 
-from ..models.workflow import WorkflowPayload, WorkflowStored, WorkflowNode
-from .. import database
-from ..services import execution_engine
+from ..models.workflow import (
+    WorkflowPayload, WorkflowStored, WorkflowNode, WorkflowRun, WorkflowEstimate, WorkflowSummaryPage,
+    WorkflowPatch, WorkflowRevision,
+)
+from ..services import execution_engine, workflow_compiler, workflow_batch
+from ..services.node_cache import node_result_cache
+from ..services.workflow_runs import workflow_run_manager, RunQueueFullError
+from ..services.workflow_tracing import TraceRecorder
+from ..services.workflow_estimator import estimate_workflow, model_stats_provider
+from ..services.workflow_store import WorkflowStore, get_workflow_store, InvalidCursorError, RevisionConflictError
+from ..services.workflow_versioning import WorkflowPatchError, apply_ops, diff_trees
+from ..config import settings
 
 router = APIRouter(
     prefix="/workflows",
@@ -13,27 +26,43 @@ router = APIRouter(
 )
 
 @router.post("/", response_model=WorkflowStored, status_code=status.HTTP_201_CREATED)
-def save_new_workflow(payload: WorkflowPayload):
+def save_new_workflow(payload: WorkflowPayload, store: WorkflowStore = Depends(get_workflow_store)):
     """Cria e armazena uma nova estrutura de workflow."""
     workflow_id = f"wf-{uuid4()}"
     now = datetime.utcnow().isoformat() + "Z"
     new_workflow = WorkflowStored(
         id=workflow_id,
+        name=payload.name,
         created_at=now,
         workflow_tree=payload.workflow
     )
-    database._workflows[workflow_id] = new_workflow
+    try:
+        workflow_compiler.compile_and_cache(new_workflow)
+    except workflow_compiler.WorkflowCompileError as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+    store.save(new_workflow)
     return new_workflow
 
-@router.get("/", response_model=List[WorkflowStored])
-def list_all_workflows():
-    """Lista todos os workflows salvos."""
-    return list(database._workflows.values())
+@router.get("/", response_model=WorkflowSummaryPage)
+def list_all_workflows(
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = Query(None, description="Valor de `next_cursor` da página anterior."),
+    store: WorkflowStore = Depends(get_workflow_store),
+):
+    """Lista resumos dos workflows salvos, do mais recente para o mais antigo.
+
+    A árvore completa não é incluída; use `GET /workflows/{id}` para obtê-la.
+    """
+    try:
+        items, next_cursor = store.list_summaries(limit=limit, cursor=cursor)
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return WorkflowSummaryPage(items=items, next_cursor=next_cursor)
 
 @router.get("/{workflow_id}", response_model=WorkflowStored)
-def get_single_workflow(workflow_id: str):
+def get_single_workflow(workflow_id: str, store: WorkflowStore = Depends(get_workflow_store)):
     """Recupera um workflow específico pelo seu ID."""
-    workflow = database._workflows.get(workflow_id)
+    workflow = store.get(workflow_id)
     if not workflow:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -41,14 +70,332 @@ def get_single_workflow(workflow_id: str):
         )
     return workflow
 
+def _compiled_plan(workflow: WorkflowStored) -> workflow_compiler.CompiledWorkflow:
+    """Plano compilado do workflow; workflows gravados antes de uma regra nova de validação viram 422."""
+    try:
+        return workflow_compiler.get_compiled_workflow(workflow)
+    except workflow_compiler.WorkflowCompileError as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+
+def _commit_revision(workflow: WorkflowStored, new_tree: List[WorkflowNode], ops: List[Dict[str, Any]], name: Optional[str], store: WorkflowStore) -> WorkflowStored:
+    """Valida a nova árvore e grava uma revisão com o delta `ops` sobre `workflow`."""
+    if not ops and name == workflow.name:
+        return workflow # Nada mudou: não cria revisão vazia
+    updated = WorkflowStored(
+        id=workflow.id,
+        name=name,
+        created_at=workflow.created_at,
+        workflow_tree=new_tree,
+        revision=workflow.revision + 1,
+        updated_at=datetime.utcnow().isoformat() + "Z",
+    )
+    try:
+        # Se a gravação falhar, o plano em cache é descartado no próximo acesso (árvore diferente)
+        workflow_compiler.compile_and_cache(updated)
+        store.commit_revision(updated, ops, base_revision=workflow.revision)
+    except workflow_compiler.WorkflowCompileError as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+    except RevisionConflictError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    return updated
+
+@router.put("/{workflow_id}", response_model=WorkflowStored)
+def replace_workflow(workflow_id: str, payload: WorkflowPayload, store: WorkflowStore = Depends(get_workflow_store)):
+    """Substitui a árvore do workflow; só a diferença em relação à revisão atual é gravada."""
+    workflow = store.get(workflow_id)
+    if not workflow:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Workflow com ID '{workflow_id}' não encontrado."
+        )
+    try:
+        ops = diff_trees(workflow.workflow_tree, payload.workflow)
+    except WorkflowPatchError as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+    name = payload.name if payload.name is not None else workflow.name
+    return _commit_revision(workflow, payload.workflow, ops, name, store)
+
+@router.patch("/{workflow_id}", response_model=WorkflowStored)
+def patch_workflow(workflow_id: str, patch: WorkflowPatch, store: WorkflowStore = Depends(get_workflow_store)):
+    """Aplica operações estruturais (insert/remove/update/move) sobre a revisão `base_revision`.
+
+    Retorna 409 se o workflow já estiver em outra revisão; o cliente deve recarregá-lo.
+    """
+    workflow = store.get(workflow_id)
+    if not workflow:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Workflow com ID '{workflow_id}' não encontrado."
+        )
+    if patch.base_revision != workflow.revision:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Revisão base {patch.base_revision} desatualizada; a revisão atual é {workflow.revision}."
+        )
+    try:
+        new_tree = apply_ops(workflow.workflow_tree, patch.ops)
+    except WorkflowPatchError as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+    return _commit_revision(workflow, new_tree, patch.ops, workflow.name, store)
+
+@router.get("/{workflow_id}/versions", response_model=List[WorkflowRevision])
+def list_workflow_versions(workflow_id: str, store: WorkflowStore = Depends(get_workflow_store)):
+    """Lista as revisões do workflow, da mais recente para a mais antiga."""
+    revisions = store.list_revisions(workflow_id)
+    if not revisions:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Workflow com ID '{workflow_id}' não encontrado."
+        )
+    return revisions
+
+@router.get("/{workflow_id}/versions/{revision}", response_model=WorkflowStored)
+def get_workflow_version(workflow_id: str, revision: int, store: WorkflowStore = Depends(get_workflow_store)):
+    """Reconstrói o workflow (árvore e nome) como estava em uma revisão específica."""
+    workflow = store.get(workflow_id)
+    found = store.get_revision(workflow_id, revision) if workflow else None
+    if found is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Revisão {revision} do workflow '{workflow_id}' não encontrada."
+        )
+    tree, name = found
+    return WorkflowStored(
+        id=workflow.id,
+        name=name,
+        created_at=workflow.created_at,
+        workflow_tree=tree,
+        revision=revision,
+    )
+
+@router.get("/{workflow_id}/estimate", response_model=WorkflowEstimate)
+async def estimate_workflow_cost(
+    workflow_id: str,
+    latency_budget_ms: Optional[float] = Query(None, gt=0, description="Orçamento de latência; preenche `within_budget`."),
+    latency_percentile: Literal[50, 90] = Query(50, description="Percentil de latência por chamada usado no caminho crítico."),
+    store: WorkflowStore = Depends(get_workflow_store),
+):
+    """Estima latência do caminho crítico, chamadas de LLM e custo sem executar o workflow."""
+    workflow = store.get(workflow_id)
+    if not workflow:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Workflow com ID '{workflow_id}' não encontrado."
+        )
+    plan = _compiled_plan(workflow)
+    model_stats = await model_stats_provider.get()
+    return estimate_workflow(plan, model_stats, latency_budget_ms, latency_percentile)
+
 @router.post("/{workflow_id}/execute", response_model=List[Any])
-def execute_existing_workflow(workflow_id: str, initial_data: Dict[str, Any] = Body(...)):
+async def execute_existing_workflow(
+    workflow_id: str,
+    initial_data: Dict[str, Any] = Body(...),
+    max_concurrency: Optional[int] = Query(None, ge=1, description="Chamadas de LLM simultâneas nesta execução."),
+    use_cache: bool = Query(True, description="Reaproveita resultados de nós llmAgent já calculados."),
+    store: WorkflowStore = Depends(get_workflow_store),
+):
     """Executa um workflow salvo, passando dados iniciais."""
-    workflow = database._workflows.get(workflow_id)
+    workflow = store.get(workflow_id)
     if not workflow:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Workflow com ID '{workflow_id}' não encontrado para execução."
         )
-    final_outputs = execution_engine.run_workflow(workflow.workflow_tree, initial_data)
+    plan = _compiled_plan(workflow)
+    final_outputs = await execution_engine.run_compiled_workflow(
+        plan,
+        initial_data,
+        max_concurrency=max_concurrency or settings.WORKFLOW_MAX_CONCURRENCY,
+        cache=node_result_cache if use_cache else None,
+    )
     return final_outputs
+
+
+@router.post("/{workflow_id}/execute/trace", response_model=Dict[str, Any])
+async def execute_workflow_with_trace(
+    workflow_id: str,
+    initial_data: Dict[str, Any] = Body(...),
+    max_concurrency: Optional[int] = Query(None, ge=1, description="Chamadas de LLM simultâneas nesta execução."),
+    use_cache: bool = Query(True, description="Reaproveita resultados de nós llmAgent já calculados."),
+    store: WorkflowStore = Depends(get_workflow_store),
+):
+    """Executa um workflow salvo e retorna o trace por nó no formato `trace_event` do Chrome.
+
+    As saídas finais vêm em `otherData.final_outputs`; o JSON pode ser aberto diretamente
+    em `chrome://tracing` ou no Perfetto.
+    """
+    workflow = store.get(workflow_id)
+    if not workflow:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Workflow com ID '{workflow_id}' não encontrado para execução."
+        )
+    plan = _compiled_plan(workflow)
+    tracer = TraceRecorder()
+    final_outputs = await execution_engine.run_compiled_workflow(
+        plan,
+        initial_data,
+        max_concurrency=max_concurrency or settings.WORKFLOW_MAX_CONCURRENCY,
+        cache=node_result_cache if use_cache else None,
+        tracer=tracer,
+    )
+    return tracer.to_chrome_trace(other_data={"workflow_id": workflow_id, "final_outputs": final_outputs})
+
+
+@router.post("/{workflow_id}/runs", response_model=WorkflowRun, status_code=status.HTTP_202_ACCEPTED)
+async def start_workflow_run(
+    workflow_id: str,
+    initial_data: Dict[str, Any] = Body(...),
+    max_concurrency: Optional[int] = Query(None, ge=1, description="Chamadas de LLM simultâneas nesta execução."),
+    use_cache: bool = Query(True, description="Reaproveita resultados de nós llmAgent já calculados."),
+    trace: bool = Query(False, description="Grava spans por nó, exportados em `GET /runs/{run_id}/trace`."),
+    store: WorkflowStore = Depends(get_workflow_store),
+):
+    """Enfileira a execução de um workflow em segundo plano e retorna o run imediatamente.
+
+    Acompanhe com `GET /runs/{run_id}` e cancele com `DELETE /runs/{run_id}`.
+    """
+    workflow = store.get(workflow_id)
+    if not workflow:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Workflow com ID '{workflow_id}' não encontrado para execução."
+        )
+    plan = _compiled_plan(workflow)
+    try:
+        return workflow_run_manager.submit(
+            workflow_id,
+            plan,
+            initial_data,
+            trace=trace,
+            max_concurrency=max_concurrency or settings.WORKFLOW_MAX_CONCURRENCY,
+            cache=node_result_cache if use_cache else None,
+        )
+    except RunQueueFullError as e:
+        raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=str(e))
+
+
+def _format_sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+async def _read_stream_input(request: Request) -> Dict[str, Any]:
+    """Lê os dados iniciais do corpo JSON (POST) ou do parâmetro `initial_data` (GET)."""
+    try:
+        if request.method == "POST":
+            body = await request.body()
+            initial_data = json.loads(body) if body else {}
+        else:
+            raw = request.query_params.get("initial_data")
+            initial_data = json.loads(raw) if raw else {}
+    except json.JSONDecodeError as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=f"Dados iniciais inválidos: {e}")
+    if not isinstance(initial_data, dict):
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="Os dados iniciais devem ser um objeto JSON.")
+    return initial_data
+
+
+@router.api_route("/{workflow_id}/execute/stream", methods=["GET", "POST"])
+async def stream_workflow_execution(
+    workflow_id: str,
+    request: Request,
+    max_concurrency: Optional[int] = Query(None, ge=1, description="Chamadas de LLM simultâneas nesta execução."),
+    use_cache: bool = Query(True, description="Reaproveita resultados de nós llmAgent já calculados."),
+    store: WorkflowStore = Depends(get_workflow_store),
+):
+    """Executa um workflow salvo emitindo eventos SSE à medida que cada nó inicia e termina.
+
+    Se o cliente desconectar, a execução em andamento é cancelada.
+    """
+    workflow = store.get(workflow_id)
+    if not workflow:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Workflow com ID '{workflow_id}' não encontrado para execução."
+        )
+    initial_data = await _read_stream_input(request)
+    plan = _compiled_plan(workflow)
+
+    async def event_stream() -> AsyncIterator[str]:
+        events: asyncio.Queue = asyncio.Queue()
+        run = asyncio.create_task(execution_engine.run_compiled_workflow(
+            plan,
+            initial_data,
+            max_concurrency=max_concurrency or settings.WORKFLOW_MAX_CONCURRENCY,
+            on_event=events.put_nowait,
+            cache=node_result_cache if use_cache else None,
+        ))
+        run.add_done_callback(lambda _: events.put_nowait(None))
+        try:
+            yield _format_sse("workflow_start", {"workflow_id": workflow_id, "node_count": len(plan)})
+            while (event := await events.get()) is not None:
+                yield _format_sse(event.pop("event"), event)
+            if run.cancelled():
+                yield _format_sse("workflow_error", {"workflow_id": workflow_id, "error": "Execução cancelada."})
+            elif run.exception() is not None:
+                yield _format_sse("workflow_error", {"workflow_id": workflow_id, "error": str(run.exception())})
+            else:
+                yield _format_sse("workflow_end", {"workflow_id": workflow_id, "final_outputs": run.result()})
+        finally:
+            # Cliente desconectou (ou o gerador foi fechado): interrompe a execução
+            if not run.done():
+                run.cancel()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.post("/{workflow_id}/batch")
+async def execute_workflow_batch(
+    workflow_id: str,
+    request: Request,
+    concurrency: Optional[int] = Query(None, ge=1, le=256, description="Registros executados simultaneamente."),
+    max_concurrency: Optional[int] = Query(None, ge=1, description="Chamadas de LLM simultâneas por registro."),
+    use_cache: bool = Query(True, description="Reaproveita resultados de nós llmAgent já calculados."),
+    store: WorkflowStore = Depends(get_workflow_store),
+):
+    """Executa um workflow salvo para cada registro de um corpo NDJSON.
+
+    O corpo (ex.: `curl --data-binary @registros.ndjson`) traz um objeto JSON de dados
+    iniciais por linha. A resposta é NDJSON com uma linha por registro, na ordem em que
+    terminam: `{"index", "status": "ok", "final_outputs"}` ou `{"index", "status": "error", "error"}`.
+    """
+    workflow = store.get(workflow_id)
+    if not workflow:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Workflow com ID '{workflow_id}' não encontrado para execução."
+        )
+    plan = _compiled_plan(workflow)
+
+    # O corpo é recebido por completo antes de responder: ler a requisição enquanto a
+    # resposta é transmitida não é suportado por todos os servidores ASGI. Lotes grandes
+    # vão para disco em vez de ficarem na memória; escrita e leitura do spool rodam no
+    # executor para não bloquear o event loop.
+    loop = asyncio.get_running_loop()
+    records = tempfile.SpooledTemporaryFile(max_size=settings.WORKFLOW_BATCH_SPOOL_MEMORY_BYTES, mode="w+b")
+    try:
+        async for chunk in request.stream():
+            await loop.run_in_executor(None, records.write, chunk)
+        await loop.run_in_executor(None, records.seek, 0)
+    except BaseException:
+        records.close()
+        raise
+
+    async def result_stream() -> AsyncIterator[str]:
+        try:
+            async for result in workflow_batch.run_batch(
+                plan,
+                workflow_batch.read_lines(records),
+                concurrency=concurrency or settings.WORKFLOW_BATCH_CONCURRENCY,
+                max_concurrency=max_concurrency or settings.WORKFLOW_MAX_CONCURRENCY,
+                cache=node_result_cache if use_cache else None,
+            ):
+                yield json.dumps(result, default=str) + "\n"
+        finally:
+            records.close()
+
+    return StreamingResponse(result_stream(), media_type="application/x-ndjson")
@@ -46,3 +46,14 @@ class ChatSessionResponse(ChatSessionBase):
 
 class ChatSessionDetailResponse(ChatSessionResponse):
     messages: List[ChatMessageResponse] = []
+
+class ChatCostPreview(BaseModel):
+    model: str
+    prompt_chars: int
+    estimated_input_tokens: int
+    history_tokens: int # History counted after the agent's context window budget
+    max_output_tokens: int
+    context_limit: int
+    fits_context: bool
+    estimated_min_cost: float
+    estimated_max_cost: float
@@ -0,0 +1,177 @@
+"""Cache incremental, por sessão, do histórico de chat já formatado para o LLM.
+
+Sem o cache, cada turno relê todo o `chat_messages` da sessão, cria um
+`ChatMessageResponse` por mensagem e reconstrói todos os `Content`/`Part`. Aqui cada
+sessão guarda as mensagens já formatadas e um cursor (`created_at` da última mensagem);
+o turno seguinte busca só o que veio depois do cursor e formata apenas essas mensagens.
+
+`created_at` é o início da transação que inseriu a mensagem, não o commit: uma transação
+mais antiga pode ficar visível depois de outra mais nova. Por isso a busca recomeça
+`CHAT_HISTORY_REREAD_SECONDS` antes do cursor (`fetch_after`) e as mensagens já vistas
+nessa janela são ignoradas pelo id. Uma mensagem que chega atrasada é acrescentada ao
+fim do histórico em cache, em vez de ser perdida.
+
+As entradas são descartadas por LRU quando o total estimado em bytes passa de
+`max_bytes`, e invalidadas quando a sessão é editada ou removida. Cada sessão pode ter um
+dono (usuário e agente), para que o turno encontre o cursor antes de saber qual sessão o
+banco vai escolher (ver `latest_for`).
+"""
+import threading
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Hashable, List, Optional, Sequence, Tuple
+
+from ..config import settings
+from ..schemas.chat_schemas import ChatMessageResponse
+from .context_window import estimate_text_tokens
+
+# Custo fixo estimado de cada mensagem formatada (objetos Content/Part, ids), além do texto
+MESSAGE_OVERHEAD_BYTES = 256
+
+
+def _message_size(message: ChatMessageResponse) -> int:
+    # O texto fica guardado duas vezes: no conteúdo formatado e em `texts` (para resumos)
+    return 2 * len((message.content or "").encode("utf-8")) + MESSAGE_OVERHEAD_BYTES
+
+
+class SessionHistory:
+    """Mensagens formatadas de uma sessão, em ordem de `created_at` (atrasadas vão para o fim)."""
+
+    __slots__ = (
+        'contents', 'message_ids', 'senders', 'texts', 'token_counts',
+        'last_created_at', 'reread_window', '_recent_ids', 'size_bytes', 'summary', 'owner',
+    )
+
+    def __init__(self, reread_seconds: float = settings.CHAT_HISTORY_REREAD_SECONDS):
+        self.contents: List[Any] = []
+        self.message_ids: List[uuid.UUID] = []
+        self.senders: List[str] = []
+        self.texts: List[str] = []
+        self.token_counts: List[int] = []
+        self.last_created_at: Optional[datetime] = None
+        self.reread_window = timedelta(seconds=reread_seconds)
+        # Mensagens já vistas dentro da janela relida a cada busca (id -> created_at)
+        self._recent_ids: Dict[uuid.UUID, datetime] = {}
+        self.size_bytes = 0
+        self.summary: Any = None # RollingSummary mantido por context_window
+        self.owner: Optional[Hashable] = None
+
+    def fetch_after(self) -> Optional[datetime]:
+        """Cursor para a próxima busca incremental (`created_at >=`), recuado pela janela de releitura."""
+        if self.last_created_at is None:
+            return None
+        return self.last_created_at - self.reread_window
+
+    def extend(self, messages: Sequence[ChatMessageResponse], format_message: Callable[[ChatMessageResponse], Any]) -> int:
+        """Acrescenta as mensagens ainda não vistas e retorna quantos bytes foram adicionados."""
+        added = 0
+        for message in messages:
+            if message.id in self._recent_ids:
+                continue
+            if self.last_created_at is not None and message.created_at < self.last_created_at - self.reread_window:
+                continue # Fora da janela: já foi vista e esquecida (busca concorrente com cursor antigo)
+            if self.last_created_at is None or message.created_at > self.last_created_at:
+                self.last_created_at = message.created_at
+            self._recent_ids[message.id] = message.created_at
+            self.contents.append(format_message(message))
+            self.message_ids.append(message.id)
+            self.senders.append(message.sender_type)
+            self.texts.append(message.content or "")
+            self.token_counts.append(estimate_text_tokens(message.content))
+            added += _message_size(message)
+        if added:
+            oldest = self.last_created_at - self.reread_window
+            self._recent_ids = {id_: created_at for id_, created_at in self._recent_ids.items() if created_at >= oldest}
+        self.size_bytes += added
+        return added
+
+    def index_of(self, message_id: uuid.UUID) -> int:
+        """Posição de `message_id` no histórico (o tamanho do histórico, se ele não estiver lá)."""
+        # A mensagem procurada costuma ser a última; a busca começa pelo fim
+        for index in range(len(self.message_ids) - 1, -1, -1):
+            if self.message_ids[index] == message_id:
+                return index
+        return len(self.message_ids)
+
+
+class ChatHistoryCache:
+    """Históricos por sessão, limitados a `max_bytes` no total (LRU)."""
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._sessions: "OrderedDict[uuid.UUID, SessionHistory]" = OrderedDict()
+        self._by_owner: Dict[Hashable, uuid.UUID] = {} # Sessão usada por último por cada dono
+        self._lock = threading.Lock()
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def get(self, session_id: uuid.UUID) -> Optional[SessionHistory]:
+        with self._lock:
+            history = self._sessions.get(session_id)
+            if history is None:
+                self.misses += 1
+                return None
+            self._sessions.move_to_end(session_id)
+            self.hits += 1
+            return history
+
+    def latest_for(self, owner: Hashable) -> Optional[Tuple[uuid.UUID, SessionHistory]]:
+        """Sessão em cache usada por último por `owner`, sem contar como acerto."""
+        with self._lock:
+            session_id = self._by_owner.get(owner)
+            history = self._sessions.get(session_id) if session_id is not None else None
+            return (session_id, history) if history is not None else None
+
+    def _forget(self, session_id: uuid.UUID, history: SessionHistory) -> None:
+        self.size_bytes -= history.size_bytes
+        if history.owner is not None and self._by_owner.get(history.owner) == session_id:
+            del self._by_owner[history.owner]
+
+    def extend(
+        self,
+        session_id: uuid.UUID,
+        messages: Sequence[ChatMessageResponse],
+        format_message: Callable[[ChatMessageResponse], Any],
+        owner: Optional[Hashable] = None,
+    ) -> SessionHistory:
+        """Acrescenta mensagens ao histórico da sessão, criando-o se necessário.
+
+        `messages` deve conter tudo o que veio depois de `fetch_after()` (ou o histórico
+        completo, se a sessão não estava em cache). Uma sessão maior que `max_bytes` é
+        devolvida normalmente, mas não fica em cache.
+        """
+        with self._lock:
+            history = self._sessions.get(session_id)
+            if history is None:
+                history = SessionHistory()
+                self._sessions[session_id] = history
+            self._sessions.move_to_end(session_id)
+            if owner is not None:
+                history.owner = owner
+                self._by_owner[owner] = session_id
+            self.size_bytes += history.extend(messages, format_message)
+            while self.size_bytes > self.max_bytes and self._sessions:
+                evicted_id, evicted = self._sessions.popitem(last=False)
+                self._forget(evicted_id, evicted)
+            return history
+
+    def invalidate(self, session_id: uuid.UUID) -> None:
+        with self._lock:
+            history = self._sessions.pop(session_id, None)
+            if history is not None:
+                self._forget(session_id, history)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._sessions.clear()
+            self._by_owner.clear()
+            self.size_bytes = 0
+
+
+# Instância compartilhada pelas rotas de chat
+chat_history_cache = ChatHistoryCache(max_bytes=settings.CHAT_HISTORY_CACHE_MAX_BYTES)
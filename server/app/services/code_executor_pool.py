@@ -0,0 +1,289 @@
+"""Pool de processos pré-aquecidos para os nós codeExecutor.
+
+Iniciar um interpretador por execução custaria centenas de milissegundos; aqui cada pool
+mantém `size` workers prontos (ver `code_executor_worker`) que recebem snippets por pipes.
+O recurso executa código enviado pelo usuário e fica desligado até `CODE_EXECUTOR_ENABLED`
+ser habilitado: com ele desligado o compilador rejeita nós codeExecutor.
+
+Os limites vêm de `code_executor_config` no `data` do nó. A coluna de mesmo nome em
+`agents` não é lida: nós de workflow não referenciam um agente, então o nó carrega a
+configuração no mesmo formato. Valores pedidos são limitados pelos máximos de settings:
+- `memory_limit_mb`: RLIMIT_AS do worker, arredondado para cima até uma das faixas de
+  `CODE_EXECUTOR_MEMORY_TIERS_MB` (no máximo a maior); há um pool por faixa;
+- `cpu_time_seconds`: RLIMIT_CPU por snippet, até `CODE_EXECUTOR_MAX_CPU_TIME_SECONDS`;
+- `timeout_seconds`: tempo de parede, até `CODE_EXECUTOR_MAX_TIMEOUT_SECONDS`; ao estourar,
+  o worker é morto e substituído.
+
+Um worker é reciclado após `CODE_EXECUTOR_MAX_SNIPPETS_PER_WORKER` snippets, ou quando
+morre, estoura o tempo ou é cancelado. Criar e encerrar processos roda em threads e o
+substituto sobe em segundo plano; a espera pela resposta usa `loop.add_reader` e a resposta
+tem tamanho limitado, então nada disso bloqueia o event loop. Os limites protegem
+recursos; isto não é um sandbox de segurança. `shutdown_code_executor_pools` roda no
+shutdown da app.
+"""
+import asyncio
+import multiprocessing
+import threading
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from ..config import settings
+from .code_executor_worker import worker_main
+
+# Tempo máximo para um worker recém-criado ficar pronto
+WORKER_STARTUP_TIMEOUT_SECONDS = 30
+
+# `spawn` evita herdar threads e o event loop do processo da API
+_mp_context = multiprocessing.get_context("spawn")
+
+
+class CodeExecutionError(RuntimeError):
+    """O snippet falhou, estourou um limite ou o worker morreu."""
+
+
+class CodeExecutionTimeout(CodeExecutionError):
+    """O snippet excedeu `timeout_seconds`."""
+
+
+class CodeExecutorLimits:
+    __slots__ = ('cpu_time_seconds', 'memory_limit_mb', 'timeout_seconds')
+
+    def __init__(self, cpu_time_seconds: float, memory_limit_mb: int, timeout_seconds: float):
+        self.cpu_time_seconds = cpu_time_seconds
+        self.memory_limit_mb = memory_limit_mb
+        self.timeout_seconds = timeout_seconds
+
+
+def _memory_tier(memory_limit_mb: int) -> int:
+    tiers = sorted(settings.CODE_EXECUTOR_MEMORY_TIERS_MB)
+    return next((tier for tier in tiers if tier >= memory_limit_mb), tiers[-1])
+
+
+def parse_code_executor_config(config: Optional[Dict[str, Any]]) -> CodeExecutorLimits:
+    """Lê os limites de `code_executor_config`, usando os padrões de settings para o que faltar.
+
+    Os valores são limitados aos máximos de settings e a memória vira uma das faixas.
+    """
+    config = config or {}
+    if not isinstance(config, dict):
+        raise ValueError("'code_executor_config' deve ser um objeto.")
+    try:
+        cpu_time_seconds = float(config.get('cpu_time_seconds', settings.CODE_EXECUTOR_CPU_TIME_SECONDS))
+        memory_limit_mb = int(config.get('memory_limit_mb', settings.CODE_EXECUTOR_MEMORY_LIMIT_MB))
+        timeout_seconds = float(config.get('timeout_seconds', settings.CODE_EXECUTOR_TIMEOUT_SECONDS))
+    except (TypeError, ValueError):
+        raise ValueError("'code_executor_config' contém limites inválidos.")
+    if cpu_time_seconds <= 0 or memory_limit_mb <= 0 or timeout_seconds <= 0:
+        raise ValueError("Os limites de 'code_executor_config' devem ser positivos.")
+    return CodeExecutorLimits(
+        cpu_time_seconds=min(cpu_time_seconds, settings.CODE_EXECUTOR_MAX_CPU_TIME_SECONDS),
+        memory_limit_mb=_memory_tier(memory_limit_mb),
+        timeout_seconds=min(timeout_seconds, settings.CODE_EXECUTOR_MAX_TIMEOUT_SECONDS),
+    )
+
+
+class _Worker:
+    __slots__ = ('process', 'conn', 'ready', 'snippets')
+
+    def __init__(self, process: Any, conn: Any):
+        self.process = process
+        self.conn = conn
+        self.ready = False # Só recebe snippets depois do handshake "ready"
+        self.snippets = 0
+
+
+async def _recv(conn: Any, timeout: float) -> Any:
+    """Aguarda uma mensagem do worker sem bloquear o event loop.
+
+    Só a espera é assíncrona; a leitura em si é curta porque o worker limita o tamanho
+    da resposta (ver `code_executor_worker`).
+    """
+    loop = asyncio.get_running_loop()
+    readable = loop.create_future()
+    fd = conn.fileno()
+    loop.add_reader(fd, lambda: readable.done() or readable.set_result(None))
+    try:
+        await asyncio.wait_for(readable, timeout)
+    finally:
+        loop.remove_reader(fd)
+    return conn.recv()
+
+
+def _join(workers: List[_Worker]) -> None:
+    for worker in workers:
+        worker.process.join(1)
+        if worker.process.is_alive():
+            worker.process.kill()
+            worker.process.join(1)
+
+
+class CodeExecutorPool:
+    """Workers pré-aquecidos que compartilham o mesmo limite de memória."""
+
+    def __init__(
+        self,
+        size: int = 2,
+        memory_limit_mb: Optional[int] = None,
+        max_output_chars: int = 65536,
+        max_result_bytes: int = 1024 * 1024,
+        max_snippets_per_worker: int = 1,
+    ):
+        if size < 1:
+            raise ValueError("size deve ser maior ou igual a 1.")
+        if max_snippets_per_worker < 1:
+            raise ValueError("max_snippets_per_worker deve ser maior ou igual a 1.")
+        self.size = size
+        self.memory_limit_mb = memory_limit_mb
+        self.max_output_chars = max_output_chars
+        self.max_result_bytes = max_result_bytes
+        self.max_snippets_per_worker = max_snippets_per_worker
+        # Workers prontos para uso; `None` marca um worker que não pôde ser criado
+        self._idle: "asyncio.Queue[Optional[_Worker]]" = asyncio.Queue()
+        self._busy: List[_Worker] = []
+        self._workers: Set[_Worker] = set() # Todos os processos vivos, para o `close`
+        self._workers_lock = threading.Lock()
+        self._started = False
+        self.closed = False
+
+    def _spawn(self) -> Optional[_Worker]:
+        """Cria um processo worker; roda em uma thread porque `Process.start` bloqueia."""
+        parent_conn, child_conn = _mp_context.Pipe()
+        memory_bytes = self.memory_limit_mb * 1024 * 1024 if self.memory_limit_mb else None
+        process = _mp_context.Process(
+            target=worker_main,
+            args=(child_conn, memory_bytes, self.max_output_chars, self.max_result_bytes),
+            daemon=True,
+        )
+        process.start()
+        child_conn.close()
+        worker = _Worker(process, parent_conn)
+        with self._workers_lock:
+            if not self.closed:
+                self._workers.add(worker)
+                return worker
+        # `close` rodou enquanto o processo subia
+        process.kill()
+        parent_conn.close()
+        process.join(1)
+        return None
+
+    def _replenish(self) -> None:
+        """Sobe um worker novo em segundo plano; ele entra na fila quando o processo existir."""
+        future = asyncio.get_running_loop().run_in_executor(None, self._spawn)
+
+        def enqueue(spawned: "asyncio.Future[Optional[_Worker]]") -> None:
+            if spawned.cancelled():
+                return
+            if spawned.exception() is not None:
+                print(f"[CodeExecutor] WARN: Falha ao iniciar worker: {spawned.exception()}")
+            if not self.closed:
+                self._idle.put_nowait(spawned.result() if spawned.exception() is None else None)
+
+        future.add_done_callback(enqueue)
+
+    def _discard(self, worker: _Worker) -> None:
+        """Mata o worker; o `join` roda em uma thread, sem esperar por ele."""
+        with self._workers_lock:
+            self._workers.discard(worker)
+        worker.process.kill()
+        worker.conn.close()
+        asyncio.get_running_loop().run_in_executor(None, worker.process.join, 1)
+
+    async def run(
+        self, code: str, input_data: Any, cpu_time_seconds: Optional[float] = None, timeout_seconds: float = 10
+    ) -> Tuple[str, Any]:
+        """Executa o snippet em um worker livre e retorna `(stdout, result)`."""
+        if self.closed:
+            raise CodeExecutionError("O pool de execução de código foi encerrado.")
+        if not self._started:
+            self._started = True
+            for _ in range(self.size):
+                self._replenish()
+
+        worker = await self._idle.get()
+        if worker is None:
+            self._replenish()
+            raise CodeExecutionError("Não foi possível iniciar um worker de execução de código.")
+        if self.closed:
+            self._discard(worker)
+            raise CodeExecutionError("O pool de execução de código foi encerrado.")
+        self._busy.append(worker)
+        healthy = False
+        try:
+            if not worker.ready:
+                await _recv(worker.conn, WORKER_STARTUP_TIMEOUT_SECONDS)
+                worker.ready = True
+            worker.conn.send((code, input_data, cpu_time_seconds))
+            worker.snippets += 1
+            status, stdout, payload = await _recv(worker.conn, timeout_seconds)
+            healthy = True
+        except asyncio.TimeoutError:
+            raise CodeExecutionTimeout(f"Execução de código excedeu {timeout_seconds}s.")
+        except (EOFError, OSError):
+            # O kernel encerra o worker ao estourar RLIMIT_CPU
+            raise CodeExecutionError("O worker de execução de código foi encerrado (limite de CPU ou memória).")
+        finally:
+            self._busy.remove(worker)
+            if self.closed:
+                # `close` rodou durante a execução: o worker não volta para o pool
+                self._discard(worker)
+            elif healthy and worker.snippets < self.max_snippets_per_worker:
+                self._idle.put_nowait(worker)
+            else:
+                # Reciclagem ou estado desconhecido (timeout, morte ou cancelamento): troca por um worker novo
+                self._discard(worker)
+                self._replenish()
+
+        if status != "ok":
+            raise CodeExecutionError(f"Erro no código executado:\n{payload}")
+        return stdout, payload
+
+    async def close(self) -> None:
+        """Encerra os workers ociosos e mata os que estão executando um snippet."""
+        with self._workers_lock:
+            self.closed = True
+            workers = list(self._workers)
+            self._workers.clear()
+        while not self._idle.empty():
+            self._idle.get_nowait()
+        for worker in workers:
+            if worker in self._busy:
+                worker.process.kill()
+                continue
+            try:
+                worker.conn.send(None)
+            except OSError:
+                pass
+            worker.conn.close()
+        await asyncio.get_running_loop().run_in_executor(None, _join, workers)
+
+
+# Um pool por faixa de memória (ver `CODE_EXECUTOR_MEMORY_TIERS_MB`), criado no primeiro uso
+_pools: Dict[int, CodeExecutorPool] = {}
+
+
+def get_code_executor_pool(memory_limit_mb: int) -> CodeExecutorPool:
+    memory_limit_mb = _memory_tier(memory_limit_mb)
+    pool = _pools.get(memory_limit_mb)
+    if pool is None:
+        pool = CodeExecutorPool(
+            size=settings.CODE_EXECUTOR_POOL_SIZE,
+            memory_limit_mb=memory_limit_mb,
+            max_output_chars=settings.CODE_EXECUTOR_MAX_OUTPUT_CHARS,
+            max_result_bytes=settings.CODE_EXECUTOR_MAX_RESULT_BYTES,
+            max_snippets_per_worker=settings.CODE_EXECUTOR_MAX_SNIPPETS_PER_WORKER,
+        )
+        _pools[memory_limit_mb] = pool
+    return pool
+
+
+async def execute_code(code: str, input_data: Any, limits: CodeExecutorLimits) -> Dict[str, Any]:
+    """Executa o snippet no pool correspondente a `limits` e devolve `{"result", "stdout"}`."""
+    pool = get_code_executor_pool(limits.memory_limit_mb)
+    stdout, result = await pool.run(code, input_data, limits.cpu_time_seconds, limits.timeout_seconds)
+    return {"result": result, "stdout": stdout}
+
+
+async def shutdown_code_executor_pools() -> None:
+    pools = list(_pools.values())
+    _pools.clear()
+    await asyncio.gather(*(pool.close() for pool in pools))
@@ -0,0 +1,77 @@
+"""Processo worker do pool de execução de código (ver `code_executor_pool`).
+
+Fica em um módulo separado e sem dependências da aplicação para que os processos
+iniciados com `spawn` subam rápido: o filho não importa o restante de `app`.
+
+Cada snippet recebe um namespace novo, mas módulos importados, alterações em
+`sys`/builtins, threads e arquivos abertos valem para o processo inteiro. Por isso o pool
+recicla o worker após `CODE_EXECUTOR_MAX_SNIPPETS_PER_WORKER` snippets (padrão 1: nenhum
+estado passa de uma execução para outra). O limite de memória vale para o processo
+inteiro e o de CPU é acumulado (ver `_limit_cpu`).
+
+O resultado volta pelo pipe em pickle e é limitado a `max_result_bytes`; acima disso
+(ou se não for serializável) volta o `repr` truncado, para que o pool nunca leia uma
+mensagem grande de forma bloqueante.
+"""
+import contextlib
+import io
+import resource
+import traceback
+from multiprocessing.connection import Connection
+from typing import Any, Optional
+
+
+def _cpu_seconds_used() -> float:
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _limit_cpu(cpu_seconds: Optional[float]) -> None:
+    # RLIMIT_CPU conta o tempo acumulado do processo; como o worker é reaproveitado,
+    # o limite de cada snippet é relativo ao que já foi consumido.
+    if cpu_seconds:
+        soft = int(_cpu_seconds_used() + cpu_seconds) + 1
+        resource.setrlimit(resource.RLIMIT_CPU, (soft, resource.RLIM_INFINITY))
+
+
+def _bounded_result(value: Any, max_result_bytes: int, max_output_chars: int) -> Any:
+    import pickle
+
+    try:
+        if len(pickle.dumps(value)) <= max_result_bytes:
+            return value
+    except Exception:
+        pass
+    return repr(value)[:max_output_chars]
+
+
+def worker_main(conn: Connection, memory_bytes: Optional[int], max_output_chars: int, max_result_bytes: int) -> None:
+    """Recebe `(código, entrada, limite de CPU)` pelo pipe e devolve `(status, stdout, resultado)`.
+
+    O snippet recebe a entrada em `input_data` e pode definir `result`; o que for
+    impresso é capturado como stdout. Falhas voltam como `("error", stdout, traceback)`.
+    """
+    if memory_bytes:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_bytes, memory_bytes))
+    conn.send(("ready", "", None))
+
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            return
+        if message is None:
+            return
+        code, input_data, cpu_seconds = message
+        _limit_cpu(cpu_seconds)
+        stdout = io.StringIO()
+        namespace = {"__name__": "__snippet__", "input_data": input_data, "result": None}
+        try:
+            with contextlib.redirect_stdout(stdout):
+                exec(compile(code, "<snippet>", "exec"), namespace)
+            reply = ("ok", stdout.getvalue()[:max_output_chars], _bounded_result(namespace.get("result"), max_result_bytes, max_output_chars))
+        except MemoryError:
+            reply = ("error", stdout.getvalue()[:max_output_chars], "MemoryError: limite de memória excedido")
+        except BaseException:
+            reply = ("error", stdout.getvalue()[:max_output_chars], traceback.format_exc(limit=5)[-max_output_chars:])
+        conn.send(reply)
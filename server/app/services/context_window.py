@@ -0,0 +1,171 @@
+"""Janela de contexto com orçamento de tokens e resumos incrementais.
+
+Sem limite, cada turno envia o histórico inteiro e os tokens de entrada (e o custo)
+crescem linearmente com a sessão até estourar o contexto do modelo. Aqui o histórico
+enviado fica limitado a `max_history_tokens`:
+- as mensagens mais recentes vão literalmente (pelo menos `min_recent_messages`);
+- as anteriores são substituídas por um resumo acumulado (`RollingSummary`), guardado
+  junto do histórico em cache da sessão.
+
+O resumo só é refeito quando a janela anda. Ao andar, ela recua até deixar as mensagens
+literais em `RETAIN_FRACTION` do espaço disponível, para que os turnos seguintes caibam sem
+novo resumo; e o resumo novo parte do anterior mais as mensagens que saíram da janela.
+Se gerar o resumo falhar, a janela não anda: vai o resumo anterior mais todas as mensagens
+literais seguintes (acima do orçamento, mas sem perder contexto) e `summary_failed` fica
+registrado nos detalhes.
+
+O limite é opcional: vale só para agentes com `runtime_config["context_window"]["enabled"]`
+verdadeiro, com os padrões de settings para o que faltar.
+"""
+import math
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from ..config import settings
+
+if TYPE_CHECKING:
+    from .chat_history_cache import SessionHistory
+
+# Fração do espaço literal ocupada logo após a janela andar
+RETAIN_FRACTION = 0.5
+
+# Aproximação de caracteres por token usada enquanto não há contagem do provedor
+CHARS_PER_TOKEN = 4
+
+SUMMARY_INSTRUCTION = (
+    "You maintain a running summary of a conversation between a user and an AI agent. "
+    "Merge the previous summary with the new messages into a single concise summary. "
+    "Keep facts, decisions, names, numbers and open questions; drop greetings and filler. "
+    "Write in the same language as the conversation."
+)
+
+# (resumo anterior, transcrição das mensagens novas, config) -> (resumo, token_usage) ou None em caso de falha
+Summarizer = Callable[[Optional[str], str, "ContextWindowConfig"], Awaitable[Optional[Tuple[str, Dict[str, int]]]]]
+
+
+def estimate_text_tokens(text: Optional[str]) -> int:
+    return math.ceil(len(text or "") / CHARS_PER_TOKEN)
+
+
+class ContextWindowConfig:
+    __slots__ = ('max_history_tokens', 'min_recent_messages', 'summary_model', 'summary_max_tokens')
+
+    def __init__(self, max_history_tokens: int, min_recent_messages: int, summary_model: str, summary_max_tokens: int):
+        self.max_history_tokens = max_history_tokens
+        self.min_recent_messages = min_recent_messages
+        self.summary_model = summary_model
+        self.summary_max_tokens = summary_max_tokens
+
+
+def parse_context_window_config(runtime_config: Optional[Dict[str, Any]]) -> Optional[ContextWindowConfig]:
+    """Lê `runtime_config["context_window"]`; sem `{"enabled": true}` não há limite (retorna None)."""
+    config = (runtime_config or {}).get("context_window") or {}
+    if not isinstance(config, dict):
+        raise ValueError("'runtime_config.context_window' deve ser um objeto.")
+    if config.get("enabled") is not True:
+        return None
+    try:
+        parsed = ContextWindowConfig(
+            max_history_tokens=int(config.get("max_history_tokens", settings.CONTEXT_WINDOW_MAX_HISTORY_TOKENS)),
+            min_recent_messages=int(config.get("min_recent_messages", settings.CONTEXT_WINDOW_MIN_RECENT_MESSAGES)),
+            summary_model=str(config.get("summary_model", settings.CONTEXT_SUMMARY_MODEL)),
+            summary_max_tokens=int(config.get("summary_max_tokens", settings.CONTEXT_SUMMARY_MAX_TOKENS)),
+        )
+    except (TypeError, ValueError):
+        raise ValueError("'runtime_config.context_window' contém valores inválidos.")
+    if parsed.max_history_tokens <= parsed.summary_max_tokens or parsed.summary_max_tokens <= 0 or parsed.min_recent_messages < 0:
+        raise ValueError("'max_history_tokens' deve ser maior que 'summary_max_tokens' (e ambos positivos).")
+    return parsed
+
+
+class RollingSummary:
+    """Resumo das `covered` primeiras mensagens do histórico da sessão."""
+
+    __slots__ = ('covered', 'last_message_id', 'text', 'tokens')
+
+    def __init__(self, covered: int, last_message_id: Any, text: str):
+        self.covered = covered
+        self.last_message_id = last_message_id # Confere que o histórico não mudou por baixo do resumo
+        self.text = text
+        self.tokens = estimate_text_tokens(text)
+
+
+class ContextWindow:
+    """Resultado de `build_context_window`: o que enviar ao modelo e as métricas do turno."""
+
+    __slots__ = ('summary', 'recent', 'details', 'summary_usage')
+
+    def __init__(self, summary: Optional[str], recent: List[Any], details: Dict[str, Any], summary_usage: Optional[Dict[str, int]]):
+        self.summary = summary
+        self.recent = recent
+        self.details = details
+        self.summary_usage = summary_usage # Tokens gastos para gerar o resumo neste turno, se houve
+
+
+def _transcript(history: "SessionHistory", start: int, end: int) -> str:
+    lines = []
+    for index in range(start, end):
+        speaker = "User" if history.senders[index] == "USER" else "Agent"
+        lines.append(f"{speaker}: {history.texts[index]}")
+    return "\n".join(lines)
+
+
+def _valid_summary(history: "SessionHistory", upto: int) -> Optional[RollingSummary]:
+    summary = history.summary
+    if summary is None or summary.covered > upto or summary.covered == 0:
+        return None
+    if history.message_ids[summary.covered - 1] != summary.last_message_id:
+        return None
+    return summary
+
+
+async def build_context_window(
+    history: "SessionHistory",
+    upto: int,
+    config: ContextWindowConfig,
+    summarize: Summarizer,
+) -> ContextWindow:
+    """Monta o contexto das mensagens `[0, upto)` do histórico dentro do orçamento."""
+    counts = history.token_counts
+    history_tokens = sum(counts[:upto])
+    summary = _valid_summary(history, upto)
+    start = summary.covered if summary else 0
+    summary_tokens = summary.tokens if summary else 0
+    recent_tokens = sum(counts[start:upto])
+    summary_usage = None
+    regenerated = False
+    failed = False
+
+    if summary_tokens + recent_tokens > config.max_history_tokens:
+        # A janela anda: mantém literal só o que cabe em RETAIN_FRACTION do espaço disponível
+        target = (config.max_history_tokens - config.summary_max_tokens) * RETAIN_FRACTION
+        cut = upto
+        kept_tokens = 0
+        while cut > start and (
+            upto - cut < config.min_recent_messages or kept_tokens + counts[cut - 1] <= target
+        ):
+            cut -= 1
+            kept_tokens += counts[cut]
+        if cut > start:
+            result = await summarize(summary.text if summary else None, _transcript(history, start, cut), config)
+            if result is not None:
+                text, summary_usage = result
+                summary = RollingSummary(cut, history.message_ids[cut - 1], text)
+                history.summary = summary
+                regenerated = True
+                start, recent_tokens = cut, kept_tokens
+                summary_tokens = summary.tokens
+            else:
+                # Sem resumo novo a janela não anda: nenhuma mensagem é omitida
+                failed = True
+
+    sent_tokens = summary_tokens + recent_tokens
+    details = {
+        'history_tokens': history_tokens,
+        'sent_tokens': sent_tokens,
+        'tokens_saved': history_tokens - sent_tokens,
+        'summarized_messages': start,
+        'summary_regenerated': regenerated,
+    }
+    if failed:
+        details['summary_failed'] = True
+    return ContextWindow(summary.text if summary else None, history.contents[start:upto], details, summary_usage)
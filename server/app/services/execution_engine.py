@@ -1,73 +1,335 @@
+import asyncio
 import time
-from typing import Any, Dict, List
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
 
 from ..models.workflow import WorkflowNode
+from .code_executor_pool import execute_code
+from .llm_executors import LLMExecutor, get_workflow_llm_executor
+from .node_cache import NodeResultCache, fingerprint, make_node_cache_key
+from .workflow_checkpoints import CheckpointStore
+from .workflow_compiler import (
+    CompiledWorkflow,
+    LoopPolicy,
+    OP_CODE,
+    OP_LLM,
+    OP_LOOP,
+    OP_PARALLEL,
+    OP_SEQUENTIAL,
+    compile_workflow,
+)
+from .workflow_tracing import Span, TraceRecorder
 
-# Mock de uma função que simula a execução de um LLM
-def _simulate_llm_call(instruction: str, input_data: Any) -> Dict[str, Any]:
-    print(f"[LLM] Executando instrução: '{instruction}' com entrada: '{input_data}'")
-    time.sleep(1) # Simula latência da rede/modelo
-    output = f"Resultado simulado para '{instruction[:20]}...'"
-    print(f"[LLM] Saída: {output}")
-    return {"result": output}
-
-def execute_node(node: WorkflowNode, input_data: Any) -> Any:
-    """Executa recursivamente um único nó do workflow."""
-    print(f"---\n[Engine] Executando nó: {node.id} (Tipo: {node.type}) com dados: {input_data}")
-
-    node_type = node.type
-    output_data = None
-
-    if node_type == 'llmAgent':
-        instruction = node.data.get('instruction', 'Nenhuma instrução fornecida.')
-        output_data = _simulate_llm_call(instruction, input_data)
-
-    elif node_type == 'sequentialAgent':
-        # Executa os filhos em sequência, passando a saída de um como entrada para o próximo
-        current_input = input_data
-        for child_node in node.children:
-            current_input = execute_node(child_node, current_input)
-        output_data = current_input # A saída do sequencial é a saída do último nó
-
-    elif node_type == 'parallelAgent':
-        # Em uma implementação real, isso executaria em paralelo (ex: com asyncio.gather)
-        # Por enquanto, executamos sequencialmente e coletamos os resultados.
-        print("[Engine] Executando ParallelAgent (simulação sequencial)")
-        parallel_outputs = []
-        for child_node in node.children:
-            result = execute_node(child_node, input_data)
-            parallel_outputs.append(result)
-        output_data = parallel_outputs
-
-    elif node_type == 'loopAgent':
-        iterations = int(node.data.get('iterations', 1))
-        print(f"[Engine] Executando LoopAgent por {iterations} iterações")
-        loop_output = None
-        for i in range(iterations):
-            print(f"[Engine] Loop iteração {i + 1}/{iterations}")
-            loop_output = execute_node(node.children[0], input_data if i == 0 else loop_output)
-        output_data = loop_output
-
-    else:
-        print(f"[Engine] WARN: Tipo de nó desconhecido '{node_type}'. Pulando.")
-        output_data = input_data # Passa os dados de entrada adiante
-
-    print(f"[Engine] Finalizado nó: {node.id}. Saída: {output_data}\n---")
-    return output_data
-
-def run_workflow(workflow_tree: List[WorkflowNode], initial_data: Dict[str, Any]) -> List[Any]:
-    """Inicia a execução de uma árvore de workflow."""
+# Número máximo de nós folha (chamadas de LLM) em execução simultânea por run
+DEFAULT_MAX_CONCURRENCY = 8
+
+# Tamanho máximo da prévia de saída enviada nos eventos de nó
+OUTPUT_PREVIEW_CHARS = 200
+
+# Recebe cada evento de execução (ver `_emit`); usado, por exemplo, pelo endpoint SSE
+EventCallback = Callable[[Dict[str, Any]], None]
+
+
+class ExecutionContext:
+    """Estado compartilhado por todos os nós de uma mesma execução de workflow."""
+
+    def __init__(
+        self,
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+        on_event: Optional[EventCallback] = None,
+        cache: Optional[NodeResultCache] = None,
+        tracer: Optional[TraceRecorder] = None,
+        checkpoints: Optional[CheckpointStore] = None,
+        run_id: Optional[str] = None,
+        llm_executor: Optional[LLMExecutor] = None,
+    ):
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency deve ser maior ou igual a 1.")
+        self.max_concurrency = max_concurrency
+        # Limita apenas os nós folha: limitar nós compostos causaria deadlock
+        # quando um parallelAgent aninhado aguarda filhos que também precisam de vaga.
+        self.llm_semaphore = asyncio.Semaphore(max_concurrency)
+        self.on_event = on_event
+        self.cache = cache # None desativa o cache de resultados de nós
+        self.tracer = tracer # None desativa a gravação de spans
+        # Checkpoints só são usados quando a execução tem um run_id
+        self.checkpoints = checkpoints if run_id is not None else None
+        self.run_id = run_id
+        # Backend que executa os nós llmAgent; por padrão, o configurado em settings
+        self.llm_executor = llm_executor if llm_executor is not None else get_workflow_llm_executor()
+
+
+def _output_preview(output: Any) -> str:
+    preview = str(output)
+    if len(preview) > OUTPUT_PREVIEW_CHARS:
+        return preview[:OUTPUT_PREVIEW_CHARS] + "..."
+    return preview
+
+
+def _emit(context: ExecutionContext, event: str, plan: CompiledWorkflow, node: int, **fields: Any) -> None:
+    if context.on_event is not None:
+        context.on_event({
+            "event": event,
+            "node_id": plan.node_ids[node],
+            "type": plan.node_types[node],
+            **fields,
+        })
+
+
+async def _gather_cancelling(coros: Iterable[Awaitable[Any]]) -> List[Any]:
+    """Executa as corrotinas em paralelo; se uma falhar, cancela as demais e propaga o erro."""
+    tasks = [asyncio.ensure_future(coro) for coro in coros]
+    try:
+        return list(await asyncio.gather(*tasks))
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+
+async def _execute_llm_node(
+    plan: CompiledWorkflow, node: int, input_data: Any, context: ExecutionContext
+) -> Tuple[Any, Dict[str, Any]]:
+    """Executa um nó llmAgent, retornando a saída e detalhes (tokens, acerto de cache)."""
+    cache_key = None
+    if context.cache is not None and plan.cache_prefixes[node] is not None:
+        cache_key = make_node_cache_key(plan.cache_prefixes[node], input_data)
+        hit, cached_output = context.cache.get(cache_key)
+        if hit:
+            print(f"[Engine] Cache hit para o nó: {plan.node_ids[node]}")
+            return cached_output, {"input_tokens": 0, "output_tokens": 0, "cache_hit": True}
+
+    async with context.llm_semaphore:
+        output, token_usage = await context.llm_executor.generate(
+            plan.instructions[node], input_data, plan.generation_params[node] or {}
+        )
+
+    if cache_key is not None:
+        context.cache.set(cache_key, output)
+    return output, {**token_usage, "cache_hit": False}
+
+
+class _Frame:
+    """Nó em andamento na pilha explícita do interpretador."""
+
+    __slots__ = ('node', 'input', 'value', 'step', 'started_at', 'fingerprint', 'stop_reason', 'span', 'scope')
+
+    def __init__(self, node: int, input_data: Any, span: Optional[Span] = None, scope: str = ""):
+        self.node = node
+        self.input = input_data
+        self.value = input_data # Valor corrente de sequenciais e loops
+        self.step = 0 # Próximo filho (sequencial) ou iteração (loop)
+        self.started_at = time.perf_counter()
+        self.fingerprint: Optional[str] = None # Hash da última saída do loop (convergência)
+        self.stop_reason: Optional[str] = None
+        self.span = span
+        self.scope = scope # Prefixo de loop usado na chave do checkpoint
+
+
+_NO_CHECKPOINT = object()
+
+
+async def _restore_checkpoint(plan: CompiledWorkflow, frame: _Frame, context: ExecutionContext) -> Any:
+    found, output = await context.checkpoints.load(context.run_id, frame.scope + plan.node_ids[frame.node])
+    return output if found else _NO_CHECKPOINT
+
+
+def _loop_stop_reason(policy: LoopPolicy, frame: _Frame) -> Optional[str]:
+    """Avalia os critérios de parada antecipada após uma iteração do loop."""
+    output = frame.value
+    if policy.stop_condition is not None and policy.stop_condition(output):
+        return "condition_met"
+    if policy.until_unchanged:
+        previous = frame.fingerprint if frame.fingerprint is not None else fingerprint(frame.input)
+        frame.fingerprint = fingerprint(output)
+        if frame.fingerprint == previous:
+            return "converged"
+    if policy.max_wall_time is not None and time.perf_counter() - frame.started_at >= policy.max_wall_time:
+        return "time_budget_exhausted"
+    return None
+
+
+def _push(
+    plan: CompiledWorkflow,
+    stack: List[_Frame],
+    node: int,
+    input_data: Any,
+    context: ExecutionContext,
+    parent_span: Optional[Span],
+    lane: int,
+    scope: str,
+) -> None:
+    print(f"---\n[Engine] Executando nó: {plan.node_ids[node]} (Tipo: {plan.node_types[node]}) com dados: {input_data}")
+    span = None
+    if context.tracer is not None:
+        span = context.tracer.start_span(plan.node_ids[node], plan.node_types[node], parent_span, lane, input_data)
+    stack.append(_Frame(node, input_data, span, scope))
+    _emit(context, "node_start", plan, node)
+
+
+async def _execute_subtree(
+    plan: CompiledWorkflow,
+    root: int,
+    input_data: Any,
+    context: ExecutionContext,
+    parent_span: Optional[Span] = None,
+    scope: str = "",
+) -> Any:
+    """Executa a subárvore de `root` com uma pilha explícita, sem recursão em Python.
+
+    Sequenciais e loops avançam na própria pilha; cada ramo de um parallelAgent é
+    executado em uma task própria, que começa com uma pilha nova (e uma nova faixa no trace).
+    """
+    opcodes = plan.opcodes
+    lane = context.tracer.new_lane() if context.tracer is not None else 0
+    stack: List[_Frame] = []
+    _push(plan, stack, root, input_data, context, parent_span, lane, scope)
+    result: Any = None
+
+    while stack:
+        frame = stack[-1]
+        node = frame.node
+        opcode = opcodes[node]
+        details: Dict[str, Any] = {}
+
+        if (
+            frame.step == 0
+            and context.checkpoints is not None
+            and (restored := await _restore_checkpoint(plan, frame, context)) is not _NO_CHECKPOINT
+        ):
+            # Nó concluído em uma tentativa anterior deste run: reaproveita a saída
+            result = restored
+            details = {"checkpoint_restored": True}
+
+        elif opcode == OP_SEQUENTIAL:
+            # Executa os filhos em sequência, passando a saída de um como entrada para o próximo
+            if frame.step:
+                frame.value = result
+            if frame.step < plan.child_count[node]:
+                child = plan.child_start[node] + frame.step
+                frame.step += 1
+                _push(plan, stack, child, frame.value, context, frame.span, lane, frame.scope)
+                continue
+            result = frame.value # A saída do sequencial é a saída do último nó
+
+        elif opcode == OP_LOOP:
+            iterations = plan.iterations[node]
+            policy = plan.loop_policies[node]
+            if frame.step:
+                frame.value = result
+                if policy is not None:
+                    frame.stop_reason = _loop_stop_reason(policy, frame)
+            elif iterations:
+                print(f"[Engine] Executando LoopAgent por até {iterations} iterações")
+            if frame.stop_reason is None and frame.step < iterations:
+                frame.step += 1
+                print(f"[Engine] Loop iteração {frame.step}/{iterations}")
+                iteration_scope = f"{frame.scope}{plan.node_ids[node]}#{frame.step}/"
+                _push(plan, stack, plan.child_start[node], frame.value, context, frame.span, lane, iteration_scope)
+                continue
+            result = frame.value if iterations else None
+            details = {"iterations_run": frame.step, "stop_reason": frame.stop_reason or "max_iterations"}
+            print(f"[Engine] LoopAgent encerrado após {frame.step}/{iterations} iterações ({details['stop_reason']})")
+
+        elif opcode == OP_LLM:
+            result, details = await _execute_llm_node(plan, node, frame.input, context)
+
+        elif opcode == OP_CODE:
+            # Roda em um processo do pool; o event loop segue livre enquanto o snippet executa
+            node_data = plan.node_data[node]
+            result = await execute_code(node_data['code'], frame.input, plan.code_limits[node])
+
+        elif opcode == OP_PARALLEL:
+            # Todos os filhos recebem a mesma entrada e rodam concorrentemente;
+            # a ordem das saídas segue a ordem dos filhos.
+            print(f"[Engine] Executando ParallelAgent com {plan.child_count[node]} ramos concorrentes")
+            result = await _gather_cancelling(
+                _execute_subtree(plan, child, frame.input, context, frame.span, frame.scope)
+                for child in plan.children(node)
+            )
+
+        else:
+            print(f"[Engine] WARN: Tipo de nó desconhecido '{plan.node_types[node]}'. Pulando.")
+            result = frame.input # Passa os dados de entrada adiante
+
+        stack.pop()
+        print(f"[Engine] Finalizado nó: {plan.node_ids[node]}. Saída: {result}\n---")
+        if context.checkpoints is not None and not details.get("checkpoint_restored"):
+            await context.checkpoints.save(context.run_id, frame.scope + plan.node_ids[node], result)
+        if frame.span is not None:
+            context.tracer.finish_span(frame.span, result, **details)
+        _emit(
+            context, "node_finish", plan, node,
+            duration_ms=round((time.perf_counter() - frame.started_at) * 1000, 3),
+            output_preview=_output_preview(result),
+            **details,
+        )
+
+    return result
+
+
+async def execute_node(node: WorkflowNode, input_data: Any, context: Optional[ExecutionContext] = None) -> Any:
+    """Executa um único nó do workflow (e seus filhos)."""
+    plan = compile_workflow([node])
+    return await _execute_subtree(plan, 0, input_data, context or ExecutionContext())
+
+
+async def run_compiled_workflow(
+    plan: CompiledWorkflow,
+    initial_data: Dict[str, Any],
+    max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+    on_event: Optional[EventCallback] = None,
+    cache: Optional[NodeResultCache] = None,
+    tracer: Optional[TraceRecorder] = None,
+    checkpoints: Optional[CheckpointStore] = None,
+    run_id: Optional[str] = None,
+    llm_executor: Optional[LLMExecutor] = None,
+) -> List[Any]:
+    """Executa um plano já compilado (ver `workflow_compiler`).
+
+    As raízes são independentes entre si e rodam concorrentemente; `max_concurrency`
+    limita quantas chamadas de LLM podem estar em andamento ao mesmo tempo nesta execução.
+    `on_event`, se informado, recebe um evento `node_start` e um `node_finish` a cada nó executado
+    (loops incluem `iterations_run` e `stop_reason`; nós llmAgent, tokens e `cache_hit`).
+    `cache`, se informado, memoriza as saídas de nós llmAgent (ver `node_cache`).
+    `tracer`, se informado, recebe um span por nó executado (ver `workflow_tracing`).
+    `checkpoints` + `run_id` gravam a saída de cada nó concluído e reaproveitam as já
+    gravadas para o mesmo run, permitindo retomar uma execução que falhou.
+    `llm_executor` substitui o backend de LLM padrão (ver `llm_executors`).
+    """
     print("\n========================================")
     print("====== INICIANDO EXECUÇÃO DO WORKFLOW ======")
     print("========================================\n")
-    
-    final_outputs = []
-    for root_node in workflow_tree:
-        output = execute_node(root_node, initial_data)
-        final_outputs.append(output)
-    
+
+    context = ExecutionContext(
+        max_concurrency=max_concurrency,
+        on_event=on_event,
+        cache=cache,
+        tracer=tracer,
+        checkpoints=checkpoints,
+        run_id=run_id,
+        llm_executor=llm_executor,
+    )
+    final_outputs = await _gather_cancelling(
+        _execute_subtree(plan, root, initial_data, context) for root in range(plan.root_count)
+    )
+
     print("\n========================================")
     print("====== EXECUÇÃO DO WORKFLOW FINALIZADA ======")
     print(f"Saídas finais: {final_outputs}")
     print("========================================\n")
     return final_outputs
+
+
+async def run_workflow(
+    workflow_tree: List[WorkflowNode],
+    initial_data: Dict[str, Any],
+    max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+    cache: Optional[NodeResultCache] = None,
+    llm_executor: Optional[LLMExecutor] = None,
+) -> List[Any]:
+    """Inicia a execução de uma árvore de workflow, compilando-a antes."""
+    plan = compile_workflow(workflow_tree)
+    return await run_compiled_workflow(
+        plan, initial_data, max_concurrency=max_concurrency, cache=cache, llm_executor=llm_executor
+    )
@@ -0,0 +1,251 @@
+"""Prazo por chamada e requisições duplicadas ("hedging") para chamadas ao Gemini.
+
+Uma única resposta lenta do backend define o p99 do chat. Cada chamada passa a ter um
+prazo (`deadline_seconds`) e, opcionalmente, um hedge: se a resposta não chegar até o
+percentil `hedge.percentile` das latências recentes do modelo, uma chamada idêntica é
+disparada e vale a que terminar primeiro (a outra é cancelada).
+
+Os hedges são limitados por um balde de fichas por modelo: cada chamada deposita
+`hedge.max_rate` fichas e cada hedge gasta uma, de modo que no máximo essa fração das
+chamadas é duplicada. Antes de `MIN_SAMPLES` latências registradas não há hedge. O hedge
+ocupa uma vaga própria no `ModelGate` do modelo; sem vaga livre no momento, ele é pulado
+em vez de esperar na fila, para não ultrapassar `max_concurrency`.
+
+Chamadas que estouram o prazo entram no histórico de latências com o valor do prazo
+(amostra censurada): sem isso, um backend que passa a travar deixaria o percentil
+otimista e o hedge dispararia tarde demais.
+
+Respostas em streaming não têm um prazo total; `stream_with_deadlines` limita o tempo até
+o primeiro chunk (`first_chunk_seconds`) e o intervalo entre chunks (`idle_seconds`).
+
+A configuração vem de `runtime_config["latency"]` do agente, com os padrões de settings:
+    {"deadline_seconds": 30, "first_chunk_seconds": 20, "idle_seconds": 20,
+     "hedge": {"enabled": true, "percentile": 95, "max_rate": 0.1}}
+O resultado de cada chamada fica em um dicionário de detalhes gravado em usage_metrics.
+"""
+import asyncio
+import math
+from collections import deque
+from typing import Any, AsyncIterable, AsyncIterator, Awaitable, Callable, Deque, Dict, Optional, TypeVar
+
+from ..config import settings
+from .llm_circuit_breaker import ModelGate
+
+T = TypeVar("T")
+
+# Latências guardadas por modelo e mínimo necessário para calcular o atraso do hedge
+LATENCY_WINDOW = 200
+MIN_SAMPLES = 20
+
+# Fichas acumuladas no máximo, permitindo uma pequena rajada de hedges
+HEDGE_BURST = 5.0
+
+
+class LLMDeadlineExceeded(asyncio.TimeoutError):
+    """Nenhuma chamada (original ou hedge) respondeu dentro do prazo."""
+
+
+class CallPolicy:
+    __slots__ = (
+        'deadline_seconds', 'first_chunk_seconds', 'idle_seconds',
+        'hedge_enabled', 'hedge_percentile', 'hedge_max_rate', 'hedge_min_delay_seconds',
+    )
+
+    def __init__(
+        self,
+        deadline_seconds: float,
+        hedge_enabled: bool = False,
+        hedge_percentile: float = 95,
+        hedge_max_rate: float = 0.1,
+        hedge_min_delay_seconds: float = 0.5,
+        first_chunk_seconds: Optional[float] = None,
+        idle_seconds: Optional[float] = None,
+    ):
+        self.deadline_seconds = deadline_seconds
+        # Prazos do streaming; sem valor, usam o prazo da chamada
+        self.first_chunk_seconds = first_chunk_seconds if first_chunk_seconds is not None else deadline_seconds
+        self.idle_seconds = idle_seconds if idle_seconds is not None else deadline_seconds
+        self.hedge_enabled = hedge_enabled
+        self.hedge_percentile = hedge_percentile
+        self.hedge_max_rate = hedge_max_rate
+        self.hedge_min_delay_seconds = hedge_min_delay_seconds
+
+
+def parse_call_policy(runtime_config: Optional[Dict[str, Any]]) -> CallPolicy:
+    """Lê `runtime_config["latency"]`; sem configuração, vale só o prazo padrão."""
+    config = (runtime_config or {}).get("latency") or {}
+    if not isinstance(config, dict) or not isinstance(config.get("hedge") or {}, dict):
+        raise ValueError("'runtime_config.latency' e 'latency.hedge' devem ser objetos.")
+    hedge = config.get("hedge") or {}
+    try:
+        policy = CallPolicy(
+            deadline_seconds=float(config.get("deadline_seconds", settings.LLM_DEADLINE_SECONDS)),
+            hedge_enabled=bool(hedge.get("enabled", False)),
+            hedge_percentile=float(hedge.get("percentile", 95)),
+            hedge_max_rate=float(hedge.get("max_rate", 0.1)),
+            hedge_min_delay_seconds=float(hedge.get("min_delay_seconds", 0.5)),
+            first_chunk_seconds=float(config.get("first_chunk_seconds", settings.LLM_STREAM_FIRST_CHUNK_SECONDS)),
+            idle_seconds=float(config.get("idle_seconds", settings.LLM_STREAM_IDLE_SECONDS)),
+        )
+    except (TypeError, ValueError):
+        raise ValueError("'runtime_config.latency' contém valores inválidos.")
+    if min(policy.deadline_seconds, policy.first_chunk_seconds, policy.idle_seconds) <= 0:
+        raise ValueError("'deadline_seconds', 'first_chunk_seconds' e 'idle_seconds' devem ser positivos.")
+    if not 0 < policy.hedge_percentile < 100:
+        raise ValueError("'hedge.percentile' deve estar entre 0 e 100.")
+    if not 0 <= policy.hedge_max_rate <= 1 or policy.hedge_min_delay_seconds < 0:
+        raise ValueError("'hedge.max_rate' deve estar entre 0 e 1 e 'hedge.min_delay_seconds' não pode ser negativo.")
+    return policy
+
+
+class LatencyTracker:
+    """Janela deslizante das últimas latências (em segundos) de cada modelo."""
+
+    def __init__(self, window: int = LATENCY_WINDOW, min_samples: int = MIN_SAMPLES):
+        self.window = window
+        self.min_samples = min_samples
+        self._samples: Dict[str, Deque[float]] = {}
+
+    def record(self, model: str, seconds: float) -> None:
+        samples = self._samples.get(model)
+        if samples is None:
+            samples = self._samples[model] = deque(maxlen=self.window)
+        samples.append(seconds)
+
+    def percentile(self, model: str, percentile: float) -> Optional[float]:
+        samples = self._samples.get(model)
+        if samples is None or len(samples) < self.min_samples:
+            return None
+        ordered = sorted(samples)
+        return ordered[max(0, math.ceil(percentile / 100 * len(ordered)) - 1)] # Nearest-rank
+
+
+class HedgeBudget:
+    """Balde de fichas que limita a fração de chamadas duplicadas."""
+
+    def __init__(self, burst: float = HEDGE_BURST):
+        self.burst = burst
+        self.tokens = 0.0
+
+    def deposit(self, rate: float) -> None:
+        self.tokens = min(self.burst, self.tokens + rate)
+
+    def withdraw(self) -> bool:
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+async def call_with_policy(
+    call: Callable[[], Awaitable[T]],
+    model: str,
+    policy: CallPolicy,
+    tracker: LatencyTracker,
+    budget: HedgeBudget,
+    details: Dict[str, Any],
+    gate: Optional[ModelGate] = None,
+) -> T:
+    """Executa `call` com prazo e hedge; o desfecho é registrado em `details` mesmo em caso de erro.
+
+    Com `gate`, o hedge só é disparado se conseguir uma vaga livre (`gate.try_acquire`).
+    """
+    loop = asyncio.get_running_loop()
+    started_at = loop.time()
+    deadline = started_at + policy.deadline_seconds
+    details.update({'deadline_seconds': policy.deadline_seconds, 'hedged': False, 'timed_out': False})
+
+    def launch() -> "asyncio.Task[T]":
+        task = asyncio.ensure_future(call())
+        task_started_at[task] = loop.time()
+        return task
+
+    task_started_at: Dict[Any, float] = {}
+    primary = launch()
+    pending = {primary}
+    last_error: Optional[BaseException] = None
+    try:
+        if policy.hedge_enabled:
+            budget.deposit(policy.hedge_max_rate)
+            delay = tracker.percentile(model, policy.hedge_percentile)
+            if delay is None:
+                details['hedge_skipped'] = 'warming_up'
+            else:
+                delay = max(delay, policy.hedge_min_delay_seconds)
+                if delay < policy.deadline_seconds:
+                    done, _ = await asyncio.wait(pending, timeout=delay)
+                    if not done:
+                        if budget.tokens < 1:
+                            details['hedge_skipped'] = 'rate_limited'
+                        elif gate is not None and not await gate.try_acquire():
+                            details['hedge_skipped'] = 'no_capacity'
+                        else:
+                            budget.withdraw()
+                            hedge = launch()
+                            if gate is not None:
+                                # Callback em vez de finally: também libera se o hedge for cancelado antes de rodar
+                                hedge.add_done_callback(lambda _: gate.release())
+                            pending.add(hedge)
+                            details.update({'hedged': True, 'hedge_delay_ms': round(delay * 1000, 1)})
+
+        while pending:
+            remaining = deadline - loop.time()
+            done, pending = await asyncio.wait(pending, timeout=max(remaining, 0), return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                details['timed_out'] = True
+                tracker.record(model, policy.deadline_seconds) # Amostra censurada no prazo
+                raise LLMDeadlineExceeded(f"LLM call exceeded {policy.deadline_seconds}s deadline.")
+            for task in done:
+                if task.exception() is None:
+                    tracker.record(model, loop.time() - task_started_at[task])
+                    if details['hedged']:
+                        details['hedge_won'] = task is not primary
+                    return task.result()
+                last_error = task.exception()
+        raise last_error
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def stream_with_deadlines(
+    start: Callable[[], Awaitable[AsyncIterable[T]]],
+    policy: CallPolicy,
+    details: Dict[str, Any],
+) -> AsyncIterator[T]:
+    """Repassa os chunks de `start()` limitando a espera pelo primeiro e entre os seguintes.
+
+    Abrir o stream conta para o prazo do primeiro chunk. Ao estourar um prazo, levanta
+    `LLMDeadlineExceeded` e registra `timed_out` e `timeout_phase` (`first_chunk`/`idle`).
+    """
+    loop = asyncio.get_running_loop()
+    started_at = loop.time()
+    first_chunk_deadline = started_at + policy.first_chunk_seconds
+    details.update({
+        'first_chunk_seconds': policy.first_chunk_seconds, 'idle_seconds': policy.idle_seconds, 'timed_out': False,
+    })
+
+    def timed_out(phase: str, seconds: float) -> LLMDeadlineExceeded:
+        details.update({'timed_out': True, 'timeout_phase': phase})
+        return LLMDeadlineExceeded(f"LLM stream sent nothing for {seconds}s ({phase}).")
+
+    try:
+        responses = await asyncio.wait_for(start(), policy.first_chunk_seconds)
+    except asyncio.TimeoutError:
+        raise timed_out('first_chunk', policy.first_chunk_seconds)
+    iterator = responses.__aiter__()
+    received = False
+    while True:
+        timeout = policy.idle_seconds if received else max(first_chunk_deadline - loop.time(), 0)
+        try:
+            chunk = await asyncio.wait_for(iterator.__anext__(), timeout)
+        except StopAsyncIteration:
+            return
+        except asyncio.TimeoutError:
+            if received:
+                raise timed_out('idle', policy.idle_seconds)
+            raise timed_out('first_chunk', policy.first_chunk_seconds)
+        if not received:
+            received = True
+            details['time_to_first_chunk_ms'] = round((loop.time() - started_at) * 1000, 1)
+        yield chunk
@@ -0,0 +1,137 @@
+"""Limite de concorrência e circuit breaker por modelo para as chamadas ao Gemini.
+
+Quando o Vertex limita a taxa, todas as mensagens simultâneas se acumulam em
+`generate_response` e falham devagar. Cada modelo passa a ter um `ModelGate`:
+- no máximo `max_concurrency` chamadas em andamento; até `max_queue` aguardam vaga e as
+  demais são recusadas na hora (`queue_full`);
+- após `failure_threshold` falhas seguidas do backend o circuito abre e as chamadas são
+  recusadas (`circuit_open`) por `reset_seconds`. Só contam prazos estourados, erros 5xx,
+  limite de taxa (429) e falhas de conexão (ver `is_backend_failure`); erros da própria
+  requisição (4xx, como InvalidArgument) e cancelamentos não abrem o circuito;
+- passado esse tempo, o circuito fica meio-aberto: uma única chamada de teste é liberada;
+  se der certo o circuito fecha, se falhar volta a abrir.
+As recusas levantam `LLMUnavailableError`, que as rotas convertem em 503.
+"""
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Optional
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class LLMUnavailableError(RuntimeError):
+    """O modelo está sobrecarregado, com o circuito aberto ou falhou ao responder."""
+
+    def __init__(self, model: str, reason: str, retry_after_seconds: Optional[float] = None):
+        super().__init__(f"Modelo '{model}' indisponível ({reason}).")
+        self.model = model
+        self.reason = reason # queue_full | circuit_open | timeout | error
+        self.retry_after_seconds = retry_after_seconds
+
+
+def is_backend_failure(error: BaseException) -> bool:
+    """Indica se o erro reflete indisponibilidade do modelo (e não um problema da requisição).
+
+    Exceções do google-api-core trazem o status HTTP em `code`: contam 5xx e 429.
+    """
+    if isinstance(error, (asyncio.TimeoutError, LLMUnavailableError, ConnectionError)):
+        return True
+    code = getattr(error, "code", None)
+    return isinstance(code, int) and (code >= 500 or code == 429)
+
+
+class ModelGate:
+    def __init__(
+        self,
+        model: str,
+        max_concurrency: int = 16,
+        max_queue: int = 64,
+        failure_threshold: int = 5,
+        reset_seconds: float = 30,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        if max_concurrency < 1 or max_queue < 0 or failure_threshold < 1:
+            raise ValueError("max_concurrency e failure_threshold devem ser positivos e max_queue não negativo.")
+        self.model = model
+        self.max_queue = max_queue
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._clock = clock
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self.waiting = 0
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+
+    def _admit(self) -> bool:
+        """Verifica o circuito; retorna True se a chamada for a de teste do estado meio-aberto."""
+        if self.state == OPEN:
+            remaining = self.reset_seconds - (self._clock() - self._opened_at)
+            if remaining > 0:
+                raise LLMUnavailableError(self.model, "circuit_open", retry_after_seconds=remaining)
+            self.state = HALF_OPEN
+        if self.state == HALF_OPEN:
+            if self._probe_in_flight:
+                raise LLMUnavailableError(self.model, "circuit_open", retry_after_seconds=self.reset_seconds)
+            self._probe_in_flight = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self.state = CLOSED
+        self.consecutive_failures = 0
+
+    def record_failure(self) -> None:
+        self.consecutive_failures += 1
+        if self.state == HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            self.state = OPEN
+            self._opened_at = self._clock()
+
+    async def try_acquire(self) -> bool:
+        """Reserva uma vaga só se houver uma livre agora, sem entrar na fila (usado pelos hedges).
+
+        Fora do estado fechado não reserva nada. A vaga é devolvida com `release`.
+        """
+        if self.state != CLOSED or self._slots.locked():
+            return False
+        await self._slots.acquire() # Com vaga livre, não suspende
+        return True
+
+    def release(self) -> None:
+        self._slots.release()
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """Reserva uma vaga para uma chamada e registra seu resultado no circuito.
+
+        Só falhas do backend (`is_backend_failure`) contam para o circuito; as demais
+        exceções e os cancelamentos liberam a vaga sem alterar o circuito.
+        """
+        probe = self._admit()
+        try:
+            if self._slots.locked() and self.waiting >= self.max_queue:
+                raise LLMUnavailableError(self.model, "queue_full", retry_after_seconds=1)
+            self.waiting += 1
+            try:
+                await self._slots.acquire()
+            finally:
+                self.waiting -= 1
+            try:
+                yield
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if is_backend_failure(e):
+                    self.record_failure()
+                raise
+            else:
+                self.record_success()
+            finally:
+                self._slots.release()
+        finally:
+            if probe:
+                self._probe_in_flight = False
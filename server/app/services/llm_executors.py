@@ -0,0 +1,163 @@
+"""Backends de LLM usados pelo motor de workflows nos nós llmAgent.
+
+O motor chama apenas `LLMExecutor.generate`; a implementação é escolhida por
+`settings.WORKFLOW_LLM_BACKEND`:
+- `"vertex"`: `LLMServiceExecutor`, que delega para `LLMService.generate_response`;
+- `"fake"`: `FakeLLMExecutor`, local e determinístico, com latência e taxa de falhas
+  configuráveis, para rodar e medir o escalonamento do motor sem rede.
+"""
+import asyncio
+import hashlib
+import json
+import math
+import random
+from typing import Any, Dict, Optional, Tuple
+
+from ..config import settings
+from .llm_circuit_breaker import LLMUnavailableError
+from .token_estimator import PromptTooLargeError
+
+LATENCY_DISTRIBUTIONS = ("fixed", "normal", "long_tail")
+
+
+class LLMExecutorError(RuntimeError):
+    """Falha na chamada ao LLM de um nó (propagada como erro da execução)."""
+
+
+class LLMExecutor:
+    """Interface dos backends: recebe instrução, entrada e parâmetros de geração do nó."""
+
+    async def generate(
+        self, instruction: str, input_data: Any, params: Dict[str, Any]
+    ) -> Tuple[Any, Dict[str, int]]:
+        """Retorna `(saída, uso de tokens)`, com `input_tokens` e `output_tokens`."""
+        raise NotImplementedError
+
+
+def _format_input(input_data: Any) -> str:
+    if isinstance(input_data, str):
+        return input_data
+    return json.dumps(input_data, ensure_ascii=False, default=str)
+
+
+class LLMServiceExecutor(LLMExecutor):
+    """Executa os nós no Vertex AI através de `LLMService.generate_response`."""
+
+    def __init__(self, llm_service: Any = None, default_model: Optional[str] = None):
+        # Importação tardia: o SDK do Vertex AI só é necessário com este backend
+        if llm_service is None:
+            from .llm_service import get_llm_service
+            llm_service = get_llm_service()
+        self.llm_service = llm_service
+        self.default_model = default_model or settings.WORKFLOW_LLM_DEFAULT_MODEL
+
+    async def generate(
+        self, instruction: str, input_data: Any, params: Dict[str, Any]
+    ) -> Tuple[Any, Dict[str, int]]:
+        from ..models.agent import Agent as AgentConfig
+
+        agent_config = AgentConfig(
+            name="workflow-node",
+            instruction=instruction,
+            model=params.get("model") or self.default_model,
+            **{key: value for key, value in params.items() if key != "model"},
+        )
+        try:
+            text, token_usage = await self.llm_service.generate_response(agent_config, [], _format_input(input_data))
+        except (LLMUnavailableError, PromptTooLargeError) as e:
+            raise LLMExecutorError(str(e)) from e
+        return {"result": text}, token_usage
+
+
+class FakeLLMExecutor(LLMExecutor):
+    """LLM local: a saída depende só da instrução e da entrada; a latência é sorteada.
+
+    - `latency="fixed"`: sempre `mean_seconds`;
+    - `latency="normal"`: normal com média `mean_seconds` e desvio `stddev_seconds` (truncada em 0);
+    - `latency="long_tail"`: log-normal com mediana `mean_seconds` e `tail_sigma`, que
+      produz caudas longas (p99 muito acima da mediana) como as de APIs reais.
+    `failure_rate` é a probabilidade de cada chamada levantar `LLMExecutorError`.
+    Com `seed`, a sequência de latências e falhas é reproduzível.
+    """
+
+    def __init__(
+        self,
+        latency: str = "fixed",
+        mean_seconds: float = 1.0,
+        stddev_seconds: float = 0.25,
+        tail_sigma: float = 1.0,
+        failure_rate: float = 0.0,
+        seed: Optional[int] = None,
+    ):
+        if latency not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"latency deve ser um de: {', '.join(LATENCY_DISTRIBUTIONS)}.")
+        if not 0.0 <= failure_rate <= 1.0:
+            raise ValueError("failure_rate deve estar entre 0 e 1.")
+        if mean_seconds < 0:
+            raise ValueError("mean_seconds não pode ser negativo.")
+        self.latency = latency
+        self.mean_seconds = mean_seconds
+        self.stddev_seconds = stddev_seconds
+        self.tail_sigma = tail_sigma
+        self.failure_rate = failure_rate
+        self._random = random.Random(seed)
+        self.calls = 0
+
+    def sample_latency(self) -> float:
+        if self.latency == "normal":
+            return max(0.0, self._random.gauss(self.mean_seconds, self.stddev_seconds))
+        if self.latency == "long_tail":
+            if self.mean_seconds == 0:
+                return 0.0
+            return self._random.lognormvariate(math.log(self.mean_seconds), self.tail_sigma)
+        return self.mean_seconds
+
+    async def generate(
+        self, instruction: str, input_data: Any, params: Dict[str, Any]
+    ) -> Tuple[Any, Dict[str, int]]:
+        self.calls += 1
+        latency = self.sample_latency()
+        fails = self.failure_rate > 0 and self._random.random() < self.failure_rate
+        print(f"[LLM] Executando instrução: '{instruction}' com entrada: '{input_data}'")
+        await asyncio.sleep(latency) # Simula latência da rede/modelo sem bloquear o event loop
+        if fails:
+            raise LLMExecutorError(f"Falha simulada do LLM para a instrução '{instruction[:20]}...'")
+
+        prompt = instruction + _format_input(input_data)
+        digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:8]
+        output = f"Resultado simulado para '{instruction[:20]}...' [{digest}]"
+        print(f"[LLM] Saída: {output}")
+        # Estimativa grosseira de ~4 caracteres por token
+        token_usage = {
+            "input_tokens": len(prompt) // 4,
+            "output_tokens": len(output) // 4,
+        }
+        return {"result": output}, token_usage
+
+
+_default_executor: Optional[LLMExecutor] = None
+
+
+def build_llm_executor(backend: Optional[str] = None) -> LLMExecutor:
+    """Cria o backend configurado em `settings` (ou o indicado em `backend`)."""
+    backend = backend or settings.WORKFLOW_LLM_BACKEND
+    if backend == "fake":
+        return FakeLLMExecutor(
+            latency=settings.WORKFLOW_FAKE_LLM_LATENCY,
+            mean_seconds=settings.WORKFLOW_FAKE_LLM_MEAN_SECONDS,
+            stddev_seconds=settings.WORKFLOW_FAKE_LLM_STDDEV_SECONDS,
+            tail_sigma=settings.WORKFLOW_FAKE_LLM_TAIL_SIGMA,
+            failure_rate=settings.WORKFLOW_FAKE_LLM_FAILURE_RATE,
+            seed=settings.WORKFLOW_FAKE_LLM_SEED,
+        )
+    if backend == "vertex":
+        return LLMServiceExecutor()
+    raise ValueError(f"WORKFLOW_LLM_BACKEND desconhecido: '{backend}'. Use 'fake' ou 'vertex'.")
+
+
+def get_workflow_llm_executor() -> LLMExecutor:
+    """Backend compartilhado pelas execuções de workflow, criado no primeiro uso."""
+    global _default_executor
+    if _default_executor is None:
+        _default_executor = build_llm_executor()
+    return _default_executor
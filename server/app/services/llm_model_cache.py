@@ -0,0 +1,56 @@
+"""Cache LRU de handles de modelo (`GenerativeModel`) reutilizados entre requisições.
+
+Criar um `GenerativeModel` por mensagem refaz a configuração do cliente e impede que os
+canais gRPC/HTTP subjacentes fiquem aquecidos. Os handles são indexados por
+(nome do modelo, hash da instrução de sistema, configuração de geração), pois a instrução
+e a configuração passam a ser fixadas na construção do modelo.
+"""
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+ModelKey = Tuple[str, str, str]
+
+
+def make_model_key(model_name: str, system_instruction: Optional[str], generation_config: Dict[str, Any]) -> ModelKey:
+    instruction_hash = hashlib.sha256((system_instruction or "").encode("utf-8")).hexdigest()
+    config_key = json.dumps(generation_config, sort_keys=True, default=str)
+    return model_name, instruction_hash, config_key
+
+
+class ModelHandleCache:
+    """Mantém até `max_entries` handles; o menos usado recentemente é descartado primeiro."""
+
+    def __init__(self, factory: Callable[[str, Optional[str], Dict[str, Any]], Any], max_entries: int = 64):
+        if max_entries < 1:
+            raise ValueError("max_entries deve ser maior ou igual a 1.")
+        self._factory = factory
+        self.max_entries = max_entries
+        self._handles: "OrderedDict[ModelKey, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._handles)
+
+    def get(self, model_name: str, system_instruction: Optional[str], generation_config: Dict[str, Any]) -> Any:
+        key = make_model_key(model_name, system_instruction, generation_config)
+        with self._lock:
+            handle = self._handles.get(key)
+            if handle is not None:
+                self._handles.move_to_end(key)
+                self.hits += 1
+                return handle
+            self.misses += 1
+            handle = self._factory(model_name, system_instruction, generation_config)
+            self._handles[key] = handle
+            while len(self._handles) > self.max_entries:
+                self._handles.popitem(last=False)
+            return handle
+
+    def clear(self) -> None:
+        with self._lock:
+            self._handles.clear()
@@ -0,0 +1,15 @@
+"""Preços por modelo (USD por 1M de tokens) e cálculo de custo de chamadas de LLM."""
+from typing import Dict
+
+MODEL_PRICING: Dict[str, Dict[str, float]] = {
+    "gemini-1.5-flash": {"input": 0.50, "output": 1.50},
+    "gemini-1.5-pro": {"input": 7.00, "output": 21.00},
+    "default": {"input": 0.50, "output": 1.50},
+}
+
+
+def calculate_cost(model_name: str, input_tokens: float, output_tokens: float) -> float:
+    pricing = MODEL_PRICING.get(model_name, MODEL_PRICING["default"])
+    input_cost = (input_tokens / 1_000_000) * pricing["input"]
+    output_cost = (output_tokens / 1_000_000) * pricing["output"]
+    return input_cost + output_cost
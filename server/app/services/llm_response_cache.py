@@ -0,0 +1,136 @@
+"""Cache de respostas por correspondência exata, para agentes determinísticos.
+
+Agentes com temperature 0 que respondem perguntas repetitivas (FAQ, suporte) pagam uma
+chamada completa ao Gemini por prompts idênticos. Com `runtime_config["response_cache"]`
+habilitado, a resposta é reaproveitada quando coincidem modelo, instrução, configuração
+de geração, as últimas `history_messages` mensagens e a mensagem do usuário (com espaços
+normalizados). O cache é opt-in: com temperatura acima de 0 ele fixa uma das respostas
+possíveis, o que só faz sentido se o agente for configurado para isso.
+
+As entradas expiram após `ttl_seconds` e são descartadas por LRU quando o total estimado
+em bytes passa de `max_bytes`.
+"""
+import hashlib
+import json
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Sequence, Tuple
+
+from ..config import settings
+
+# Custo fixo estimado de cada entrada (chave, uso de tokens, objetos), além do texto
+ENTRY_OVERHEAD_BYTES = 256
+
+
+class ResponseCacheConfig:
+    __slots__ = ('ttl_seconds', 'history_messages')
+
+    def __init__(self, ttl_seconds: float, history_messages: int):
+        self.ttl_seconds = ttl_seconds
+        self.history_messages = history_messages
+
+
+def parse_response_cache_config(runtime_config: Optional[Dict[str, Any]]) -> Optional[ResponseCacheConfig]:
+    """Lê `runtime_config["response_cache"]`; retorna None se o cache não estiver habilitado."""
+    config = (runtime_config or {}).get("response_cache") or {}
+    if not isinstance(config, dict):
+        raise ValueError("'runtime_config.response_cache' deve ser um objeto.")
+    if not config.get("enabled"):
+        return None
+    try:
+        parsed = ResponseCacheConfig(
+            ttl_seconds=float(config.get("ttl_seconds", settings.LLM_RESPONSE_CACHE_TTL_SECONDS)),
+            history_messages=int(config.get("history_messages", 2)),
+        )
+    except (TypeError, ValueError):
+        raise ValueError("'runtime_config.response_cache' contém valores inválidos.")
+    if parsed.ttl_seconds <= 0 or parsed.history_messages < 0:
+        raise ValueError("'ttl_seconds' deve ser positivo e 'history_messages' não pode ser negativo.")
+    return parsed
+
+
+def _normalize(text: str) -> str:
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def make_response_key(
+    model_name: str,
+    system_instruction: Optional[str],
+    generation_config: Dict[str, Any],
+    history_tail: Sequence[Tuple[str, str]],
+    user_message: str,
+) -> str:
+    """Hash de tudo que determina a resposta; `history_tail` são pares (sender_type, texto)."""
+    payload = [
+        model_name,
+        system_instruction or "",
+        generation_config,
+        [[sender, _normalize(text)] for sender, text in history_tail],
+        _normalize(user_message),
+    ]
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+class CachedResponse:
+    __slots__ = ('text', 'token_usage', 'expires_at', 'size_bytes')
+
+    def __init__(self, text: str, token_usage: Dict[str, int], expires_at: float):
+        self.text = text
+        self.token_usage = token_usage # Uso da chamada original, para contabilizar a economia
+        self.expires_at = expires_at
+        self.size_bytes = len(text.encode("utf-8")) + ENTRY_OVERHEAD_BYTES
+
+
+class ResponseCache:
+    """Respostas indexadas por `make_response_key`, com TTL e limite total de `max_bytes` (LRU)."""
+
+    def __init__(self, max_bytes: int = 16 * 1024 * 1024, clock: Callable[[], float] = time.monotonic):
+        self.max_bytes = max_bytes
+        self._clock = clock
+        self._entries: "OrderedDict[str, CachedResponse]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at <= self._clock():
+                del self._entries[key]
+                self.size_bytes -= entry.size_bytes
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key: str, text: str, token_usage: Dict[str, int], ttl_seconds: float) -> None:
+        entry = CachedResponse(text, dict(token_usage), self._clock() + ttl_seconds)
+        if entry.size_bytes > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size_bytes -= previous.size_bytes
+            self._entries[key] = entry
+            self.size_bytes += entry.size_bytes
+            while self.size_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size_bytes -= evicted.size_bytes
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.size_bytes = 0
+
+
+# Instância compartilhada pelas rotas de chat
+response_cache = ResponseCache(max_bytes=settings.LLM_RESPONSE_CACHE_MAX_BYTES)
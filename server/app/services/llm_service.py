@@ -1,15 +1,93 @@
 import vertexai
 from vertexai.generative_models import GenerativeModel, Part, HarmCategory, HarmBlockThreshold, Content
-from typing import List, Dict, Any, Optional, Tuple
+from typing import AsyncIterator, List, Dict, Any, Optional, Tuple, Union
 
 from app.models.agent import Agent as AgentConfig # Pydantic model for agent config
 from app.schemas.chat_schemas import ChatMessageResponse # Pydantic model for chat messages
 from app.config import settings # For GOOGLE_APPLICATION_CREDENTIALS, VERTEX_AI_PROJECT_ID, VERTEX_AI_LOCATION
+from app.services.llm_model_cache import ModelHandleCache
+from app.services.llm_call_policy import (
+    CallPolicy, HedgeBudget, LatencyTracker, LLMDeadlineExceeded, call_with_policy, parse_call_policy,
+    stream_with_deadlines,
+)
+from app.services.llm_circuit_breaker import LLMUnavailableError, ModelGate
+from app.services.token_estimator import token_estimator
 
 # Basic logging
 import logging
 logger = logging.getLogger(__name__)
 
+
+class LLMResponseStream:
+    """Async iterator over the text chunks of a streamed response.
+
+    After iteration finishes, `text` holds the full response, `token_usage` the usage
+    reported with the final chunk and `model` the model that produced it. If the first
+    model is unavailable or fails before sending any text, the next one in `attempts`
+    (the agent's `fallback_model`) is tried and `details` records why. Errors after the
+    first chunk are raised to the caller instead of being turned into a reply, since part
+    of the response may already have been sent.
+
+    Each attempt is bounded by the policy's `first_chunk_seconds` and `idle_seconds`; a
+    stall raises LLMUnavailableError("timeout") and is recorded in `details` like the
+    deadline of a blocking call (`timed_out`, `timeout_phase`).
+    """
+
+    def __init__(
+        self,
+        attempts: List[Tuple[str, GenerativeModel, ModelGate]],
+        contents: List[Content],
+        call_policy: CallPolicy,
+    ):
+        self._attempts = attempts
+        self._contents = contents
+        self._call_policy = call_policy
+        self._chunks: List[str] = []
+        self.model = attempts[0][0]
+        self.token_usage: Dict[str, int] = {"input_tokens": 0, "output_tokens": 0}
+        self.preflight: Optional[Dict[str, Any]] = None # Local size/cost estimate made before the call
+        self.details: Dict[str, Any] = {} # Stream deadlines and, when a fallback answered, fallback_from / unavailable_reason
+
+    @property
+    def text(self) -> str:
+        return "".join(self._chunks)
+
+    async def __aiter__(self) -> AsyncIterator[str]:
+        for index, (model_name, model, gate) in enumerate(self._attempts):
+            self.model = model_name
+            try:
+                # The concurrency slot is held for the whole stream
+                async with gate.slot():
+                    chunks = stream_with_deadlines(
+                        lambda: model.generate_content_async(self._contents, stream=True),
+                        self._call_policy,
+                        self.details,
+                    )
+                    try:
+                        async for chunk in chunks:
+                            if chunk.usage_metadata:
+                                # Usage is cumulative; the last chunk carries the final counts
+                                self.token_usage["input_tokens"] = chunk.usage_metadata.prompt_token_count
+                                self.token_usage["output_tokens"] = chunk.usage_metadata.candidates_token_count
+                            if chunk.candidates and chunk.candidates[0].content.parts:
+                                text = chunk.candidates[0].content.parts[0].text
+                                if text:
+                                    self._chunks.append(text)
+                                    yield text
+                    except LLMDeadlineExceeded as e:
+                        # Raised inside the slot so that stalls count against the circuit breaker
+                        logger.warning(f"Stream from {model_name} timed out: {e}")
+                        raise LLMUnavailableError(model_name, "timeout") from e
+                return
+            except Exception as e:
+                if self._chunks or index == len(self._attempts) - 1:
+                    raise
+                reason = e.reason if isinstance(e, LLMUnavailableError) else "error"
+                logger.warning(f"Stream from {model_name} failed before any output ({e}). Falling back to {self._attempts[index + 1][0]}.")
+                self.details.update({'fallback_from': model_name, 'unavailable_reason': reason})
+                self.token_usage = {"input_tokens": 0, "output_tokens": 0}
+
+
 class LLMService:
     _initialized = False
 
@@ -27,79 +105,210 @@ class LLMService:
             except Exception as e:
                 logger.error(f"Error initializing Vertex AI: {e}", exc_info=True)
                 raise RuntimeError(f"Could not initialize Vertex AI: {e}") from e
+        # Long-lived model handles keep the underlying gRPC/HTTP channels warm between requests
+        self._models = ModelHandleCache(self._build_model, max_entries=settings.LLM_MODEL_CACHE_SIZE)
+        # Per-model latency history and hedge budgets (see llm_call_policy)
+        self._latencies = LatencyTracker()
+        self._hedge_budgets: Dict[str, HedgeBudget] = {}
+        # Per-model concurrency limits and circuit breakers (see llm_circuit_breaker)
+        self._gates: Dict[str, ModelGate] = {}
+
+    @staticmethod
+    def _build_model(model_name: str, system_instruction: Optional[str], generation_config: Dict[str, Any]) -> GenerativeModel:
+        logger.debug(f"Creating model handle for {model_name}")
+        return GenerativeModel(
+            model_name,
+            system_instruction=[Part.from_text(system_instruction)] if system_instruction else None,
+            generation_config=generation_config,
+        )
+
+    @staticmethod
+    def generation_config(agent_config: AgentConfig) -> Dict[str, Any]:
+        return {
+            "temperature": agent_config.temperature,
+            "max_output_tokens": agent_config.max_output_tokens,
+            "top_p": agent_config.top_p,
+            "top_k": agent_config.top_k,
+        }
+
+    def get_gate(self, model_name: str) -> ModelGate:
+        gate = self._gates.get(model_name)
+        if gate is None:
+            gate = self._gates[model_name] = ModelGate(
+                model_name,
+                max_concurrency=settings.LLM_MAX_CONCURRENCY_PER_MODEL,
+                max_queue=settings.LLM_MAX_QUEUE_PER_MODEL,
+                failure_threshold=settings.LLM_BREAKER_FAILURE_THRESHOLD,
+                reset_seconds=settings.LLM_BREAKER_RESET_SECONDS,
+            )
+        return gate
+
+    def get_model(self, agent_config: AgentConfig) -> GenerativeModel:
+        """Returns a cached model handle for this agent's model, instruction and generation config."""
+        return self._models.get(agent_config.model, agent_config.instruction, self.generation_config(agent_config))
+
+    @staticmethod
+    def format_message(msg: ChatMessageResponse) -> Content:
+        role = "user" if msg.sender_type == "USER" else "model"
+        # Ensure content is not None and is a string
+        text_content = msg.content if msg.content is not None else ""
+        return Content(role=role, parts=[Part.from_text(text_content)])
+
+    @staticmethod
+    def format_summary(summary: str) -> Content:
+        return Content(role="user", parts=[Part.from_text(f"Summary of the earlier conversation:\n{summary}")])
+
+    def _format_history_for_gemini(self, history: List[Union[ChatMessageResponse, Content]]) -> List[Content]:
+        # Entries may already be formatted (see chat_history_cache), those are reused as-is
+        return [msg if isinstance(msg, Content) else self.format_message(msg) for msg in history]
+
+    def _build_contents(self, conversation_history: List[Union[ChatMessageResponse, Content]], user_message_content: str) -> List[Content]:
+        contents = self._format_history_for_gemini(conversation_history)
+        contents.append(Content(role="user", parts=[Part.from_text(user_message_content)]))
+        return contents
+
+    @staticmethod
+    def preflight(agent_config: AgentConfig, contents: List[Content]) -> Dict[str, Any]:
+        """Estimates prompt size and cost locally; raises PromptTooLargeError if it cannot fit."""
+        prompt_chars = len(agent_config.instruction or "") + sum(
+            len(part.text or "") for content in contents for part in content.parts
+        )
+        return token_estimator.preflight(agent_config.model, prompt_chars, agent_config.max_output_tokens)
 
-    def _format_history_for_gemini(self, history: List[ChatMessageResponse]) -> List[Content]:
-        gemini_history: List[Content] = []
-        for msg in history:
-            role = "user" if msg.sender_type == "USER" else "model"
-            # Ensure content is not None and is a string
-            text_content = msg.content if msg.content is not None else ""
-            gemini_history.append(Content(role=role, parts=[Part.from_text(text_content)]))
-        return gemini_history
+    def stream_response(
+        self,
+        agent_config: AgentConfig,
+        conversation_history: List[Union[ChatMessageResponse, Content]],
+        user_message_content: str,
+        call_policy: Optional[CallPolicy] = None,
+    ) -> LLMResponseStream:
+        """Streams the response for a user message; iterate the result to receive text chunks.
+
+        The prompt is checked before any request is made (PromptTooLargeError). Like
+        `generate_response`, `runtime_config["fallback_model"]` is tried when the agent's
+        model is unavailable or fails before the first chunk. `call_policy` (default: the
+        agent's `runtime_config`) bounds the wait for the first chunk and between chunks.
+        """
+        if call_policy is None:
+            call_policy = parse_call_policy(agent_config.runtime_config)
+        contents = self._build_contents(conversation_history, user_message_content)
+        preflight = self.preflight(agent_config, contents)
+        logger.debug(f"Streaming from model: {agent_config.model}")
+        attempts = [(agent_config.model, self.get_model(agent_config), self.get_gate(agent_config.model))]
+        fallback_model = (agent_config.runtime_config or {}).get("fallback_model")
+        if fallback_model and fallback_model != agent_config.model:
+            fallback_config = agent_config.model_copy(update={"model": fallback_model})
+            attempts.append((fallback_model, self.get_model(fallback_config), self.get_gate(fallback_model)))
+        stream = LLMResponseStream(attempts, contents, call_policy)
+        stream.preflight = preflight
+        return stream
+
+    async def _call_model(
+        self,
+        agent_config: AgentConfig,
+        contents: List[Content],
+        call_policy: CallPolicy,
+        call_details: Dict[str, Any],
+    ) -> Any:
+        model = self.get_model(agent_config)
+        logger.debug(f"Using model: {agent_config.model}")
+        gate = self.get_gate(agent_config.model)
+        try:
+            async with gate.slot():
+                return await call_with_policy(
+                    lambda: model.generate_content_async(contents),
+                    agent_config.model,
+                    call_policy,
+                    self._latencies,
+                    self._hedge_budgets.setdefault(agent_config.model, HedgeBudget()),
+                    call_details,
+                    gate, # A hedged duplicate takes its own slot, or is skipped
+                )
+        except LLMUnavailableError:
+            raise
+        except LLMDeadlineExceeded as e:
+            logger.warning(f"LLM call to {agent_config.model} timed out: {e}")
+            raise LLMUnavailableError(agent_config.model, "timeout") from e
+        except Exception as e:
+            logger.error(f"Error during LLM call: {e}", exc_info=True)
+            raise LLMUnavailableError(agent_config.model, "error") from e
 
     async def generate_response(
         self,
         agent_config: AgentConfig,
-        conversation_history: List[ChatMessageResponse],
-        user_message_content: str
+        conversation_history: List[Union[ChatMessageResponse, Content]],
+        user_message_content: str,
+        call_policy: Optional[CallPolicy] = None,
+        call_details: Optional[Dict[str, Any]] = None,
     ) -> Tuple[str, Dict[str, int]]:
+        """Generates a reply within the agent's deadline, hedging slow calls if configured.
+
+        `call_policy` defaults to the one in `agent_config.runtime_config`; when given,
+        `call_details` receives the deadline/hedge outcome of the call and the model used.
+        Raises PromptTooLargeError before calling the model if the estimated prompt plus
+        `max_output_tokens` exceeds its context window, and LLMUnavailableError when the model
+        is overloaded, its circuit is open or the call fails (if `runtime_config["fallback_model"]`
+        is set, that model is tried first).
+        """
         if not LLMService._initialized:
             logger.error("LLMService not initialized. Call __init__ first.")
             # Attempt to initialize again, or raise a more specific error
             self.__init__() # This might be problematic if called in async context without care
             # A better approach might be a class method for initialization or ensuring it's a singleton that's init'd once.
 
+        if call_details is None:
+            call_details = {}
+        if call_policy is None:
+            call_policy = parse_call_policy(agent_config.runtime_config)
+
+        contents_for_llm = self._build_contents(conversation_history, user_message_content)
+        logger.debug(f"User message: {user_message_content}")
+        logger.debug(f"Formatted history length: {len(contents_for_llm) - 1}")
+
+        # Oversized prompts are rejected locally instead of failing remotely
+        call_details['preflight'] = self.preflight(agent_config, contents_for_llm)
+
+        # System instruction and generation config are bound to the cached model handle
+        # TODO: Map safety_settings from agent_config.security_config
+        # safety_settings = { HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_ONLY_HIGH }
         try:
-            model = GenerativeModel(agent_config.model) 
-            logger.debug(f"Using model: {agent_config.model}")
+            response = await self._call_model(agent_config, contents_for_llm, call_policy, call_details)
+        except LLMUnavailableError as e:
+            fallback_model = (agent_config.runtime_config or {}).get("fallback_model")
+            if not fallback_model or fallback_model == agent_config.model:
+                raise
+            logger.warning(f"{e} Falling back to {fallback_model}.")
+            call_details.update({'fallback_from': agent_config.model, 'unavailable_reason': e.reason})
+            agent_config = agent_config.model_copy(update={"model": fallback_model})
+            response = await self._call_model(agent_config, contents_for_llm, call_policy, call_details)
+        call_details['model'] = agent_config.model
+        logger.debug(f"LLM Raw Response: {response}")
 
-            system_instruction_part = None
-            if agent_config.instruction:
-                system_instruction_part = Part.from_text(agent_config.instruction)
-                logger.debug(f"System instruction: {agent_config.instruction[:100]}...")
+        # Extract token usage
+        token_usage = {
+            "input_tokens": 0,
+            "output_tokens": 0,
+        }
+        if response.usage_metadata:
+            token_usage["input_tokens"] = response.usage_metadata.prompt_token_count
+            token_usage["output_tokens"] = response.usage_metadata.candidates_token_count
 
-            formatted_history = self._format_history_for_gemini(conversation_history)
-            
-            contents_for_llm = formatted_history
-            contents_for_llm.append(Content(role="user", parts=[Part.from_text(user_message_content)]))
-            logger.debug(f"User message: {user_message_content}")
-            logger.debug(f"Formatted history length: {len(formatted_history)}")
-
-            generation_config_dict = {
-                "temperature": agent_config.temperature,
-                "max_output_tokens": agent_config.max_output_tokens,
-                "top_p": agent_config.top_p,
-                "top_k": agent_config.top_k,
-            }
-            logger.debug(f"Generation config: {generation_config_dict}")
-            
-            # TODO: Map safety_settings from agent_config.security_config
-            # safety_settings = { HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_ONLY_HIGH }
+        # Extract response text
+        if response.candidates and response.candidates[0].content.parts and response.candidates[0].content.parts[0].text is not None:
+            llm_text_response = response.candidates[0].content.parts[0].text
+            logger.info(f"LLM generated response: {llm_text_response[:100]}...")
+            return llm_text_response, token_usage
+        else:
+            logger.warning(f"LLM response did not contain expected text part. Full response: {response}")
+            return "Sorry, I could not generate a valid response text.", token_usage
 
-            response = await model.generate_content_async(
-                contents_for_llm,
-                generation_config=generation_config_dict,
-                system_instruction=system_instruction_part,
-            )
-            logger.debug(f"LLM Raw Response: {response}")
-
-            # Extract token usage
-            token_usage = {
-                "input_tokens": 0,
-                "output_tokens": 0,
-            }
-            if response.usage_metadata:
-                token_usage["input_tokens"] = response.usage_metadata.prompt_token_count
-                token_usage["output_tokens"] = response.usage_metadata.candidates_token_count
-
-            # Extract response text
-            if response.candidates and response.candidates[0].content.parts and response.candidates[0].content.parts[0].text is not None:
-                llm_text_response = response.candidates[0].content.parts[0].text
-                logger.info(f"LLM generated response: {llm_text_response[:100]}...")
-                return llm_text_response, token_usage
-            else:
-                logger.warning(f"LLM response did not contain expected text part. Full response: {response}")
-                return "Sorry, I could not generate a valid response text.", token_usage
-        except Exception as e:
-            logger.error(f"Error during LLM call: {e}", exc_info=True)
-            return f"Error communicating with LLM: An unexpected error occurred.", {"input_tokens": 0, "output_tokens": 0}
+
+_llm_service: Optional[LLMService] = None
+
+
+def get_llm_service() -> LLMService:
+    """FastAPI dependency returning the process-wide LLMService (created on first use)."""
+    global _llm_service
+    if _llm_service is None:
+        _llm_service = LLMService()
+    return _llm_service
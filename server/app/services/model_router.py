@@ -0,0 +1,123 @@
+"""Roteamento de cada mensagem para um modelo rápido ou forte.
+
+Cada agente fica preso a um único `model` (por padrão `gemini-1.5-pro`), inclusive em
+turnos triviais, como saudações e consultas curtas, que o `gemini-1.5-flash` responde mais
+rápido e mais barato. Com `planner_config["routing"]` habilitado, a mensagem é
+classificada localmente e vai para `fast_model` só se todas as condições valerem:
+- até `max_fast_chars` caracteres e sem blocos de código;
+- até `max_fast_history` mensagens anteriores na sessão;
+- nenhuma ferramenta do agente citada pelo nome (uso de ferramenta exige o modelo forte);
+- nenhuma palavra de `strong_keywords` (pedidos de análise, comparação, código...).
+Caso contrário, usa `strong_model` (por padrão, o `model` do agente).
+
+As ferramentas ficam na tabela de junção `agent_tools`, não na linha de `agents`: o turno
+de chat recebe os nomes em `tool_names` de `chat_begin_turn`, e a prévia de custo usa
+`fetch_tool_names`.
+
+Exemplo: {"routing": {"enabled": true, "fast_model": "gemini-1.5-flash", "max_fast_chars": 200}}
+"""
+import re
+from typing import Any, Dict, Iterable, List, Optional
+
+FAST = "fast"
+STRONG = "strong"
+
+DEFAULT_FAST_MODEL = "gemini-1.5-flash"
+DEFAULT_MAX_FAST_CHARS = 280
+DEFAULT_MAX_FAST_HISTORY = 20
+DEFAULT_STRONG_KEYWORDS = (
+    "analise", "analyze", "analyse", "compare", "explique", "explain", "passo a passo", "step by step",
+    "código", "codigo", "code", "planeje", "plan", "resuma", "summarize", "calcule", "calculate", "por que", "why",
+)
+
+_CODE_BLOCK = re.compile(r"```|^\s{4,}\S", re.MULTILINE)
+
+
+class RoutingPolicy:
+    __slots__ = ('fast_model', 'strong_model', 'max_fast_chars', 'max_fast_history', 'strong_keywords')
+
+    def __init__(
+        self,
+        fast_model: str,
+        strong_model: str,
+        max_fast_chars: int = DEFAULT_MAX_FAST_CHARS,
+        max_fast_history: int = DEFAULT_MAX_FAST_HISTORY,
+        strong_keywords: Iterable[str] = DEFAULT_STRONG_KEYWORDS,
+    ):
+        self.fast_model = fast_model
+        self.strong_model = strong_model
+        self.max_fast_chars = max_fast_chars
+        self.max_fast_history = max_fast_history
+        self.strong_keywords = tuple(keyword.lower() for keyword in strong_keywords)
+
+
+def parse_routing_policy(planner_config: Optional[Dict[str, Any]], agent_model: str) -> Optional[RoutingPolicy]:
+    """Lê `planner_config["routing"]`; retorna None se o roteamento não estiver habilitado."""
+    config = (planner_config or {}).get("routing") or {}
+    if not isinstance(config, dict):
+        raise ValueError("'planner_config.routing' deve ser um objeto.")
+    if not config.get("enabled"):
+        return None
+    keywords = config.get("strong_keywords", DEFAULT_STRONG_KEYWORDS)
+    if isinstance(keywords, str) or not all(isinstance(keyword, str) for keyword in keywords):
+        raise ValueError("'planner_config.routing.strong_keywords' deve ser uma lista de textos.")
+    try:
+        policy = RoutingPolicy(
+            fast_model=str(config.get("fast_model", DEFAULT_FAST_MODEL)),
+            strong_model=str(config.get("strong_model", agent_model)),
+            max_fast_chars=int(config.get("max_fast_chars", DEFAULT_MAX_FAST_CHARS)),
+            max_fast_history=int(config.get("max_fast_history", DEFAULT_MAX_FAST_HISTORY)),
+            strong_keywords=keywords,
+        )
+    except (TypeError, ValueError):
+        raise ValueError("'planner_config.routing' contém valores inválidos.")
+    if policy.max_fast_chars < 0 or policy.max_fast_history < 0:
+        raise ValueError("'max_fast_chars' e 'max_fast_history' não podem ser negativos.")
+    return policy
+
+
+def tool_names_from_rows(rows: Optional[Iterable[Dict[str, Any]]]) -> List[str]:
+    """Extrai os nomes de linhas `agent_tools` com a ferramenta embutida (`{"tools": {"name": ...}}`)."""
+    names = []
+    for row in rows or []:
+        tool = row.get("tools") or {}
+        if tool.get("name"):
+            names.append(tool["name"])
+    return names
+
+
+async def fetch_tool_names(db: Any, agent_id: Any) -> List[str]:
+    """Nomes das ferramentas associadas ao agente, em uma única consulta."""
+    response = await db.table('agent_tools').select('tools(name)').eq('agent_id', str(agent_id)).execute()
+    return tool_names_from_rows(response.data)
+
+
+def _mentions(text: str, phrase: str) -> bool:
+    return re.search(r"(?<!\w)" + re.escape(phrase) + r"(?!\w)", text) is not None
+
+
+def route_message(
+    policy: RoutingPolicy,
+    message: str,
+    history_depth: int,
+    tool_names: Iterable[str] = (),
+) -> Dict[str, Any]:
+    """Classifica a mensagem e retorna `{tier, model, reasons}`; `reasons` explica a escolha do modelo forte."""
+    text = message.lower()
+    reasons: List[str] = []
+    if len(message) > policy.max_fast_chars:
+        reasons.append("long_message")
+    if _CODE_BLOCK.search(message):
+        reasons.append("code_block")
+    if history_depth > policy.max_fast_history:
+        reasons.append("deep_history")
+    if any(name and _mentions(text, name.lower()) for name in tool_names):
+        reasons.append("tool_mention")
+    if any(_mentions(text, keyword) for keyword in policy.strong_keywords):
+        reasons.append("strong_keyword")
+    tier = STRONG if reasons else FAST
+    return {
+        'tier': tier,
+        'model': policy.strong_model if reasons else policy.fast_model,
+        'reasons': reasons,
+    }
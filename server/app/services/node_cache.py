@@ -0,0 +1,94 @@
+"""Cache de resultados de nós llmAgent endereçado por conteúdo.
+
+A chave é um hash estável de (tipo do nó, instrução, parâmetros de geração, entrada
+canonicalizada), de modo que execuções repetidas com os mesmos dados reaproveitam o
+resultado sem chamar o LLM de novo. Nós podem optar por não usar o cache com
+`"cache": false` em `node.data` (ex.: nós com temperatura alta).
+"""
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from ..config import settings
+
+# Campos de `node.data` que alteram a resposta do modelo e, portanto, fazem parte da chave
+GENERATION_PARAM_KEYS = ("model", "temperature", "max_output_tokens", "top_p", "top_k")
+
+
+def _canonical_json(value: Any) -> str:
+    return json.dumps(value, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+
+
+def extract_generation_params(node_data: Dict[str, Any]) -> Dict[str, Any]:
+    return {key: node_data[key] for key in GENERATION_PARAM_KEYS if key in node_data}
+
+
+def is_cacheable(node_data: Dict[str, Any]) -> bool:
+    return node_data.get("cache", True) is not False
+
+
+def node_cache_prefix(node_type: str, instruction: Optional[str], generation_params: Dict[str, Any]) -> str:
+    """Parte estática da chave, calculada uma vez na compilação do workflow."""
+    return _canonical_json([node_type, instruction, generation_params])
+
+
+def make_node_cache_key(prefix: str, input_data: Any) -> str:
+    payload = prefix + _canonical_json(input_data)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def fingerprint(value: Any) -> str:
+    """Hash estável de um valor JSON-serializável (independe da ordem das chaves)."""
+    return hashlib.sha256(_canonical_json(value).encode("utf-8")).hexdigest()
+
+
+class NodeResultCache:
+    """Cache LRU com expiração (TTL) para saídas de nós."""
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 3600, clock: Callable[[], float] = time.monotonic):
+        if max_entries < 1:
+            raise ValueError("max_entries deve ser maior ou igual a 1.")
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        """Retorna `(True, valor)` em caso de acerto ou `(False, None)` caso contrário."""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return False, None
+        expires_at, value = entry
+        if expires_at <= self._clock():
+            del self._entries[key]
+            self.misses += 1
+            return False, None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return True, value
+
+    def set(self, key: str, value: Any) -> None:
+        self._entries[key] = (self._clock() + self.ttl_seconds, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+# Instância compartilhada pelas rotas de workflow
+node_result_cache = NodeResultCache(
+    max_entries=settings.WORKFLOW_NODE_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.WORKFLOW_NODE_CACHE_TTL_SECONDS,
+)
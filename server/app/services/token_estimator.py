@@ -0,0 +1,140 @@
+"""Estimativa local de tokens para checagem prévia de tamanho e custo do prompt.
+
+Os tokens só são conhecidos depois da chamada (`usage_metadata`), tarde demais para recusar
+um prompt que não cabe no contexto ou mostrar o custo antes de gastar. A estimativa aqui
+é O(1): só depende do número de caracteres do prompt, dividido pelos caracteres por token
+da família do modelo (`gemini-1.5-flash-002` -> `gemini-1.5`).
+
+A razão de cada família é calibrada com as linhas de `usage_metrics`: cada chamada grava
+`prompt_chars` em `details.llm_call.preflight`, e a razão aprendida é a mediana de
+`prompt_chars / input_tokens`. Famílias com menos de `MIN_CALIBRATION_SAMPLES` amostras
+usam `DEFAULT_CHARS_PER_TOKEN`. A recalibração roda em segundo plano
+(`run_refresh_loop`, iniciada no startup da app); as requisições só leem a razão em memória.
+"""
+import asyncio
+import math
+import re
+import statistics
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+
+from .llm_pricing import calculate_cost
+from .usage_metrics import fetch_usage_rows
+
+# Janela de contexto (tokens de entrada + saída) por modelo
+MODEL_CONTEXT_LIMITS: Dict[str, int] = {
+    "gemini-1.5-pro": 2_097_152,
+    "gemini-1.5-flash": 1_048_576,
+    "gemini-1.0-pro": 32_760,
+}
+DEFAULT_CONTEXT_LIMIT = 32_760
+
+DEFAULT_CHARS_PER_TOKEN = 4.0
+MIN_CALIBRATION_SAMPLES = 20
+
+_FAMILY_PATTERN = re.compile(r"^([a-z]+-\d+(?:\.\d+)?)")
+
+
+def model_family(model_name: str) -> str:
+    match = _FAMILY_PATTERN.match(model_name)
+    return match.group(1) if match else model_name
+
+
+def context_limit(model_name: str) -> int:
+    if model_name in MODEL_CONTEXT_LIMITS:
+        return MODEL_CONTEXT_LIMITS[model_name]
+    # Versões fixadas (`gemini-1.5-flash-002`) herdam o limite do modelo base
+    for base, limit in MODEL_CONTEXT_LIMITS.items():
+        if model_name.startswith(base):
+            return limit
+    return DEFAULT_CONTEXT_LIMIT
+
+
+class PromptTooLargeError(ValueError):
+    """O prompt estimado mais `max_output_tokens` não cabe na janela de contexto do modelo."""
+
+    def __init__(self, model: str, estimated_tokens: int, max_output_tokens: int, limit: int):
+        super().__init__(
+            f"Prompt estimado em {estimated_tokens} tokens (+{max_output_tokens} de saída) "
+            f"excede o contexto de {limit} tokens do modelo '{model}'."
+        )
+        self.model = model
+        self.estimated_tokens = estimated_tokens
+        self.max_output_tokens = max_output_tokens
+        self.limit = limit
+
+
+def learn_chars_per_token(rows: Iterable[Dict[str, Any]]) -> Dict[str, float]:
+    """Mediana de `prompt_chars / input_tokens` por família, a partir de linhas de usage_metrics."""
+    ratios: Dict[str, List[float]] = {}
+    for row in rows:
+        model, input_tokens = row.get('model_name'), row.get('input_tokens')
+        preflight = ((row.get('details') or {}).get('llm_call') or {}).get('preflight') or {}
+        prompt_chars = preflight.get('prompt_chars')
+        if model and input_tokens and isinstance(prompt_chars, (int, float)) and prompt_chars > 0:
+            ratios.setdefault(model_family(model), []).append(prompt_chars / input_tokens)
+    return {
+        family: statistics.median(values)
+        for family, values in ratios.items()
+        if len(values) >= MIN_CALIBRATION_SAMPLES
+    }
+
+
+class TokenEstimator:
+    """Estimativas calibradas por família; `run_refresh_loop` recalibra a cada `ttl_seconds`."""
+
+    def __init__(
+        self,
+        chars_per_token: Optional[Dict[str, float]] = None,
+        ttl_seconds: float = 600,
+        fetch_rows: Callable[[], Awaitable[List[Dict[str, Any]]]] = fetch_usage_rows,
+    ):
+        self._chars_per_token: Dict[str, float] = dict(chars_per_token or {})
+        self.ttl_seconds = ttl_seconds
+        self._fetch_rows = fetch_rows
+
+    async def refresh(self) -> None:
+        try:
+            self._chars_per_token.update(learn_chars_per_token(await self._fetch_rows()))
+        except Exception as e:
+            # Sem histórico, a estimativa segue com a razão padrão
+            print(f"[TokenEstimator] Não foi possível calibrar com usage_metrics: {e}")
+
+    async def run_refresh_loop(self) -> None:
+        """Recalibra agora e depois a cada `ttl_seconds`, até a tarefa ser cancelada."""
+        while True:
+            await self.refresh()
+            await asyncio.sleep(self.ttl_seconds)
+
+    def chars_per_token(self, model_name: str) -> float:
+        return self._chars_per_token.get(model_family(model_name), DEFAULT_CHARS_PER_TOKEN)
+
+    def estimate(self, model_name: str, prompt_chars: int) -> int:
+        return math.ceil(prompt_chars / self.chars_per_token(model_name))
+
+    def estimate_prompt(self, model_name: str, prompt_chars: int, max_output_tokens: Optional[int]) -> Dict[str, Any]:
+        """Tokens estimados, limite de contexto e faixa de custo (sem saída até `max_output_tokens`)."""
+        estimated_tokens = self.estimate(model_name, prompt_chars)
+        max_output_tokens = max_output_tokens or 0
+        limit = context_limit(model_name)
+        return {
+            'prompt_chars': prompt_chars,
+            'estimated_input_tokens': estimated_tokens,
+            'max_output_tokens': max_output_tokens,
+            'context_limit': limit,
+            'fits_context': estimated_tokens + max_output_tokens <= limit,
+            'estimated_min_cost': calculate_cost(model_name, estimated_tokens, 0),
+            'estimated_max_cost': calculate_cost(model_name, estimated_tokens, max_output_tokens),
+        }
+
+    def preflight(self, model_name: str, prompt_chars: int, max_output_tokens: Optional[int]) -> Dict[str, Any]:
+        """Como `estimate_prompt`, mas levanta PromptTooLargeError se o prompt não couber."""
+        estimate = self.estimate_prompt(model_name, prompt_chars, max_output_tokens)
+        if not estimate['fits_context']:
+            raise PromptTooLargeError(
+                model_name, estimate['estimated_input_tokens'], estimate['max_output_tokens'], estimate['context_limit']
+            )
+        return estimate
+
+
+# Instância compartilhada pelo LLMService e pela prévia de custo das rotas de chat
+token_estimator = TokenEstimator()
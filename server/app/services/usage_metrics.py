@@ -0,0 +1,26 @@
+"""Leitura das linhas recentes de `usage_metrics` usadas para calibrar estimativas.
+
+Compartilhada pelo estimador de workflows (`workflow_estimator`) e pelo estimador de
+tokens do chat (`token_estimator`), sem que um dependa do outro.
+"""
+from typing import Any, Dict, List
+
+# Linhas recentes de usage_metrics consideradas no aprendizado
+USAGE_SAMPLE_SIZE = 5000
+
+
+async def fetch_usage_rows() -> List[Dict[str, Any]]:
+    # Importação tardia: o cliente Supabase exige variáveis de ambiente na importação
+    from ..supabase_client import supabase_service_client
+
+    if supabase_service_client is None:
+        return []
+    response = await (
+        supabase_service_client.table('usage_metrics')
+        .select('model_name,input_tokens,output_tokens,details')
+        .eq('event_type', 'chat_completion')
+        .order('created_at', desc=True)
+        .limit(USAGE_SAMPLE_SIZE)
+        .execute()
+    )
+    return response.data or []
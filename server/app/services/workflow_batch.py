@@ -0,0 +1,93 @@
+"""Execução de um workflow sobre um conjunto de registros (NDJSON).
+
+Cada linha não vazia da entrada é um objeto JSON usado como `initial_data` de uma
+execução independente. No máximo `concurrency` registros ficam em execução ao mesmo
+tempo e os resultados são produzidos à medida que terminam (não na ordem de entrada),
+cada um identificado pelo índice do registro (linhas em branco são ignoradas). Um
+registro inválido ou com falha gera um resultado de erro sem interromper os demais.
+
+A entrada pode ser um iterável ou um iterável assíncrono de linhas; `read_lines` lê um
+arquivo (o spool do corpo da requisição) em blocos numa thread, sem bloquear o event loop.
+"""
+import asyncio
+import json
+from typing import IO, Any, AsyncIterable, AsyncIterator, Dict, Iterable, Set, Union
+
+from . import execution_engine
+from .workflow_compiler import CompiledWorkflow
+
+
+# Bytes aproximados lidos do arquivo por ida ao executor
+READ_HINT_BYTES = 1024 * 1024
+
+
+async def read_lines(file: IO[bytes], hint: int = READ_HINT_BYTES) -> AsyncIterator[bytes]:
+    """Produz as linhas de `file`, lidas em blocos de ~`hint` bytes fora do event loop."""
+    loop = asyncio.get_running_loop()
+    while True:
+        lines = await loop.run_in_executor(None, file.readlines, hint)
+        if not lines:
+            return
+        for line in lines:
+            yield line
+
+
+async def _aiter_lines(lines: Union[Iterable[bytes], AsyncIterable[bytes]]) -> AsyncIterator[bytes]:
+    if hasattr(lines, "__aiter__"):
+        async for line in lines:
+            yield line
+    else:
+        for line in lines:
+            yield line
+
+
+def _error_result(index: int, error: str) -> Dict[str, Any]:
+    return {"index": index, "status": "error", "error": error}
+
+
+async def _run_record(plan: CompiledWorkflow, index: int, line: bytes, engine_options: Dict[str, Any]) -> Dict[str, Any]:
+    try:
+        initial_data = json.loads(line)
+    except ValueError as e:
+        return _error_result(index, f"JSON inválido: {e}")
+    if not isinstance(initial_data, dict):
+        return _error_result(index, "Cada registro deve ser um objeto JSON.")
+    try:
+        outputs = await execution_engine.run_compiled_workflow(plan, initial_data, **engine_options)
+    except Exception as e:
+        return _error_result(index, str(e) or type(e).__name__)
+    return {"index": index, "status": "ok", "final_outputs": outputs}
+
+
+async def run_batch(
+    plan: CompiledWorkflow,
+    lines: Union[Iterable[bytes], AsyncIterable[bytes]],
+    concurrency: int,
+    **engine_options: Any,
+) -> AsyncIterator[Dict[str, Any]]:
+    """Executa o plano para cada registro de `lines`, produzindo os resultados conforme concluem.
+
+    `engine_options` são repassados a `run_compiled_workflow` em cada registro.
+    """
+    if concurrency < 1:
+        raise ValueError("concurrency deve ser maior ou igual a 1.")
+    pending: Set[asyncio.Task] = set()
+    index = -1
+    try:
+        async for line in _aiter_lines(lines):
+            if not line.strip():
+                continue
+            index += 1
+            if len(pending) >= concurrency:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield task.result()
+            pending.add(asyncio.create_task(_run_record(plan, index, line, engine_options)))
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield task.result()
+    finally:
+        # Consumidor desistiu (ex.: cliente desconectou): não deixa execuções órfãs
+        for task in pending:
+            task.cancel()
@@ -0,0 +1,90 @@
+"""Checkpoints de saída por nó para retomar execuções de workflow.
+
+Cada nó concluído grava sua saída sob (run_id, chave do nó). Ao retomar um run, o motor
+consulta o checkpoint antes de executar cada nó e reaproveita a saída gravada, de modo
+que apenas o nó que falhou (e o que vem depois dele) é executado de novo.
+
+A chave do nó é o id do nó prefixado pelo escopo de loop em que ele roda
+(ex.: `refinar#2/revisor`), já que um mesmo nó executa uma vez por iteração.
+
+`CheckpointStore` mantém os checkpoints em memória (testes e execuções locais);
+`PersistentCheckpointStore` grava na tabela `workflow_checkpoints` do `WorkflowStore`,
+de modo que um run possa ser retomado por outro worker ou após um reinício.
+`load` e `save` são corrotinas para que o acesso ao banco rode fora do event loop.
+"""
+import asyncio
+import json
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from .workflow_store import WorkflowStore, get_workflow_store
+
+
+class CheckpointStore:
+    """Armazenamento em memória, restrito ao processo atual."""
+
+    def __init__(self):
+        self._checkpoints: Dict[str, Dict[str, Any]] = {}
+
+    async def load(self, run_id: str, node_key: str) -> Tuple[bool, Any]:
+        """Retorna `(True, saída)` se o nó já foi concluído neste run, senão `(False, None)`."""
+        run_checkpoints = self._checkpoints.get(run_id)
+        if run_checkpoints is None or node_key not in run_checkpoints:
+            return False, None
+        return True, run_checkpoints[node_key]
+
+    async def save(self, run_id: str, node_key: str, output: Any) -> None:
+        self._checkpoints.setdefault(run_id, {})[node_key] = output
+
+    def count(self, run_id: str) -> int:
+        return len(self._checkpoints.get(run_id, {}))
+
+    def clear(self, run_id: str) -> None:
+        self._checkpoints.pop(run_id, None)
+
+
+class PersistentCheckpointStore(CheckpointStore):
+    """Checkpoints na tabela `workflow_checkpoints`, chaveados por `(run_id, node_key)`.
+
+    O store é resolvido no primeiro uso (padrão: `get_workflow_store`). Saídas que não
+    são serializáveis em JSON não geram checkpoint: o nó é executado de novo ao retomar.
+    """
+
+    def __init__(self, store_factory: Callable[[], WorkflowStore] = get_workflow_store):
+        self._store_factory = store_factory
+        self._store: Optional[WorkflowStore] = None
+
+    @property
+    def store(self) -> WorkflowStore:
+        if self._store is None:
+            self._store = self._store_factory()
+        return self._store
+
+    async def load(self, run_id: str, node_key: str) -> Tuple[bool, Any]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.store.load_checkpoint, run_id, node_key)
+
+    async def save(self, run_id: str, node_key: str, output: Any) -> None:
+        try:
+            output_json = json.dumps(output, ensure_ascii=False)
+        except (TypeError, ValueError) as e:
+            print(f"[Checkpoints] WARN: Saída do nó '{node_key}' não é serializável em JSON; checkpoint ignorado ({e}).")
+            return
+        loop = asyncio.get_running_loop()
+        created_at = datetime.utcnow().isoformat() + "Z"
+        await loop.run_in_executor(None, self.store.save_checkpoint, run_id, node_key, output_json, created_at)
+
+    def count(self, run_id: str) -> int:
+        return self.store.count_checkpoints(run_id)
+
+    def clear(self, run_id: str) -> None:
+        """Apaga os checkpoints do run; dentro do event loop o DELETE roda em uma thread."""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.store.clear_checkpoints(run_id)
+            return
+        loop.run_in_executor(None, self.store.clear_checkpoints, run_id)
+
+
+checkpoint_store = PersistentCheckpointStore()
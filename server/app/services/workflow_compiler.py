@@ -0,0 +1,286 @@
+"""Compila árvores de workflow em planos de execução planos e indexados.
+
+A árvore Pydantic (`WorkflowNode`) é percorrida uma única vez, em largura, e cada nó
+recebe um índice inteiro. Como os filhos de um nó são numerados em sequência, eles
+ocupam um intervalo contíguo `[child_start[i], child_start[i] + child_count[i])`, o que
+permite ao motor navegar o plano apenas com listas, sem recursão nem acesso a atributos
+Pydantic durante a execução.
+"""
+import threading
+from collections import OrderedDict, deque
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from ..config import settings
+from ..models.workflow import WorkflowNode, WorkflowStored
+from .code_executor_pool import CodeExecutorLimits, parse_code_executor_config
+from .node_cache import extract_generation_params, is_cacheable, node_cache_prefix
+
+# Opcodes resolvidos em tempo de compilação a partir de `node.type`
+OP_PASSTHROUGH = 0
+OP_LLM = 1
+OP_SEQUENTIAL = 2
+OP_PARALLEL = 3
+OP_LOOP = 4
+OP_CODE = 5
+
+NODE_OPCODES: Dict[str, int] = {
+    'llmAgent': OP_LLM,
+    'sequentialAgent': OP_SEQUENTIAL,
+    'parallelAgent': OP_PARALLEL,
+    'loopAgent': OP_LOOP,
+    'codeExecutor': OP_CODE,
+}
+
+DEFAULT_INSTRUCTION = 'Nenhuma instrução fornecida.'
+
+
+class WorkflowCompileError(ValueError):
+    """A árvore do workflow não pode ser transformada em um plano executável."""
+
+
+# Operadores aceitos em `stop_condition` de um loopAgent
+_STOP_OPERATORS: Dict[str, Callable[[Any, Any], bool]] = {
+    'equals': lambda actual, expected: actual == expected,
+    'not_equals': lambda actual, expected: actual != expected,
+    'contains': lambda actual, expected: actual is not None and expected in actual,
+    'not_contains': lambda actual, expected: actual is not None and expected not in actual,
+    'gte': lambda actual, expected: actual is not None and actual >= expected,
+    'lte': lambda actual, expected: actual is not None and actual <= expected,
+    'exists': lambda actual, expected: actual is not None,
+}
+
+_MISSING = object()
+
+
+class LoopPolicy:
+    """Critérios de parada antecipada de um loopAgent, além do limite de iterações.
+
+    Configurados em `node.data`:
+    - `convergence: "unchanged"`: para quando a saída de uma iteração é igual à anterior;
+    - `stop_condition: {"field": "result.score", "operator": "gte", "value": 0.9}`:
+      para quando o predicado é verdadeiro para a saída (`field` é opcional);
+    - `max_wall_time_seconds`: não inicia novas iterações depois desse tempo.
+    """
+
+    __slots__ = ('until_unchanged', 'stop_condition', 'max_wall_time')
+
+    def __init__(
+        self,
+        until_unchanged: bool = False,
+        stop_condition: Optional[Callable[[Any], bool]] = None,
+        max_wall_time: Optional[float] = None,
+    ):
+        self.until_unchanged = until_unchanged
+        self.stop_condition = stop_condition
+        self.max_wall_time = max_wall_time
+
+
+def _resolve_field(value: Any, path: Optional[str]) -> Any:
+    if not path:
+        return value
+    for key in path.split('.'):
+        if isinstance(value, dict):
+            value = value.get(key, _MISSING)
+        elif isinstance(value, list) and key.isdigit() and int(key) < len(value):
+            value = value[int(key)]
+        else:
+            value = _MISSING
+        if value is _MISSING:
+            return None
+    return value
+
+
+def _build_stop_condition(node: WorkflowNode, spec: Any) -> Callable[[Any], bool]:
+    if not isinstance(spec, dict) or spec.get('operator', 'equals') not in _STOP_OPERATORS:
+        raise WorkflowCompileError(
+            f"Nó '{node.id}': 'stop_condition' inválido; operadores aceitos: {', '.join(_STOP_OPERATORS)}."
+        )
+    compare = _STOP_OPERATORS[spec.get('operator', 'equals')]
+    field, expected = spec.get('field'), spec.get('value')
+
+    def condition(output: Any) -> bool:
+        try:
+            return bool(compare(_resolve_field(output, field), expected))
+        except TypeError:
+            return False # Tipos incomparáveis nunca satisfazem a condição
+
+    return condition
+
+
+def _parse_loop_policy(node: WorkflowNode) -> Optional[LoopPolicy]:
+    convergence = node.data.get('convergence')
+    if convergence not in (None, 'unchanged'):
+        raise WorkflowCompileError(f"Nó '{node.id}': 'convergence' deve ser 'unchanged'.")
+    stop_spec = node.data.get('stop_condition')
+    max_wall_time = node.data.get('max_wall_time_seconds')
+    if max_wall_time is not None:
+        try:
+            max_wall_time = float(max_wall_time)
+        except (TypeError, ValueError):
+            raise WorkflowCompileError(f"Nó '{node.id}': 'max_wall_time_seconds' inválido.")
+    if convergence is None and stop_spec is None and max_wall_time is None:
+        return None
+    return LoopPolicy(
+        until_unchanged=convergence == 'unchanged',
+        stop_condition=_build_stop_condition(node, stop_spec) if stop_spec is not None else None,
+        max_wall_time=max_wall_time,
+    )
+
+
+class CompiledWorkflow:
+    """Plano de execução plano: cada atributo é uma lista indexada pelo índice do nó."""
+
+    __slots__ = (
+        'workflow_id', 'root_count', 'node_ids', 'node_types', 'opcodes',
+        'child_start', 'child_count', 'iterations', 'loop_policies', 'instructions', 'generation_params',
+        'cache_prefixes', 'code_limits', 'node_data',
+    )
+
+    def __init__(self, workflow_id: Optional[str] = None):
+        self.workflow_id = workflow_id
+        self.root_count = 0 # As raízes ocupam os índices 0..root_count-1
+        self.node_ids: List[str] = []
+        self.node_types: List[str] = []
+        self.opcodes: List[int] = []
+        self.child_start: List[int] = []
+        self.child_count: List[int] = []
+        self.iterations: List[int] = []
+        self.loop_policies: List[Optional[LoopPolicy]] = []
+        self.instructions: List[Optional[str]] = []
+        # Parâmetros de geração (modelo, temperatura...) repassados ao backend de LLM
+        self.generation_params: List[Optional[Dict[str, Any]]] = []
+        # Prefixo da chave do cache de resultados; None para nós que não usam cache
+        self.cache_prefixes: List[Optional[str]] = []
+        # Limites de CPU/memória/tempo dos nós codeExecutor; None para os demais
+        self.code_limits: List[Optional[CodeExecutorLimits]] = []
+        self.node_data: List[Dict[str, Any]] = []
+
+    def __len__(self) -> int:
+        return len(self.opcodes)
+
+    def children(self, index: int) -> range:
+        start = self.child_start[index]
+        return range(start, start + self.child_count[index])
+
+
+def _parse_iterations(node: WorkflowNode) -> int:
+    try:
+        iterations = int(node.data.get('iterations', 1))
+    except (TypeError, ValueError):
+        raise WorkflowCompileError(
+            f"Nó '{node.id}': 'iterations' inválido ({node.data.get('iterations')!r})."
+        )
+    if iterations < 0:
+        raise WorkflowCompileError(f"Nó '{node.id}': 'iterations' não pode ser negativo.")
+    return iterations
+
+
+def _parse_code_node(node: WorkflowNode) -> CodeExecutorLimits:
+    if not settings.CODE_EXECUTOR_ENABLED:
+        raise WorkflowCompileError(
+            f"Nó '{node.id}': codeExecutor está desabilitado neste servidor (CODE_EXECUTOR_ENABLED)."
+        )
+    code = node.data.get('code')
+    if not isinstance(code, str) or not code.strip():
+        raise WorkflowCompileError(f"Nó '{node.id}': codeExecutor precisa de 'code'.")
+    try:
+        compile(code, f"<{node.id}>", "exec")
+    except SyntaxError as e:
+        raise WorkflowCompileError(f"Nó '{node.id}': erro de sintaxe no código (linha {e.lineno}).")
+    try:
+        return parse_code_executor_config(node.data.get('code_executor_config'))
+    except ValueError as e:
+        raise WorkflowCompileError(f"Nó '{node.id}': {e}")
+
+
+def compile_workflow(workflow_tree: List[WorkflowNode], workflow_id: Optional[str] = None) -> CompiledWorkflow:
+    """Converte a árvore em um `CompiledWorkflow` percorrendo-a iterativamente (BFS)."""
+    plan = CompiledWorkflow(workflow_id)
+    plan.root_count = len(workflow_tree)
+    queue = deque(workflow_tree)
+    next_index = len(workflow_tree)
+    seen_ids = set()
+
+    while queue:
+        node = queue.popleft()
+        # Checkpoints e versionamento identificam os nós pelo id
+        if node.id in seen_ids:
+            raise WorkflowCompileError(f"ID de nó duplicado: '{node.id}'. Os IDs devem ser únicos no workflow.")
+        seen_ids.add(node.id)
+        opcode = NODE_OPCODES.get(node.type, OP_PASSTHROUGH)
+        children = node.children
+
+        plan.node_ids.append(node.id)
+        plan.node_types.append(node.type)
+        plan.opcodes.append(opcode)
+        plan.node_data.append(node.data)
+        if opcode == OP_LLM:
+            instruction = node.data.get('instruction', DEFAULT_INSTRUCTION)
+            generation_params = extract_generation_params(node.data)
+            plan.instructions.append(instruction)
+            plan.generation_params.append(generation_params)
+            plan.cache_prefixes.append(
+                node_cache_prefix(node.type, instruction, generation_params)
+                if is_cacheable(node.data) else None
+            )
+        else:
+            plan.instructions.append(None)
+            plan.generation_params.append(None)
+            plan.cache_prefixes.append(None)
+
+        plan.code_limits.append(_parse_code_node(node) if opcode == OP_CODE else None)
+
+        if opcode == OP_LOOP:
+            if not children:
+                raise WorkflowCompileError(f"LoopAgent '{node.id}' precisa de um nó filho.")
+            plan.iterations.append(_parse_iterations(node))
+            plan.loop_policies.append(_parse_loop_policy(node))
+            children = children[:1] # Apenas o primeiro filho é repetido
+        else:
+            plan.iterations.append(0)
+            plan.loop_policies.append(None)
+
+        if opcode in (OP_PASSTHROUGH, OP_CODE):
+            children = [] # Nós desconhecidos apenas repassam a entrada; codeExecutor é folha
+
+        plan.child_start.append(next_index)
+        plan.child_count.append(len(children))
+        next_index += len(children)
+        queue.extend(children)
+
+    return plan
+
+
+# --- Cache de planos por workflow ---
+
+# workflow_id -> (árvore de origem, plano), LRU com até `WORKFLOW_COMPILED_CACHE_SIZE`
+# entradas. A referência à árvore permite detectar quando o workflow armazenado foi
+# substituído e o plano precisa ser recompilado.
+_compiled_cache: "OrderedDict[str, Tuple[List[WorkflowNode], CompiledWorkflow]]" = OrderedDict()
+_compiled_cache_lock = threading.Lock()
+
+
+def compile_and_cache(workflow: WorkflowStored) -> CompiledWorkflow:
+    """Compila o workflow e guarda o plano no cache, substituindo versões anteriores."""
+    plan = compile_workflow(workflow.workflow_tree, workflow.id)
+    with _compiled_cache_lock:
+        _compiled_cache[workflow.id] = (workflow.workflow_tree, plan)
+        _compiled_cache.move_to_end(workflow.id)
+        while len(_compiled_cache) > settings.WORKFLOW_COMPILED_CACHE_SIZE:
+            _compiled_cache.popitem(last=False)
+    return plan
+
+
+def get_compiled_workflow(workflow: WorkflowStored) -> CompiledWorkflow:
+    """Retorna o plano em cache para o workflow, recompilando se ele mudou."""
+    with _compiled_cache_lock:
+        cached = _compiled_cache.get(workflow.id)
+        if cached is not None and cached[0] is workflow.workflow_tree:
+            _compiled_cache.move_to_end(workflow.id)
+            return cached[1]
+    return compile_and_cache(workflow)
+
+
+def invalidate_compiled_workflow(workflow_id: str) -> None:
+    with _compiled_cache_lock:
+        _compiled_cache.pop(workflow_id, None)
@@ -0,0 +1,165 @@
+"""Estimativa estática de latência e custo de um workflow, sem executá-lo.
+
+O plano compilado é percorrido de trás para frente (na numeração em largura os filhos
+sempre vêm depois do pai): sequentialAgent soma a latência dos filhos, parallelAgent
+usa o maior filho e loopAgent multiplica o filho pelo número máximo de iterações — a
+estimativa é, portanto, um limite superior para loops com parada antecipada.
+
+Latência e tokens por chamada vêm de estatísticas por modelo aprendidas com a tabela
+`usage_metrics` (ver `ModelStatsProvider`); modelos sem histórico usam valores padrão.
+"""
+import math
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from ..config import settings
+from .llm_pricing import calculate_cost
+from .usage_metrics import fetch_usage_rows
+from .workflow_compiler import OP_LLM, OP_LOOP, OP_PARALLEL, OP_SEQUENTIAL, CompiledWorkflow
+
+# Valores usados para modelos sem histórico em usage_metrics
+DEFAULT_LATENCY_MS = 1000.0
+DEFAULT_INPUT_TOKENS = 500.0
+DEFAULT_OUTPUT_TOKENS = 250.0
+
+
+class ModelStats:
+    """Latência (p50/p90) e tokens médios por chamada de um modelo."""
+
+    __slots__ = ('latency_p50_ms', 'latency_p90_ms', 'input_tokens', 'output_tokens', 'samples')
+
+    def __init__(
+        self,
+        latency_p50_ms: float = DEFAULT_LATENCY_MS,
+        latency_p90_ms: float = DEFAULT_LATENCY_MS,
+        input_tokens: float = DEFAULT_INPUT_TOKENS,
+        output_tokens: float = DEFAULT_OUTPUT_TOKENS,
+        samples: int = 0,
+    ):
+        self.latency_p50_ms = latency_p50_ms
+        self.latency_p90_ms = latency_p90_ms
+        self.input_tokens = input_tokens
+        self.output_tokens = output_tokens
+        self.samples = samples # 0 indica valores padrão
+
+
+def _percentile(values: List[float], percentile: float) -> float:
+    ordered = sorted(values)
+    rank = max(0, math.ceil(percentile / 100 * len(ordered)) - 1) # Nearest-rank
+    return ordered[rank]
+
+
+def learn_model_stats(rows: Iterable[Dict[str, Any]]) -> Dict[str, ModelStats]:
+    """Agrega linhas de `usage_metrics` (model_name, tokens, details.latency_ms) por modelo."""
+    grouped: Dict[str, Dict[str, List[float]]] = {}
+    for row in rows:
+        model = row.get('model_name')
+        if not model:
+            continue
+        bucket = grouped.setdefault(model, {'latency': [], 'input': [], 'output': []})
+        bucket['input'].append(row.get('input_tokens') or 0)
+        bucket['output'].append(row.get('output_tokens') or 0)
+        latency = (row.get('details') or {}).get('latency_ms')
+        if isinstance(latency, (int, float)) and latency >= 0:
+            bucket['latency'].append(float(latency))
+
+    stats: Dict[str, ModelStats] = {}
+    for model, bucket in grouped.items():
+        latencies = bucket['latency']
+        stats[model] = ModelStats(
+            latency_p50_ms=_percentile(latencies, 50) if latencies else DEFAULT_LATENCY_MS,
+            latency_p90_ms=_percentile(latencies, 90) if latencies else DEFAULT_LATENCY_MS,
+            input_tokens=sum(bucket['input']) / len(bucket['input']),
+            output_tokens=sum(bucket['output']) / len(bucket['output']),
+            samples=len(bucket['input']),
+        )
+    return stats
+
+
+class ModelStatsProvider:
+    """Mantém as estatísticas aprendidas em memória, recarregando-as após `ttl_seconds`."""
+
+    def __init__(self, ttl_seconds: float = 300, fetch_rows: Callable[[], Any] = fetch_usage_rows):
+        self.ttl_seconds = ttl_seconds
+        self._fetch_rows = fetch_rows
+        self._stats: Dict[str, ModelStats] = {}
+        self._loaded_at: Optional[float] = None
+
+    async def get(self) -> Dict[str, ModelStats]:
+        if self._loaded_at is None or time.monotonic() - self._loaded_at >= self.ttl_seconds:
+            try:
+                self._stats = learn_model_stats(await self._fetch_rows())
+            except Exception as e:
+                # Sem acesso ao histórico, a estimativa segue com os valores padrão
+                print(f"[Estimator] Não foi possível carregar usage_metrics: {e}")
+            self._loaded_at = time.monotonic()
+        return self._stats
+
+
+def estimate_workflow(
+    plan: CompiledWorkflow,
+    model_stats: Dict[str, ModelStats],
+    latency_budget_ms: Optional[float] = None,
+    latency_percentile: int = 50,
+) -> Dict[str, Any]:
+    """Calcula latência do caminho crítico, chamadas de LLM, tokens e custo estimados."""
+    size = len(plan)
+    # Quantas vezes cada nó executa: o produto das iterações dos loops acima dele
+    runs = [1] * size
+    for node in range(size):
+        if plan.opcodes[node] == OP_LOOP:
+            for child in plan.children(node):
+                runs[child] = runs[node] * plan.iterations[node]
+        else:
+            for child in plan.children(node):
+                runs[child] = runs[node]
+
+    latency = [0.0] * size
+    models: Dict[str, Dict[str, Any]] = {}
+    for node in reversed(range(size)):
+        opcode = plan.opcodes[node]
+        if opcode == OP_LLM:
+            params = plan.generation_params[node] or {}
+            model = params.get('model') or settings.WORKFLOW_LLM_DEFAULT_MODEL
+            stats = model_stats.get(model) or ModelStats()
+            output_tokens = stats.output_tokens
+            if params.get('max_output_tokens'):
+                output_tokens = min(output_tokens, params['max_output_tokens'])
+            latency[node] = stats.latency_p90_ms if latency_percentile == 90 else stats.latency_p50_ms
+
+            entry = models.setdefault(model, {
+                'llm_calls': 0, 'input_tokens': 0.0, 'output_tokens': 0.0,
+                'estimated_cost': 0.0, 'stats_samples': stats.samples,
+            })
+            entry['llm_calls'] += runs[node]
+            entry['input_tokens'] += runs[node] * stats.input_tokens
+            entry['output_tokens'] += runs[node] * output_tokens
+            entry['estimated_cost'] += runs[node] * calculate_cost(model, stats.input_tokens, output_tokens)
+        elif opcode == OP_PARALLEL:
+            latency[node] = max((latency[c] for c in plan.children(node)), default=0.0)
+        elif opcode == OP_SEQUENTIAL:
+            latency[node] = sum(latency[c] for c in plan.children(node))
+        elif opcode == OP_LOOP:
+            latency[node] = plan.iterations[node] * sum(latency[c] for c in plan.children(node))
+
+    critical_path_ms = max((latency[r] for r in range(plan.root_count)), default=0.0)
+    for entry in models.values():
+        entry['input_tokens'] = round(entry['input_tokens'])
+        entry['output_tokens'] = round(entry['output_tokens'])
+        entry['estimated_cost'] = round(entry['estimated_cost'], 8)
+    return {
+        'workflow_id': plan.workflow_id,
+        'critical_path_ms': round(critical_path_ms, 3),
+        'llm_calls': sum(entry['llm_calls'] for entry in models.values()),
+        'estimated_input_tokens': sum(entry['input_tokens'] for entry in models.values()),
+        'estimated_output_tokens': sum(entry['output_tokens'] for entry in models.values()),
+        'estimated_cost': round(sum(entry['estimated_cost'] for entry in models.values()), 8),
+        'latency_percentile': latency_percentile,
+        'latency_budget_ms': latency_budget_ms,
+        'within_budget': None if latency_budget_ms is None else critical_path_ms <= latency_budget_ms,
+        'models': models,
+    }
+
+
+# Instância compartilhada pelas rotas de workflow
+model_stats_provider = ModelStatsProvider()
@@ -0,0 +1,174 @@
+"""Gerenciador de execuções de workflow em segundo plano.
+
+`POST /workflows/{id}/runs` apenas enfileira a execução e retorna o id do run; um
+número limitado de execuções roda ao mesmo tempo (as demais aguardam na fila) e o
+estado de cada run pode ser consultado ou cancelado por `/runs/{run_id}`.
+
+Cada nó concluído grava um checkpoint; um run que falhou ou foi cancelado pode ser
+retomado com `resume`, reexecutando apenas os nós que ainda não terminaram.
+"""
+import asyncio
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+from uuid import uuid4
+
+from ..config import settings
+from ..models.workflow import WorkflowRun
+from . import execution_engine
+from .workflow_checkpoints import CheckpointStore, checkpoint_store
+from .workflow_compiler import CompiledWorkflow
+from .workflow_tracing import TraceRecorder
+
+ACTIVE_STATUSES = ('queued', 'running')
+
+
+class RunQueueFullError(RuntimeError):
+    """Há execuções demais aguardando; o cliente deve tentar novamente mais tarde."""
+
+
+class RunNotActiveError(RuntimeError):
+    """A execução já terminou e não pode mais ser cancelada."""
+
+
+class RunNotResumableError(RuntimeError):
+    """Só execuções que falharam ou foram canceladas podem ser retomadas."""
+
+
+def _now() -> str:
+    return datetime.utcnow().isoformat() + "Z"
+
+
+class WorkflowRunManager:
+    def __init__(
+        self,
+        max_workers: int = 4,
+        max_queued: int = 100,
+        retention: int = 1000,
+        checkpoints: Optional[CheckpointStore] = None,
+    ):
+        if max_workers < 1:
+            raise ValueError("max_workers deve ser maior ou igual a 1.")
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self.retention = retention
+        self.checkpoints = checkpoints if checkpoints is not None else CheckpointStore()
+        self._runs: "OrderedDict[str, WorkflowRun]" = OrderedDict()
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._traces: Dict[str, TraceRecorder] = {}
+        # Plano, dados iniciais e opções de cada run que ainda pode ser retomado
+        self._requests: Dict[str, Tuple[CompiledWorkflow, Dict[str, Any], Dict[str, Any]]] = {}
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    def _queued_count(self) -> int:
+        return sum(1 for run in self._runs.values() if run.status == 'queued')
+
+    def _prune_finished(self) -> None:
+        finished = [run_id for run_id, run in self._runs.items() if run.status not in ACTIVE_STATUSES]
+        for run_id in finished[:max(0, len(finished) - self.retention)]:
+            del self._runs[run_id]
+            self._traces.pop(run_id, None)
+            self._requests.pop(run_id, None)
+            self.checkpoints.clear(run_id)
+
+    def _check_queue(self) -> None:
+        if self._queued_count() >= self.max_queued:
+            raise RunQueueFullError(f"Limite de {self.max_queued} execuções na fila atingido.")
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_workers)
+
+    def _start(self, run: WorkflowRun) -> None:
+        plan, initial_data, engine_options = self._requests[run.id]
+        if run.id in self._traces:
+            # Cada tentativa grava um trace novo
+            engine_options["tracer"] = self._traces[run.id] = TraceRecorder()
+        task = asyncio.create_task(self._execute(run, plan, initial_data, engine_options))
+        self._tasks[run.id] = task
+        task.add_done_callback(lambda finished_task: self._on_done(run, finished_task))
+
+    def submit(
+        self,
+        workflow_id: str,
+        plan: CompiledWorkflow,
+        initial_data: Dict[str, Any],
+        trace: bool = False,
+        **engine_options: Any,
+    ) -> WorkflowRun:
+        """Enfileira a execução do plano; `engine_options` são repassados a `run_compiled_workflow`.
+
+        Com `trace=True` os spans da execução ficam disponíveis em `get_trace`.
+        """
+        self._check_queue()
+        run = WorkflowRun(id=f"run-{uuid4()}", workflow_id=workflow_id, created_at=_now())
+        self._runs[run.id] = run
+        self._prune_finished()
+        if trace:
+            self._traces[run.id] = TraceRecorder()
+        engine_options.update(checkpoints=self.checkpoints, run_id=run.id)
+        self._requests[run.id] = (plan, initial_data, engine_options)
+        self._start(run)
+        return run
+
+    def resume(self, run_id: str) -> Optional[WorkflowRun]:
+        """Reenfileira um run que falhou ou foi cancelado, reaproveitando seus checkpoints."""
+        run = self._runs.get(run_id)
+        if run is None:
+            return None
+        if run_id in self._tasks or run.status not in ('failed', 'cancelled'):
+            raise RunNotResumableError(
+                f"A execução '{run_id}' está '{run.status}'; apenas execuções com falha ou canceladas podem ser retomadas."
+            )
+        self._check_queue()
+        run.status = 'queued'
+        run.error = None
+        run.finished_at = None
+        run.attempts += 1
+        self._start(run)
+        return run
+
+    async def _execute(self, run: WorkflowRun, plan: CompiledWorkflow, initial_data: Dict[str, Any], engine_options: Dict[str, Any]) -> None:
+        async with self._slots:
+            run.status = 'running'
+            run.started_at = _now()
+            run.final_outputs = await execution_engine.run_compiled_workflow(plan, initial_data, **engine_options)
+
+    def _on_done(self, run: WorkflowRun, task: asyncio.Task) -> None:
+        self._tasks.pop(run.id, None)
+        if task.cancelled():
+            run.status = 'cancelled'
+        elif task.exception() is not None:
+            run.status = 'failed'
+            run.error = str(task.exception()) or type(task.exception()).__name__
+        else:
+            run.status = 'succeeded'
+            # Runs concluídos não são retomados: libera checkpoints e dados de entrada
+            self._requests.pop(run.id, None)
+            self.checkpoints.clear(run.id)
+        run.finished_at = _now()
+
+    def get(self, run_id: str) -> Optional[WorkflowRun]:
+        return self._runs.get(run_id)
+
+    def get_trace(self, run_id: str) -> Optional[TraceRecorder]:
+        return self._traces.get(run_id)
+
+    def cancel(self, run_id: str) -> Optional[WorkflowRun]:
+        run = self._runs.get(run_id)
+        if run is None:
+            return None
+        task = self._tasks.get(run_id)
+        if task is None or not task.cancel():
+            raise RunNotActiveError(f"A execução '{run_id}' já foi finalizada.")
+        run.status = 'cancelled'
+        return run
+
+    def active_count(self) -> int:
+        return len(self._tasks)
+
+
+workflow_run_manager = WorkflowRunManager(
+    max_workers=settings.WORKFLOW_RUN_MAX_WORKERS,
+    max_queued=settings.WORKFLOW_RUN_MAX_QUEUED,
+    retention=settings.WORKFLOW_RUN_RETENTION,
+    checkpoints=checkpoint_store,
+)
@@ -0,0 +1,366 @@
+"""Repositório persistente de workflows (SQLite por padrão, Postgres opcional).
+
+Substitui o dicionário em memória `database._workflows`: os workflows sobrevivem a
+reinícios e são compartilhados entre workers do uvicorn. A listagem lê apenas colunas
+de resumo (id, nome, quantidade de nós, created_at) com paginação por cursor sobre o
+índice `(created_at, id)`; a árvore completa só é carregada na busca por id.
+
+Edições viram revisões (`workflow_revisions`): cada uma guarda só as operações em relação
+à anterior (ver `workflow_versioning`) e, a cada `WORKFLOW_SNAPSHOT_INTERVAL` revisões,
+uma cópia completa da árvore, de modo que reconstruir qualquer versão aplica no máximo
+esse número de deltas. A árvore da revisão atual continua materializada em `workflows`
+para que execuções não precisem reconstruí-la.
+
+`workflow_checkpoints` guarda a saída (JSON) de cada nó concluído por run, chaveada por
+`(run_id, node_key)`, para que runs com falha possam ser retomados em outro worker ou
+depois de um reinício (ver `workflow_checkpoints`).
+
+`WORKFLOW_STORE_URL` aceita `sqlite:///caminho/arquivo.db` ou `postgresql://...`
+(este último requer o pacote `psycopg`).
+"""
+import base64
+import binascii
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Iterator, List, Optional, Tuple
+
+from ..config import settings
+from ..models.workflow import WorkflowNode, WorkflowRevision, WorkflowStored, WorkflowSummary
+from .workflow_versioning import Ops, apply_ops
+
+# Árvores já desserializadas mantidas em memória por processo
+PARSED_CACHE_SIZE = 256
+
+_SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS workflows (
+        id TEXT PRIMARY KEY,
+        name TEXT,
+        created_at TEXT NOT NULL,
+        node_count INTEGER NOT NULL,
+        workflow_tree TEXT NOT NULL,
+        revision INTEGER NOT NULL DEFAULT 1,
+        updated_at TEXT
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_workflows_created_at ON workflows (created_at, id)",
+    """
+    CREATE TABLE IF NOT EXISTS workflow_revisions (
+        workflow_id TEXT NOT NULL,
+        revision INTEGER NOT NULL,
+        kind TEXT NOT NULL,
+        payload TEXT NOT NULL,
+        op_count INTEGER NOT NULL,
+        created_at TEXT NOT NULL,
+        name TEXT,
+        PRIMARY KEY (workflow_id, revision)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS workflow_checkpoints (
+        run_id TEXT NOT NULL,
+        node_key TEXT NOT NULL,
+        output TEXT NOT NULL,
+        created_at TEXT NOT NULL,
+        PRIMARY KEY (run_id, node_key)
+    )
+    """,
+)
+
+# Colunas adicionadas depois da criação das tabelas
+_ADDED_COLUMNS = (
+    ("workflows", "revision", "INTEGER NOT NULL DEFAULT 1"),
+    ("workflows", "updated_at", "TEXT"),
+    ("workflow_revisions", "name", "TEXT"), # Nome do workflow em cada revisão
+)
+
+
+class InvalidCursorError(ValueError):
+    """Cursor de paginação malformado."""
+
+
+class RevisionConflictError(RuntimeError):
+    """O workflow foi alterado por outra requisição desde a revisão usada como base."""
+
+
+def _count_nodes(tree: List[WorkflowNode]) -> int:
+    count = 0
+    pending = list(tree)
+    while pending:
+        node = pending.pop()
+        count += 1
+        pending.extend(node.children)
+    return count
+
+
+def encode_cursor(created_at: str, workflow_id: str) -> str:
+    raw = json.dumps([created_at, workflow_id]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    try:
+        created_at, workflow_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except (binascii.Error, UnicodeError, ValueError, TypeError):
+        raise InvalidCursorError("Cursor de paginação inválido.")
+    if not isinstance(created_at, str) or not isinstance(workflow_id, str):
+        raise InvalidCursorError("Cursor de paginação inválido.")
+    return created_at, workflow_id
+
+
+class WorkflowStore:
+    """Acesso à tabela `workflows`; cada operação usa uma transação curta."""
+
+    def __init__(self, url: str, snapshot_interval: int = 20):
+        if snapshot_interval < 1:
+            raise ValueError("snapshot_interval deve ser maior ou igual a 1.")
+        self.url = url
+        self.snapshot_interval = snapshot_interval
+        self._is_postgres = url.startswith(("postgres://", "postgresql://"))
+        if not self._is_postgres and not url.startswith("sqlite:///"):
+            raise ValueError("WORKFLOW_STORE_URL deve começar com 'sqlite:///' ou 'postgresql://'.")
+        self._pg_connection: Any = None
+        self._pg_lock = threading.Lock()
+        self._parsed: "OrderedDict[str, WorkflowStored]" = OrderedDict()
+        self._parsed_lock = threading.Lock()
+        with self._connect() as connection:
+            if not self._is_postgres:
+                connection.execute("PRAGMA journal_mode=WAL") # Leitores não bloqueiam escritas entre processos
+            for statement in _SCHEMA:
+                connection.execute(statement)
+            self._add_missing_columns(connection)
+
+    def _add_missing_columns(self, connection: Any) -> None:
+        if self._is_postgres:
+            for table, column, definition in _ADDED_COLUMNS:
+                connection.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {column} {definition}")
+            return
+        for table, column, definition in _ADDED_COLUMNS:
+            existing = {row[1] for row in connection.execute(f"PRAGMA table_info({table})").fetchall()}
+            if column not in existing:
+                connection.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+    @contextmanager
+    def _connect(self) -> Iterator[Any]:
+        if self._is_postgres:
+            # Uma conexão por processo, serializada: o driver não é compartilhável entre threads
+            with self._pg_lock:
+                if self._pg_connection is None or self._pg_connection.closed:
+                    try:
+                        import psycopg
+                    except ImportError as e:
+                        raise RuntimeError("WORKFLOW_STORE_URL aponta para Postgres, mas o pacote 'psycopg' não está instalado.") from e
+                    self._pg_connection = psycopg.connect(self.url)
+                with self._pg_connection.transaction():
+                    yield _PostgresAdapter(self._pg_connection)
+        else:
+            connection = sqlite3.connect(self.url[len("sqlite:///"):], timeout=30)
+            try:
+                with connection:
+                    yield connection
+            finally:
+                connection.close()
+
+    def _remember(self, workflow: WorkflowStored) -> None:
+        with self._parsed_lock:
+            self._parsed[workflow.id] = workflow
+            self._parsed.move_to_end(workflow.id)
+            while len(self._parsed) > PARSED_CACHE_SIZE:
+                self._parsed.popitem(last=False)
+
+    @staticmethod
+    def _tree_json(tree: List[WorkflowNode]) -> str:
+        return json.dumps([node.dict() for node in tree], ensure_ascii=False)
+
+    @staticmethod
+    def _insert_revision(connection: Any, workflow: WorkflowStored, kind: str, payload: str, op_count: int) -> None:
+        connection.execute(
+            """
+            INSERT INTO workflow_revisions (workflow_id, revision, kind, payload, op_count, created_at, name)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            """,
+            (workflow.id, workflow.revision, kind, payload, op_count,
+             workflow.updated_at or workflow.created_at, workflow.name),
+        )
+
+    def save(self, workflow: WorkflowStored) -> None:
+        """Grava um workflow novo como revisão 1 (snapshot)."""
+        tree_json = self._tree_json(workflow.workflow_tree)
+        with self._connect() as connection:
+            connection.execute(
+                """
+                INSERT INTO workflows (id, name, created_at, node_count, workflow_tree, revision, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                (workflow.id, workflow.name, workflow.created_at, _count_nodes(workflow.workflow_tree),
+                 tree_json, workflow.revision, workflow.updated_at),
+            )
+            self._insert_revision(connection, workflow, "snapshot", tree_json, _count_nodes(workflow.workflow_tree))
+        self._remember(workflow)
+
+    def commit_revision(self, workflow: WorkflowStored, ops: Ops, base_revision: int) -> None:
+        """Grava `workflow` (já com `revision = base_revision + 1`) e o delta `ops`.
+
+        Falha com `RevisionConflictError` se a revisão atual não for mais `base_revision`.
+        """
+        tree_json = self._tree_json(workflow.workflow_tree)
+        is_snapshot = (workflow.revision - 1) % self.snapshot_interval == 0
+        with self._connect() as connection:
+            cursor = connection.execute(
+                """
+                UPDATE workflows
+                SET name = ?, node_count = ?, workflow_tree = ?, revision = ?, updated_at = ?
+                WHERE id = ? AND revision = ?
+                """,
+                (workflow.name, _count_nodes(workflow.workflow_tree), tree_json, workflow.revision,
+                 workflow.updated_at, workflow.id, base_revision),
+            )
+            if cursor.rowcount != 1:
+                raise RevisionConflictError(
+                    f"O workflow '{workflow.id}' não está mais na revisão {base_revision}."
+                )
+            self._insert_revision(
+                connection, workflow,
+                "snapshot" if is_snapshot else "delta",
+                tree_json if is_snapshot else json.dumps(ops, ensure_ascii=False),
+                len(ops),
+            )
+        self._remember(workflow)
+
+    def get(self, workflow_id: str) -> Optional[WorkflowStored]:
+        """Busca a árvore completa da revisão atual.
+
+        Enquanto a revisão não mudar, a mesma instância é devolvida (verificada com uma
+        consulta só da coluna `revision`), o que mantém válido o cache de planos compilados
+        (`workflow_compiler`) e evita desserializar a árvore a cada execução.
+        """
+        with self._parsed_lock:
+            cached = self._parsed.get(workflow_id)
+        with self._connect() as connection:
+            if cached is not None:
+                row = connection.execute("SELECT revision FROM workflows WHERE id = ?", (workflow_id,)).fetchone()
+                if row is not None and row[0] == cached.revision:
+                    return cached
+            row = connection.execute(
+                "SELECT id, name, created_at, workflow_tree, revision, updated_at FROM workflows WHERE id = ?",
+                (workflow_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        workflow = WorkflowStored(
+            id=row[0], name=row[1], created_at=row[2], workflow_tree=json.loads(row[3]),
+            revision=row[4], updated_at=row[5],
+        )
+        self._remember(workflow)
+        return workflow
+
+    def list_revisions(self, workflow_id: str) -> List[WorkflowRevision]:
+        with self._connect() as connection:
+            rows = connection.execute(
+                """
+                SELECT revision, kind, op_count, created_at, name FROM workflow_revisions
+                WHERE workflow_id = ? ORDER BY revision DESC
+                """,
+                (workflow_id,),
+            ).fetchall()
+        return [WorkflowRevision(revision=r[0], kind=r[1], op_count=r[2], created_at=r[3], name=r[4]) for r in rows]
+
+    def get_revision(self, workflow_id: str, revision: int) -> Optional[Tuple[List[WorkflowNode], Optional[str]]]:
+        """Reconstrói `(árvore, nome)` de uma revisão: último snapshot anterior + deltas seguintes.
+
+        Revisões gravadas antes da coluna `name` existir voltam com nome `None`.
+        """
+        with self._connect() as connection:
+            rows = connection.execute(
+                """
+                SELECT revision, payload, name FROM workflow_revisions
+                WHERE workflow_id = ? AND revision <= ? AND revision >= (
+                    SELECT MAX(revision) FROM workflow_revisions
+                    WHERE workflow_id = ? AND kind = 'snapshot' AND revision <= ?
+                )
+                ORDER BY revision
+                """,
+                (workflow_id, revision, workflow_id, revision),
+            ).fetchall()
+        if not rows or rows[-1][0] != revision:
+            return None
+        tree = [WorkflowNode(**node) for node in json.loads(rows[0][1])]
+        ops = [op for _, payload, _ in rows[1:] for op in json.loads(payload)]
+        return (apply_ops(tree, ops) if ops else tree), rows[-1][2]
+
+    def list_summaries(self, limit: int = 50, cursor: Optional[str] = None) -> Tuple[List[WorkflowSummary], Optional[str]]:
+        """Lista resumos do mais recente para o mais antigo; retorna também o próximo cursor."""
+        query = "SELECT id, name, node_count, created_at FROM workflows"
+        params: Tuple[Any, ...] = ()
+        if cursor:
+            created_at, workflow_id = decode_cursor(cursor)
+            query += " WHERE created_at < ? OR (created_at = ? AND id < ?)"
+            params = (created_at, created_at, workflow_id)
+        query += " ORDER BY created_at DESC, id DESC LIMIT ?"
+        with self._connect() as connection:
+            rows = connection.execute(query, params + (limit + 1,)).fetchall()
+
+        items = [WorkflowSummary(id=r[0], name=r[1], node_count=r[2], created_at=r[3]) for r in rows[:limit]]
+        next_cursor = encode_cursor(items[-1].created_at, items[-1].id) if len(rows) > limit else None
+        return items, next_cursor
+
+
+    def load_checkpoint(self, run_id: str, node_key: str) -> Tuple[bool, Any]:
+        """Retorna `(True, saída)` se houver checkpoint do nó neste run, senão `(False, None)`."""
+        with self._connect() as connection:
+            row = connection.execute(
+                "SELECT output FROM workflow_checkpoints WHERE run_id = ? AND node_key = ?",
+                (run_id, node_key),
+            ).fetchone()
+        return (True, json.loads(row[0])) if row is not None else (False, None)
+
+    def save_checkpoint(self, run_id: str, node_key: str, output_json: str, created_at: str) -> None:
+        """Grava (ou substitui) a saída já serializada de um nó."""
+        with self._connect() as connection:
+            connection.execute(
+                """
+                INSERT INTO workflow_checkpoints (run_id, node_key, output, created_at)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT (run_id, node_key) DO UPDATE SET output = excluded.output, created_at = excluded.created_at
+                """,
+                (run_id, node_key, output_json, created_at),
+            )
+
+    def count_checkpoints(self, run_id: str) -> int:
+        with self._connect() as connection:
+            row = connection.execute("SELECT COUNT(*) FROM workflow_checkpoints WHERE run_id = ?", (run_id,)).fetchone()
+        return row[0]
+
+    def clear_checkpoints(self, run_id: str) -> None:
+        with self._connect() as connection:
+            connection.execute("DELETE FROM workflow_checkpoints WHERE run_id = ?", (run_id,))
+
+
+class _PostgresAdapter:
+    """Expõe `execute(sql, params)` com placeholders `?` sobre uma conexão psycopg."""
+
+    def __init__(self, connection: Any):
+        self._connection = connection
+
+    def execute(self, sql: str, params: Tuple[Any, ...] = ()) -> Any:
+        return self._connection.execute(sql.replace("?", "%s"), params)
+
+
+_workflow_store: Optional[WorkflowStore] = None
+_workflow_store_lock = threading.Lock()
+
+
+def get_workflow_store() -> WorkflowStore:
+    """Dependência FastAPI com o store compartilhado, criado (e o banco aberto) no primeiro uso.
+
+    Importar este módulo não toca o disco; testes podem substituir o store com
+    `app.dependency_overrides[get_workflow_store]`.
+    """
+    global _workflow_store
+    with _workflow_store_lock:
+        if _workflow_store is None:
+            _workflow_store = WorkflowStore(settings.WORKFLOW_STORE_URL, snapshot_interval=settings.WORKFLOW_SNAPSHOT_INTERVAL)
+        return _workflow_store
@@ -0,0 +1,119 @@
+"""Spans de execução por nó, exportáveis no formato `trace_event` do Chrome.
+
+Cada execução de nó gera um span com pai, início/fim, tamanho de entrada/saída e, para
+nós llmAgent, tokens consumidos. O JSON de `to_chrome_trace()` pode ser aberto em
+`chrome://tracing` ou no Perfetto para ver o caminho crítico do workflow.
+"""
+import json
+import time
+from typing import Any, Dict, List, Optional
+
+
+def _payload_size(value: Any) -> int:
+    """Tamanho aproximado, em bytes, da serialização JSON do valor."""
+    return len(json.dumps(value, default=str, ensure_ascii=False).encode("utf-8"))
+
+
+class Span:
+    __slots__ = (
+        'span_id', 'parent_id', 'node_id', 'node_type', 'lane', 'start', 'end',
+        'input_size', 'output_size', 'input_tokens', 'output_tokens', 'attributes',
+    )
+
+    def __init__(self, span_id: int, parent_id: Optional[int], node_id: str, node_type: str, lane: int, start: float, input_size: int):
+        self.span_id = span_id
+        self.parent_id = parent_id
+        self.node_id = node_id
+        self.node_type = node_type
+        self.lane = lane # Ramo concorrente em que o nó rodou (vira `tid` no trace)
+        self.start = start
+        self.end: Optional[float] = None
+        self.input_size = input_size
+        self.output_size: Optional[int] = None
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.attributes: Dict[str, Any] = {}
+
+    @property
+    def duration(self) -> Optional[float]:
+        return None if self.end is None else self.end - self.start
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "node_id": self.node_id,
+            "node_type": self.node_type,
+            "start_ms": round(self.start * 1000, 3),
+            "end_ms": None if self.end is None else round(self.end * 1000, 3),
+            "input_size": self.input_size,
+            "output_size": self.output_size,
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+            **self.attributes,
+        }
+
+
+class TraceRecorder:
+    """Coleta os spans de uma execução; tempos são relativos ao início da gravação."""
+
+    def __init__(self):
+        self.spans: List[Span] = []
+        self._origin = time.perf_counter()
+        self._next_lane = 0
+
+    def new_lane(self) -> int:
+        lane = self._next_lane
+        self._next_lane += 1
+        return lane
+
+    def start_span(self, node_id: str, node_type: str, parent: Optional[Span], lane: int, input_data: Any) -> Span:
+        span = Span(
+            span_id=len(self.spans),
+            parent_id=parent.span_id if parent is not None else None,
+            node_id=node_id,
+            node_type=node_type,
+            lane=lane,
+            start=time.perf_counter() - self._origin,
+            input_size=_payload_size(input_data),
+        )
+        self.spans.append(span)
+        return span
+
+    def finish_span(self, span: Span, output: Any, input_tokens: int = 0, output_tokens: int = 0, **attributes: Any) -> None:
+        span.end = time.perf_counter() - self._origin
+        span.output_size = _payload_size(output)
+        span.input_tokens = input_tokens
+        span.output_tokens = output_tokens
+        span.attributes.update(attributes)
+
+    def to_dict(self) -> List[Dict[str, Any]]:
+        return [span.to_dict() for span in self.spans]
+
+    def to_chrome_trace(self, other_data: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Exporta os spans como eventos completos (`ph: "X"`) em microssegundos."""
+        events = []
+        for span in self.spans:
+            end = span.end if span.end is not None else span.start
+            events.append({
+                "name": span.node_id,
+                "cat": span.node_type,
+                "ph": "X",
+                "ts": round(span.start * 1_000_000, 1),
+                "dur": round((end - span.start) * 1_000_000, 1),
+                "pid": 1,
+                "tid": span.lane,
+                "args": {
+                    "span_id": span.span_id,
+                    "parent_id": span.parent_id,
+                    "input_size": span.input_size,
+                    "output_size": span.output_size,
+                    "input_tokens": span.input_tokens,
+                    "output_tokens": span.output_tokens,
+                    **span.attributes,
+                },
+            })
+        trace: Dict[str, Any] = {"traceEvents": events, "displayTimeUnit": "ms"}
+        if other_data:
+            trace["otherData"] = other_data
+        return trace
@@ -0,0 +1,193 @@
+"""Diferenças estruturais entre versões de um workflow.
+
+Cada revisão guarda só as operações que transformam a árvore da revisão anterior na
+nova, de modo que o tamanho gravado acompanha o tamanho da edição e não o da árvore.
+Os nós são identificados pelo `id`, que precisa ser único dentro do workflow.
+
+Operações (aplicadas em ordem; `parent_id: null` é o nível raiz):
+- `{"op": "insert", "parent_id": P, "index": i, "node": {"id", "type", "data"}}` — nó sem filhos;
+- `{"op": "remove", "node_id": X}` — remove o nó e toda a sua subárvore;
+- `{"op": "update", "node_id": X, "type"?: T, "data"?: D}` — substitui tipo e/ou dados;
+- `{"op": "move", "node_id": X, "parent_id": P, "index": i}` — muda o nó (e a subárvore) de lugar.
+"""
+from typing import Any, Dict, List, Optional
+
+from ..models.workflow import WorkflowNode
+
+Ops = List[Dict[str, Any]]
+
+
+class WorkflowPatchError(ValueError):
+    """Operação inválida para a árvore atual (nó inexistente, id duplicado, ciclo...)."""
+
+
+class _FlatTree:
+    """Árvore achatada: `id -> {type, data, children}` mais a lista de raízes."""
+
+    __slots__ = ('nodes', 'parents', 'roots')
+
+    def __init__(self):
+        self.nodes: Dict[str, Dict[str, Any]] = {}
+        self.parents: Dict[str, Optional[str]] = {}
+        self.roots: List[str] = []
+
+    @classmethod
+    def from_tree(cls, tree: List[WorkflowNode]) -> "_FlatTree":
+        flat = cls()
+        pending = [(node, None) for node in reversed(tree)]
+        while pending:
+            node, parent_id = pending.pop()
+            if node.id in flat.nodes:
+                raise WorkflowPatchError(f"ID de nó duplicado: '{node.id}'. O versionamento exige IDs únicos.")
+            flat.nodes[node.id] = {"type": node.type, "data": node.data, "children": []}
+            flat.parents[node.id] = parent_id
+            flat.siblings(parent_id).append(node.id)
+            pending.extend((child, node.id) for child in reversed(node.children))
+        return flat
+
+    def siblings(self, parent_id: Optional[str]) -> List[str]:
+        if parent_id is None:
+            return self.roots
+        if parent_id not in self.nodes:
+            raise WorkflowPatchError(f"Nó pai '{parent_id}' não existe.")
+        return self.nodes[parent_id]["children"]
+
+    def _require(self, node_id: Any) -> Dict[str, Any]:
+        if node_id not in self.nodes:
+            raise WorkflowPatchError(f"Nó '{node_id}' não existe.")
+        return self.nodes[node_id]
+
+    @staticmethod
+    def _index(op: Dict[str, Any], siblings: List[str]) -> int:
+        index = op.get("index", len(siblings))
+        if not isinstance(index, int) or not 0 <= index <= len(siblings):
+            raise WorkflowPatchError(f"Índice inválido na operação {op.get('op')}: {index!r}.")
+        return index
+
+    def apply(self, op: Dict[str, Any]) -> None:
+        kind = op.get("op")
+        if kind == "insert":
+            node = op.get("node")
+            if not isinstance(node, dict) or not isinstance(node.get("id"), str) or not isinstance(node.get("type"), str):
+                raise WorkflowPatchError("'insert' exige 'node' com 'id' e 'type'.")
+            if node["id"] in self.nodes:
+                raise WorkflowPatchError(f"Nó '{node['id']}' já existe.")
+            data = node.get("data")
+            if data is not None and not isinstance(data, dict):
+                raise WorkflowPatchError("'data' deve ser um objeto.")
+            siblings = self.siblings(op.get("parent_id"))
+            siblings.insert(self._index(op, siblings), node["id"])
+            self.nodes[node["id"]] = {"type": node["type"], "data": dict(data or {}), "children": []}
+            self.parents[node["id"]] = op.get("parent_id")
+        elif kind == "remove":
+            self._require(op.get("node_id"))
+            self.siblings(self.parents[op["node_id"]]).remove(op["node_id"])
+            pending = [op["node_id"]]
+            while pending:
+                node_id = pending.pop()
+                pending.extend(self.nodes.pop(node_id)["children"])
+                del self.parents[node_id]
+        elif kind == "update":
+            node = self._require(op.get("node_id"))
+            if "type" in op:
+                if not isinstance(op["type"], str):
+                    raise WorkflowPatchError("'type' deve ser um texto.")
+                node["type"] = op["type"]
+            if "data" in op:
+                if not isinstance(op["data"], dict):
+                    raise WorkflowPatchError("'data' deve ser um objeto.")
+                node["data"] = op["data"]
+        elif kind == "move":
+            node_id, parent_id = op.get("node_id"), op.get("parent_id")
+            self._require(node_id)
+            ancestor = parent_id
+            while ancestor is not None:
+                if ancestor == node_id:
+                    raise WorkflowPatchError(f"Mover '{node_id}' para dentro de si mesmo criaria um ciclo.")
+                ancestor = self.parents.get(ancestor)
+            target = self.siblings(parent_id)
+            self.siblings(self.parents[node_id]).remove(node_id)
+            target.insert(self._index(op, target), node_id)
+            self.parents[node_id] = parent_id
+        else:
+            raise WorkflowPatchError(f"Operação desconhecida: {kind!r}.")
+
+    def to_tree(self) -> List[WorkflowNode]:
+        # Monta de baixo para cima (pós-ordem iterativa) para não depender de recursão
+        built: Dict[str, WorkflowNode] = {}
+        pending = [(node_id, False) for node_id in self.roots]
+        while pending:
+            node_id, children_ready = pending.pop()
+            node = self.nodes[node_id]
+            if children_ready:
+                built[node_id] = WorkflowNode(
+                    id=node_id, type=node["type"], data=node["data"],
+                    children=[built[child] for child in node["children"]],
+                )
+            else:
+                pending.append((node_id, True))
+                pending.extend((child, False) for child in node["children"])
+        return [built[node_id] for node_id in self.roots]
+
+
+def apply_ops(tree: List[WorkflowNode], ops: Ops) -> List[WorkflowNode]:
+    """Aplica as operações sobre uma cópia da árvore e devolve a nova árvore."""
+    flat = _FlatTree.from_tree(tree)
+    for op in ops:
+        if not isinstance(op, dict):
+            raise WorkflowPatchError("Cada operação deve ser um objeto.")
+        flat.apply(op)
+    return flat.to_tree()
+
+
+def diff_trees(old: List[WorkflowNode], new: List[WorkflowNode]) -> Ops:
+    """Gera as operações que transformam `old` em `new`.
+
+    As operações são aplicadas a uma cópia de trabalho à medida que são geradas, então os
+    índices emitidos são sempre válidos para quem as reaplicar na mesma ordem.
+    """
+    work = _FlatTree.from_tree(old)
+    target = _FlatTree.from_tree(new)
+    ops: Ops = []
+
+    def emit(op: Dict[str, Any]) -> None:
+        work.apply(op)
+        ops.append(op)
+
+    # Ordem em largura de `new`: pais sempre antes dos filhos
+    order: List[str] = []
+    level = list(target.roots)
+    while level:
+        order.extend(level)
+        level = [child for node_id in level for child in target.nodes[node_id]["children"]]
+
+    for node_id in order:
+        node, parent_id = target.nodes[node_id], target.parents[node_id]
+        if node_id not in work.nodes:
+            siblings = work.siblings(parent_id)
+            position = target.siblings(parent_id).index(node_id)
+            emit({"op": "insert", "parent_id": parent_id, "index": min(position, len(siblings)),
+                  "node": {"id": node_id, "type": node["type"], "data": node["data"]}})
+            continue
+        current = work.nodes[node_id]
+        changes = {key: node[key] for key in ("type", "data") if current[key] != node[key]}
+        if changes:
+            emit({"op": "update", "node_id": node_id, **changes})
+        if work.parents[node_id] != parent_id:
+            emit({"op": "move", "node_id": node_id, "parent_id": parent_id})
+
+    # Nós que sobreviveram já foram movidos para fora das subárvores removidas;
+    # basta remover o topo de cada subárvore (descendentes saem junto).
+    for node_id in list(work.nodes):
+        if node_id in target.nodes or node_id not in work.nodes:
+            continue
+        parent_id = work.parents[node_id]
+        if parent_id is None or parent_id in target.nodes:
+            emit({"op": "remove", "node_id": node_id})
+
+    for parent_id in [None] + order:
+        wanted = target.siblings(parent_id)
+        for index, node_id in enumerate(wanted):
+            if work.siblings(parent_id)[index] != node_id:
+                emit({"op": "move", "node_id": node_id, "parent_id": parent_id, "index": index})
+    return ops
@@ -0,0 +1,242 @@
+"""Benchmark do motor de workflows com árvores sintéticas.
+
+Gera árvores `WorkflowNode` (fan-out paralelo largo, cadeia sequencial profunda, loops
+aninhados e uma mistura aleatória de ~10k nós), executa cada uma contra o
+`FakeLLMExecutor` com latência configurável e imprime um JSON com vazão, latência
+p50/p99 por execução, pico de memória e overhead de escalonamento por nó.
+
+O overhead é estimado comparando a mediana medida com o caminho crítico ideal da árvore
+(soma das latências em sequência, máximo entre ramos paralelos). Com latências não fixas
+o ideal usa a média da distribuição, então o valor é apenas aproximado.
+
+Uso (a partir de `server/`):
+    python scripts/benchmark_workflow_engine.py --runs 5 --latency-ms 10 --output bench.json
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.models.workflow import WorkflowNode  # noqa: E402
+from app.services import execution_engine  # noqa: E402
+from app.services.llm_executors import LATENCY_DISTRIBUTIONS, FakeLLMExecutor  # noqa: E402
+from app.services.workflow_compiler import (  # noqa: E402
+    OP_LLM,
+    OP_LOOP,
+    OP_PARALLEL,
+    OP_SEQUENTIAL,
+    CompiledWorkflow,
+    compile_workflow,
+)
+
+SCENARIOS = ("wide", "deep", "loops", "mix")
+
+
+def _llm(node_id: str) -> WorkflowNode:
+    return WorkflowNode(id=node_id, type="llmAgent", data={"instruction": f"passo {node_id}"})
+
+
+def wide_tree(width: int) -> List[WorkflowNode]:
+    """Um parallelAgent com `width` folhas."""
+    return [WorkflowNode(id="fanout", type="parallelAgent", data={}, children=[_llm(f"b{i}") for i in range(width)])]
+
+
+def deep_tree(depth: int) -> List[WorkflowNode]:
+    """`depth` sequentialAgents aninhados, cada um com uma folha antes do próximo nível."""
+    node = _llm(f"leaf{depth}")
+    for level in reversed(range(depth)):
+        node = WorkflowNode(id=f"s{level}", type="sequentialAgent", data={}, children=[_llm(f"leaf{level}"), node])
+    return [node]
+
+
+def loop_tree(iterations: int) -> List[WorkflowNode]:
+    """Dois loopAgents aninhados em volta de uma sequência de duas folhas."""
+    body = WorkflowNode(id="body", type="sequentialAgent", data={}, children=[_llm("draft"), _llm("review")])
+    inner = WorkflowNode(id="inner", type="loopAgent", data={"iterations": iterations}, children=[body])
+    return [WorkflowNode(id="outer", type="loopAgent", data={"iterations": iterations}, children=[inner])]
+
+
+def mixed_tree(total_nodes: int, seed: int) -> List[WorkflowNode]:
+    """Árvore aleatória (reprodutível por `seed`) com cerca de `total_nodes` nós."""
+    rng = random.Random(seed)
+    root: Dict[str, Any] = {"id": "n0", "type": "sequentialAgent", "children": []}
+    composites = [root]
+    count = 1
+    while count < total_nodes:
+        parent = rng.choice(composites)
+        draw = rng.random()
+        node_id = f"n{count}"
+        if draw < 0.6:
+            parent["children"].append({"id": node_id, "type": "llmAgent", "children": []})
+            count += 1
+        elif draw < 0.95:
+            node_type = "sequentialAgent" if draw < 0.8 else "parallelAgent"
+            node = {"id": node_id, "type": node_type, "children": []}
+            parent["children"].append(node)
+            composites.append(node)
+            count += 1
+        else:
+            # Loops só envolvem folhas para que o número de nós executados não exploda
+            leaf = {"id": f"{node_id}l", "type": "llmAgent", "children": []}
+            parent["children"].append({"id": node_id, "type": "loopAgent", "iterations": 2, "children": [leaf]})
+            count += 2
+
+    def build(spec: Dict[str, Any]) -> WorkflowNode:
+        if spec["type"] == "llmAgent":
+            return _llm(spec["id"])
+        data = {"iterations": spec["iterations"]} if "iterations" in spec else {}
+        return WorkflowNode(id=spec["id"], type=spec["type"], data=data, children=[build(c) for c in spec["children"]])
+
+    return [build(root)]
+
+
+def plan_profile(plan: CompiledWorkflow, latency: float) -> Dict[str, float]:
+    """Nós executados e caminho crítico ideal do plano, sem executá-lo.
+
+    Na numeração em largura os filhos sempre têm índice maior que o pai, então basta
+    percorrer o plano de trás para frente.
+    """
+    executed = [0] * len(plan)
+    critical = [0.0] * len(plan)
+    for node in reversed(range(len(plan))):
+        children = plan.children(node)
+        opcode = plan.opcodes[node]
+        if opcode == OP_LLM:
+            executed[node], critical[node] = 1, latency
+        elif opcode == OP_LOOP:
+            child = children[0]
+            executed[node] = 1 + plan.iterations[node] * executed[child]
+            critical[node] = plan.iterations[node] * critical[child]
+        else:
+            executed[node] = 1 + sum(executed[c] for c in children)
+            if opcode == OP_SEQUENTIAL:
+                critical[node] = sum(critical[c] for c in children)
+            elif opcode == OP_PARALLEL:
+                critical[node] = max((critical[c] for c in children), default=0.0)
+    roots = range(plan.root_count)
+    return {
+        "nodes_executed": sum(executed[r] for r in roots),
+        "ideal_seconds": max((critical[r] for r in roots), default=0.0),
+    }
+
+
+def _percentile(values: List[float], percentile: float) -> float:
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, round(percentile / 100 * len(ordered) + 0.5) - 1))
+    return ordered[rank]
+
+
+def run_scenario(name: str, build_tree: Callable[[], List[WorkflowNode]], args: argparse.Namespace) -> Dict[str, Any]:
+    tree = build_tree()
+    compile_started = time.perf_counter()
+    plan = compile_workflow(tree)
+    compile_seconds = time.perf_counter() - compile_started
+    profile = plan_profile(plan, args.latency_ms / 1000)
+
+    def run_once() -> None:
+        executor = FakeLLMExecutor(
+            latency=args.latency,
+            mean_seconds=args.latency_ms / 1000,
+            stddev_seconds=args.stddev_ms / 1000,
+            seed=args.seed,
+        )
+        asyncio.run(execution_engine.run_compiled_workflow(
+            plan, {"benchmark": name}, max_concurrency=args.max_concurrency, llm_executor=executor,
+        ))
+
+    durations = []
+    # O motor registra cada nó com print; a saída é descartada para não medir o terminal
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for _ in range(args.warmup):
+            run_once()
+        for _ in range(args.runs):
+            started = time.perf_counter()
+            run_once()
+            durations.append(time.perf_counter() - started)
+
+        # Execução separada: o tracemalloc deixa o interpretador bem mais lento
+        tracemalloc.start()
+        run_once()
+        _, peak_memory = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    nodes_executed = profile["nodes_executed"]
+    p50 = _percentile(durations, 50)
+    return {
+        "scenario": name,
+        "plan_nodes": len(plan),
+        "nodes_executed": nodes_executed,
+        "compile_ms": round(compile_seconds * 1000, 3),
+        "runs": args.runs,
+        "latency_p50_ms": round(p50 * 1000, 3),
+        "latency_p99_ms": round(_percentile(durations, 99) * 1000, 3),
+        "latency_mean_ms": round(sum(durations) / len(durations) * 1000, 3),
+        "ideal_ms": round(profile["ideal_seconds"] * 1000, 3),
+        "throughput_nodes_per_s": round(nodes_executed * len(durations) / sum(durations), 1),
+        "throughput_runs_per_s": round(len(durations) / sum(durations), 3),
+        "overhead_per_node_us": round(max(0.0, p50 - profile["ideal_seconds"]) / nodes_executed * 1_000_000, 2),
+        "peak_memory_bytes": peak_memory,
+    }
+
+
+def parse_args(argv: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark do motor de workflows com árvores sintéticas.")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"Lista separada por vírgulas: {', '.join(SCENARIOS)}")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--latency", choices=LATENCY_DISTRIBUTIONS, default="fixed")
+    parser.add_argument("--latency-ms", type=float, default=10.0)
+    parser.add_argument("--stddev-ms", type=float, default=2.0)
+    parser.add_argument("--max-concurrency", type=int, default=10_000)
+    parser.add_argument("--width", type=int, default=1000)
+    parser.add_argument("--depth", type=int, default=200)
+    parser.add_argument("--loop-iterations", type=int, default=10)
+    parser.add_argument("--mix-nodes", type=int, default=10_000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Arquivo JSON de saída (padrão: stdout)")
+    args = parser.parse_args(argv)
+    if args.runs < 1:
+        parser.error("--runs deve ser maior ou igual a 1.")
+    return args
+
+
+def main(argv: List[str]) -> int:
+    args = parse_args(argv)
+    builders = {
+        "wide": lambda: wide_tree(args.width),
+        "deep": lambda: deep_tree(args.depth),
+        "loops": lambda: loop_tree(args.loop_iterations),
+        "mix": lambda: mixed_tree(args.mix_nodes, args.seed),
+    }
+    selected = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in selected if name not in builders]
+    if unknown:
+        print(f"Cenários desconhecidos: {', '.join(unknown)}", file=sys.stderr)
+        return 2
+
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "parameters": {key: value for key, value in vars(args).items() if key != "output"},
+        "results": [run_scenario(name, builders[name], args) for name in selected],
+    }
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        Path(args.output).write_text(output + "\n", encoding="utf-8")
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
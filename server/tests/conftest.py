@@ -8,3 +8,24 @@ import pytest
 #         yield c
 
 print("conftest.py para testes carregado.")
+
+
+class _FunctionExecutor:
+    """Backend de LLM de teste que delega para `fn(instruction, input_data)`."""
+
+    def __init__(self, fn):
+        self.fn = fn
+
+    async def generate(self, instruction, input_data, params):
+        return await self.fn(instruction, input_data)
+
+
+@pytest.fixture
+def use_llm(monkeypatch):
+    """Instala `fn` como backend de LLM padrão do motor de workflows."""
+    from app.services import execution_engine
+
+    def install(fn):
+        monkeypatch.setattr(execution_engine, "get_workflow_llm_executor", lambda: _FunctionExecutor(fn))
+
+    return install
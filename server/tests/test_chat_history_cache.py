@@ -0,0 +1,94 @@
+import uuid
+from datetime import datetime, timedelta
+
+from app.schemas.chat_schemas import ChatMessageResponse
+from app.services.chat_history_cache import MESSAGE_OVERHEAD_BYTES, ChatHistoryCache, SessionHistory
+
+SESSION = uuid.uuid4()
+T0 = datetime(2024, 1, 1)
+
+
+def _message(content, seconds, session_id=SESSION):
+    return ChatMessageResponse(
+        id=uuid.uuid4(), session_id=session_id, sender_type='USER',
+        content=content, created_at=T0 + timedelta(seconds=seconds),
+    )
+
+
+def _format(calls):
+    def format_message(message):
+        calls.append(message.content)
+        return message.content
+    return format_message
+
+
+def test_only_new_messages_are_formatted_and_overlap_is_skipped():
+    cache = ChatHistoryCache()
+    calls = []
+    first, second, third = _message("a", 0), _message("b", 1), _message("c", 1)
+
+    cache.extend(SESSION, [first, second], _format(calls))
+    cached = cache.get(SESSION)
+    assert cached.last_created_at == second.created_at
+
+    # A busca incremental relê a janela antes do cursor, então `first` e `second` voltam repetidas
+    history = cache.extend(SESSION, [first, second, third], _format(calls))
+    assert calls == ["a", "b", "c"]
+    assert history.contents == ["a", "b", "c"]
+    assert history.index_of(third.id) == 2
+    assert history.index_of(uuid.uuid4()) == 3
+    assert history.token_counts == [1, 1, 1]
+
+
+def test_late_commit_behind_the_cursor_is_picked_up_once():
+    cache = ChatHistoryCache()
+    calls = []
+    cache.extend(SESSION, [_message("a", 0), _message("c", 5)], _format(calls))
+    history = cache.get(SESSION)
+    assert history.fetch_after() == history.last_created_at - history.reread_window
+
+    # `b` começou antes de `c` mas só ficou visível depois: volta na releitura da janela
+    late = _message("b", 3)
+    cache.extend(SESSION, [late, _message("d", 6)], _format(calls))
+    cache.extend(SESSION, [late], _format(calls))
+
+    assert calls == ["a", "c", "b", "d"]
+    assert history.last_created_at == T0 + timedelta(seconds=6)
+
+    # Fora da janela (busca concorrente com cursor antigo): ignorada, sem duplicar
+    stale = SessionHistory(reread_seconds=1)
+    stale.extend([_message("x", 0), _message("y", 10)], str)
+    assert stale.extend([_message("z", 2)], str) == 0
+
+
+def test_evicts_least_recently_used_by_size_and_invalidates():
+    cache = ChatHistoryCache(max_bytes=2 * (20 + MESSAGE_OVERHEAD_BYTES))
+    other = uuid.uuid4()
+    cache.extend(SESSION, [_message("x" * 10, 0)], _format([]))
+    cache.extend(other, [_message("y" * 10, 0, other)], _format([]))
+    cache.get(SESSION) # Torna SESSION a mais recente
+
+    cache.extend(uuid.uuid4(), [_message("z" * 10, 0)], _format([]))
+    assert cache.get(other) is None
+    assert cache.get(SESSION) is not None
+    assert cache.size_bytes == 2 * (20 + MESSAGE_OVERHEAD_BYTES)
+
+    cache.invalidate(SESSION)
+    assert cache.get(SESSION) is None
+    assert cache.size_bytes == 20 + MESSAGE_OVERHEAD_BYTES
+
+
+def test_latest_session_per_owner_follows_eviction_and_invalidation():
+    cache = ChatHistoryCache()
+    owner, other = ("user", "agent"), uuid.uuid4()
+    assert cache.latest_for(owner) is None
+
+    cache.extend(SESSION, [_message("a", 0)], _format([]), owner=owner)
+    assert cache.latest_for(owner)[0] == SESSION
+    cache.extend(other, [_message("b", 0, other)], _format([]), owner=owner)
+    assert cache.latest_for(owner)[0] == other
+
+    cache.invalidate(SESSION) # Não era a sessão mais recente do dono
+    assert cache.latest_for(owner)[0] == other
+    cache.invalidate(other)
+    assert cache.latest_for(owner) is None
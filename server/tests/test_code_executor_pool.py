@@ -0,0 +1,155 @@
+import asyncio
+import time
+
+import pytest
+
+from app.models.workflow import WorkflowNode
+from app.services import code_executor_pool, execution_engine, workflow_compiler
+from app.services.code_executor_pool import (
+    CodeExecutionError,
+    CodeExecutionTimeout,
+    CodeExecutorPool,
+    parse_code_executor_config,
+)
+
+
+@pytest.fixture
+def pool():
+    pool = CodeExecutorPool(size=1, memory_limit_mb=512)
+    yield pool
+    asyncio.run(pool.close())
+
+
+@pytest.fixture
+def code_executor_enabled(monkeypatch):
+    monkeypatch.setattr(code_executor_pool.settings, "CODE_EXECUTOR_ENABLED", True)
+
+
+def test_snippet_receives_input_and_returns_result_and_stdout(pool):
+    async def scenario():
+        first = await pool.run("print('oi')\nresult = input_data['x'] * 2", {"x": 21})
+        second = await pool.run("result = sum(range(10))", None)
+        return first, second
+
+    assert asyncio.run(scenario()) == (("oi\n", 42), ("", 45))
+
+
+def test_cpu_bound_snippet_does_not_block_event_loop(pool):
+    async def scenario():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        await pool.run("result = 1", None) # Aguarda o worker ficar pronto
+        ticking = asyncio.ensure_future(ticker())
+        started = time.perf_counter()
+        await pool.run("deadline = __import__('time').time() + 0.3\nwhile __import__('time').time() < deadline: pass", None)
+        elapsed = time.perf_counter() - started
+        ticking.cancel()
+        return ticks, elapsed
+
+    ticks, elapsed = asyncio.run(scenario())
+
+    assert ticks >= elapsed / 0.01 * 0.5
+
+
+def test_timeout_and_errors_replace_or_keep_worker(pool):
+    async def scenario():
+        with pytest.raises(CodeExecutionTimeout):
+            await pool.run("while True: pass", None, timeout_seconds=0.3)
+        with pytest.raises(CodeExecutionError, match="ZeroDivisionError"):
+            await pool.run("1 / 0", None)
+        return await pool.run("result = 'ok'", None)
+
+    assert asyncio.run(scenario()) == ("", "ok")
+
+
+def test_worker_is_recycled_so_state_does_not_leak(pool):
+    async def scenario():
+        first = await pool.run("import builtins, os\nbuiltins.vazou = True\nresult = os.getpid()", None)
+        second = await pool.run("import builtins, os\nresult = (hasattr(builtins, 'vazou'), os.getpid())", None)
+        return first[1], second[1]
+
+    first_pid, (leaked, second_pid) = asyncio.run(scenario())
+
+    assert not leaked
+    assert first_pid != second_pid
+
+
+def test_oversized_result_comes_back_as_truncated_repr():
+    pool = CodeExecutorPool(size=1, max_output_chars=100, max_result_bytes=1000)
+
+    async def scenario():
+        try:
+            return await pool.run("result = 'x' * 10000", None)
+        finally:
+            await pool.close()
+
+    stdout, result = asyncio.run(scenario())
+
+    assert result == repr("x" * 10000)[:100]
+
+
+def test_limits_are_clamped_to_server_maxima(monkeypatch):
+    monkeypatch.setattr(code_executor_pool.settings, "CODE_EXECUTOR_MAX_CPU_TIME_SECONDS", 30)
+    monkeypatch.setattr(code_executor_pool.settings, "CODE_EXECUTOR_MAX_TIMEOUT_SECONDS", 60)
+    monkeypatch.setattr(code_executor_pool.settings, "CODE_EXECUTOR_MEMORY_TIERS_MB", [128, 256, 512])
+
+    limits = parse_code_executor_config({"cpu_time_seconds": 3600, "timeout_seconds": 3600, "memory_limit_mb": 100000})
+    small = parse_code_executor_config({"memory_limit_mb": 200})
+
+    assert (limits.cpu_time_seconds, limits.timeout_seconds, limits.memory_limit_mb) == (30, 60, 512)
+    assert small.memory_limit_mb == 256
+
+
+def test_compile_rejects_code_node_when_disabled(monkeypatch):
+    monkeypatch.setattr(code_executor_pool.settings, "CODE_EXECUTOR_ENABLED", False)
+
+    with pytest.raises(workflow_compiler.WorkflowCompileError, match="desabilitado"):
+        workflow_compiler.compile_workflow([WorkflowNode(id="c", type="codeExecutor", data={"code": "result = 1"})])
+
+
+def test_code_executor_node_runs_inside_workflow(monkeypatch, code_executor_enabled):
+    pool = CodeExecutorPool(size=1, memory_limit_mb=512)
+    monkeypatch.setattr(code_executor_pool, "get_code_executor_pool", lambda memory_limit_mb: pool)
+    tree = [WorkflowNode(id="c", type="codeExecutor", data={
+        "code": "result = len(input_data['text'])",
+        "code_executor_config": {"timeout_seconds": 5},
+    })]
+
+    try:
+        outputs = asyncio.run(execution_engine.run_workflow(tree, {"text": "abcd"}))
+    finally:
+        asyncio.run(pool.close())
+
+    assert outputs == [{"result": 4, "stdout": ""}]
+
+
+def test_compile_rejects_code_node_without_valid_code(code_executor_enabled):
+    for data in ({}, {"code": "def"}, {"code": "x = 1", "code_executor_config": {"timeout_seconds": -1}}):
+        with pytest.raises(workflow_compiler.WorkflowCompileError):
+            workflow_compiler.compile_workflow([WorkflowNode(id="c", type="codeExecutor", data=data)])
+
+
+def test_close_kills_busy_workers_and_rejects_new_runs():
+    pool = CodeExecutorPool(size=1, memory_limit_mb=512)
+
+    async def scenario():
+        await pool.run("result = 1", None) # Aguarda o worker ficar pronto
+        running = asyncio.ensure_future(pool.run("while True: pass", None, timeout_seconds=30))
+        await asyncio.sleep(0.2)
+        worker = pool._busy[0]
+        await pool.close()
+        with pytest.raises(CodeExecutionError):
+            await running
+        with pytest.raises(CodeExecutionError, match="encerrado"):
+            await pool.run("result = 1", None)
+        return worker
+
+    worker = asyncio.run(scenario())
+
+    assert not worker.process.is_alive() and pool._idle.empty()
@@ -0,0 +1,97 @@
+import asyncio
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.schemas.chat_schemas import ChatMessageResponse
+from app.services.chat_history_cache import SessionHistory
+from app.services.context_window import build_context_window, parse_context_window_config
+
+SESSION = uuid.uuid4()
+
+
+def _history(count, chars=40):
+    history = SessionHistory()
+    messages = [
+        ChatMessageResponse(
+            id=uuid.uuid4(), session_id=SESSION, sender_type='USER' if i % 2 == 0 else 'AGENT',
+            content=f"{i:03d}" + "x" * (chars - 3), created_at=datetime(2024, 1, 1) + timedelta(seconds=i),
+        )
+        for i in range(count)
+    ]
+    history.extend(messages, lambda message: message.content[:3])
+    return history, messages
+
+
+def _config(**overrides):
+    return parse_context_window_config({"context_window": {
+        "enabled": True, "max_history_tokens": 100, "summary_max_tokens": 20, "min_recent_messages": 2, **overrides,
+    }})
+
+
+def test_summary_is_regenerated_only_when_the_window_moves():
+    history, messages = _history(12) # 10 tokens por mensagem
+    calls = []
+
+    async def summarize(previous, transcript, config):
+        calls.append((previous, transcript.count("\n") + 1))
+        return f"resumo {len(calls)}", {"input_tokens": 50, "output_tokens": 5}
+
+    async def scenario():
+        windows = [await build_context_window(history, 11, _config(), summarize)]
+        # O próximo turno cabe no orçamento: reaproveita o resumo em cache
+        history.extend(messages[12:], str)
+        windows.append(await build_context_window(history, 12, _config(), summarize))
+        return windows
+
+    moved, reused = asyncio.run(scenario())
+    assert len(calls) == 1 and calls[0] == (None, 7) # Mantém 4 mensagens (40 tokens = 50% de 80)
+    assert moved.summary == "resumo 1" and moved.recent == ["007", "008", "009", "010"]
+    assert moved.summary_usage == {"input_tokens": 50, "output_tokens": 5}
+    assert moved.details == {
+        'history_tokens': 110, 'sent_tokens': 42, 'tokens_saved': 68,
+        'summarized_messages': 7, 'summary_regenerated': True,
+    }
+    assert reused.summary == "resumo 1" and reused.recent == ["007", "008", "009", "010", "011"]
+    assert reused.details['summary_regenerated'] is False
+    assert reused.summary_usage is None
+
+
+def test_small_history_is_sent_verbatim_and_config_can_disable_or_reject():
+    history, _ = _history(4)
+
+    async def summarize(previous, transcript, config):
+        raise AssertionError("não deveria resumir")
+
+    window = asyncio.run(build_context_window(history, 4, _config(), summarize))
+    assert window.summary is None and window.recent == ["000", "001", "002", "003"]
+    assert window.details['tokens_saved'] == 0
+
+    assert parse_context_window_config({"context_window": {"enabled": False}}) is None
+    assert parse_context_window_config({"context_window": {"max_history_tokens": 100}}) is None # Opt-in
+    assert parse_context_window_config(None) is None
+    with pytest.raises(ValueError):
+        _config(max_history_tokens=10)
+
+
+def test_failed_summary_keeps_previous_summary_and_verbatim_tail():
+    history, messages = _history(12)
+    results = [("resumo 1", {"input_tokens": 50, "output_tokens": 5}), None]
+
+    async def summarize(previous, transcript, config):
+        return results.pop(0)
+
+    async def scenario():
+        first = await build_context_window(history, 11, _config(), summarize)
+        history.extend(messages[12:], str)
+        # Força a janela a andar de novo com um orçamento menor; o resumo falha
+        failed = await build_context_window(history, 12, _config(max_history_tokens=45), summarize)
+        return first, failed
+
+    first, failed = asyncio.run(scenario())
+    assert first.summary == "resumo 1"
+    assert failed.summary == "resumo 1" and failed.recent == ["007", "008", "009", "010", "011"]
+    assert failed.summary_usage is None
+    assert failed.details['summary_failed'] is True and failed.details['summarized_messages'] == 7
+    assert 'summary_failed' not in first.details
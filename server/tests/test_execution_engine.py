@@ -0,0 +1,292 @@
+import asyncio
+import time
+
+import pytest
+
+from app.models.workflow import WorkflowNode, WorkflowStored
+from app.services import execution_engine, workflow_compiler
+from app.services.llm_executors import FakeLLMExecutor, LLMExecutorError
+from app.services.node_cache import NodeResultCache
+from app.services.workflow_tracing import TraceRecorder
+
+
+LLM_LATENCY = 0.05
+
+
+@pytest.fixture(autouse=True)
+def fast_llm(use_llm):
+    """Substitui o backend de LLM por uma versão rápida e determinística."""
+    calls = []
+
+    async def fake_llm_call(instruction, input_data):
+        calls.append(instruction)
+        await asyncio.sleep(LLM_LATENCY)
+        return {"result": f"{instruction}({input_data})"}, {"input_tokens": 3, "output_tokens": 5}
+
+    use_llm(fake_llm_call)
+    return calls
+
+
+def llm(node_id, instruction=None, **data):
+    return WorkflowNode(id=node_id, type="llmAgent", data={"instruction": instruction or node_id, **data})
+
+
+def test_parallel_branches_run_concurrently():
+    tree = [WorkflowNode(id="p", type="parallelAgent", data={}, children=[llm(f"b{i}") for i in range(4)])]
+
+    started = time.perf_counter()
+    outputs = asyncio.run(execution_engine.run_workflow(tree, {"q": 1}))
+    elapsed = time.perf_counter() - started
+
+    assert [o["result"] for o in outputs[0]] == [f"b{i}({{'q': 1}})" for i in range(4)]
+    assert elapsed < LLM_LATENCY * 3
+
+
+def test_max_concurrency_caps_llm_calls():
+    tree = [WorkflowNode(id="p", type="parallelAgent", data={}, children=[llm(f"b{i}") for i in range(4)])]
+
+    started = time.perf_counter()
+    asyncio.run(execution_engine.run_workflow(tree, {}, max_concurrency=1))
+    elapsed = time.perf_counter() - started
+
+    assert elapsed >= LLM_LATENCY * 4
+
+
+def test_sequential_and_loop_chain_outputs(fast_llm):
+    tree = [
+        WorkflowNode(id="s", type="sequentialAgent", data={}, children=[
+            llm("a"),
+            WorkflowNode(id="l", type="loopAgent", data={"iterations": "2"}, children=[llm("b")]),
+        ])
+    ]
+
+    outputs = asyncio.run(execution_engine.run_workflow(tree, "x"))
+
+    assert fast_llm == ["a", "b", "b"]
+    expected = {"result": "a(x)"}
+    for _ in range(2):
+        expected = {"result": f"b({expected})"}
+    assert outputs == [expected]
+
+
+def test_compiled_plan_lays_out_children_contiguously():
+    tree = [
+        WorkflowNode(id="s", type="sequentialAgent", data={}, children=[
+            llm("a"),
+            WorkflowNode(id="p", type="parallelAgent", data={}, children=[llm("b"), llm("c")]),
+        ]),
+        WorkflowNode(id="l", type="loopAgent", data={"iterations": "3"}, children=[llm("d")]),
+    ]
+
+    plan = workflow_compiler.compile_workflow(tree)
+
+    assert plan.root_count == 2
+    index = {node_id: i for i, node_id in enumerate(plan.node_ids)}
+    assert [plan.node_ids[i] for i in plan.children(index["s"])] == ["a", "p"]
+    assert [plan.node_ids[i] for i in plan.children(index["p"])] == ["b", "c"]
+    assert plan.iterations[index["l"]] == 3
+    assert plan.instructions[index["d"]] == "d"
+
+
+def test_compile_rejects_invalid_loop():
+    bad = [WorkflowNode(id="l", type="loopAgent", data={"iterations": "many"}, children=[llm("a")])]
+
+    with pytest.raises(workflow_compiler.WorkflowCompileError):
+        workflow_compiler.compile_workflow(bad)
+
+
+def test_deep_sequential_chain_does_not_hit_recursion_limit(monkeypatch, use_llm):
+    async def instant_llm_call(instruction, input_data):
+        return input_data + 1, {}
+
+    use_llm(instant_llm_call)
+    monkeypatch.setattr("builtins.print", lambda *args, **kwargs: None)
+    # Monta diretamente o plano de uma cadeia de 5000 sequenciais aninhados,
+    # profundo demais para ser validado como árvore Pydantic.
+    depth = 5000
+    plan = workflow_compiler.CompiledWorkflow()
+    plan.root_count = 1
+    for i in range(depth + 1):
+        is_leaf = i == depth
+        plan.node_ids.append(f"n{i}")
+        plan.node_types.append("llmAgent" if is_leaf else "sequentialAgent")
+        plan.opcodes.append(workflow_compiler.OP_LLM if is_leaf else workflow_compiler.OP_SEQUENTIAL)
+        plan.child_start.append(i + 1)
+        plan.child_count.append(0 if is_leaf else 1)
+        plan.iterations.append(0)
+        plan.instructions.append("inc" if is_leaf else None)
+        plan.generation_params.append({} if is_leaf else None)
+        plan.cache_prefixes.append(None)
+        plan.code_limits.append(None)
+        plan.node_data.append({})
+
+    outputs = asyncio.run(execution_engine.run_compiled_workflow(plan, 0))
+
+    assert outputs == [1]
+
+
+def test_on_event_reports_start_and_finish_for_each_node():
+    tree = [WorkflowNode(id="s", type="sequentialAgent", data={}, children=[llm("a"), llm("b")])]
+    events = []
+
+    plan = workflow_compiler.compile_workflow(tree)
+    asyncio.run(execution_engine.run_compiled_workflow(plan, {}, on_event=events.append))
+
+    assert [(e["event"], e["node_id"]) for e in events] == [
+        ("node_start", "s"),
+        ("node_start", "a"),
+        ("node_finish", "a"),
+        ("node_start", "b"),
+        ("node_finish", "b"),
+        ("node_finish", "s"),
+    ]
+    finish = events[-1]
+    assert finish["type"] == "sequentialAgent"
+    assert finish["duration_ms"] >= LLM_LATENCY * 2 * 1000
+    assert finish["output_preview"] == str({"result": "b({'result': 'a({})'})"})
+
+
+def test_node_cache_skips_repeated_llm_calls(fast_llm):
+    tree = [WorkflowNode(id="p", type="parallelAgent", data={}, children=[
+        llm("a", temperature=0),
+        llm("b", cache=False),
+    ])]
+    cache = NodeResultCache(max_entries=10)
+
+    first = asyncio.run(execution_engine.run_workflow(tree, {"day": 1}, cache=cache))
+    second = asyncio.run(execution_engine.run_workflow(tree, {"day": 1}, cache=cache))
+    asyncio.run(execution_engine.run_workflow(tree, {"day": 2}, cache=cache))
+
+    assert first == second
+    assert fast_llm == ["a", "b", "b", "a", "b"]
+    assert (cache.hits, len(cache)) == (1, 2)
+
+
+def test_node_cache_evicts_lru_and_expired_entries():
+    now = [0.0]
+    cache = NodeResultCache(max_entries=2, ttl_seconds=10, clock=lambda: now[0])
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("b") == (False, None)
+    assert cache.get("a") == (True, 1)
+
+    now[0] = 11
+    assert cache.get("c") == (False, None)
+
+
+def _loop_tree(**loop_data):
+    return [WorkflowNode(id="l", type="loopAgent", data={"iterations": 10, **loop_data}, children=[llm("refine")])]
+
+
+def _run_loop(use_llm, tree, outputs):
+    async def refine(instruction, input_data):
+        return (outputs.pop(0) if outputs else {"draft": "final"}), {}
+
+    use_llm(refine)
+    events = []
+    plan = workflow_compiler.compile_workflow(tree)
+    result = asyncio.run(execution_engine.run_compiled_workflow(plan, {}, on_event=events.append))
+    return result, events[-1]
+
+
+def test_loop_stops_when_output_converges(use_llm):
+    outputs, finish = _run_loop(use_llm, _loop_tree(convergence="unchanged"), [{"draft": "v1"}])
+
+    assert outputs == [{"draft": "final"}]
+    assert (finish["iterations_run"], finish["stop_reason"]) == (3, "converged")
+
+
+def test_loop_stops_on_condition(use_llm):
+    tree = _loop_tree(stop_condition={"field": "score", "operator": "gte", "value": 0.9})
+    outputs, finish = _run_loop(use_llm, tree, [{"score": 0.5}, {"score": 0.95}, {"score": 0.99}])
+
+    assert outputs == [{"score": 0.95}]
+    assert (finish["iterations_run"], finish["stop_reason"]) == (2, "condition_met")
+
+
+def test_loop_without_policy_runs_all_iterations(use_llm):
+    outputs, finish = _run_loop(use_llm, _loop_tree(), [])
+
+    assert (finish["iterations_run"], finish["stop_reason"]) == (10, "max_iterations")
+
+
+def test_compile_rejects_unknown_stop_operator():
+    with pytest.raises(workflow_compiler.WorkflowCompileError):
+        workflow_compiler.compile_workflow(_loop_tree(stop_condition={"operator": "matches", "value": "x"}))
+
+
+def test_tracer_records_nested_spans_and_exports_chrome_trace():
+    tree = [WorkflowNode(id="s", type="sequentialAgent", data={}, children=[
+        llm("a"),
+        WorkflowNode(id="p", type="parallelAgent", data={}, children=[llm("b"), llm("c")]),
+    ])]
+    tracer = TraceRecorder()
+
+    plan = workflow_compiler.compile_workflow(tree)
+    asyncio.run(execution_engine.run_compiled_workflow(plan, {}, tracer=tracer))
+
+    spans = {span.node_id: span for span in tracer.spans}
+    assert spans["a"].parent_id == spans["p"].parent_id == spans["s"].span_id
+    assert spans["b"].parent_id == spans["c"].parent_id == spans["p"].span_id
+    assert spans["b"].lane != spans["c"].lane
+    assert (spans["a"].input_tokens, spans["a"].output_tokens) == (3, 5)
+    assert spans["s"].duration >= spans["a"].duration + spans["p"].duration
+
+    trace = tracer.to_chrome_trace(other_data={"workflow_id": "wf-1"})
+    assert {e["name"] for e in trace["traceEvents"]} == {"s", "a", "p", "b", "c"}
+    assert all(e["ph"] == "X" and e["dur"] >= 0 for e in trace["traceEvents"])
+    assert trace["otherData"] == {"workflow_id": "wf-1"}
+
+
+def test_fake_executor_is_deterministic_and_fails_at_configured_rate():
+    fixed = FakeLLMExecutor(latency="fixed", mean_seconds=0)
+    first = asyncio.run(fixed.generate("resuma", {"doc": 1}, {}))
+    assert asyncio.run(fixed.generate("resuma", {"doc": 1}, {})) == first
+    assert asyncio.run(fixed.generate("resuma", {"doc": 2}, {}))[0] != first[0]
+
+    samples = [FakeLLMExecutor(latency="long_tail", mean_seconds=0.1, seed=7).sample_latency() for _ in range(2)]
+    assert samples[0] == samples[1]
+
+    flaky = FakeLLMExecutor(mean_seconds=0, failure_rate=1.0)
+    with pytest.raises(LLMExecutorError):
+        asyncio.run(flaky.generate("x", {}, {}))
+
+
+def test_llm_executor_receives_generation_params():
+    received = []
+
+    class RecordingExecutor(FakeLLMExecutor):
+        async def generate(self, instruction, input_data, params):
+            received.append(params)
+            return await super().generate(instruction, input_data, params)
+
+    tree = [llm("a", model="gemini-1.5-pro", temperature=0.2, cache=False)]
+    executor = RecordingExecutor(mean_seconds=0)
+    asyncio.run(execution_engine.run_workflow(tree, {}, llm_executor=executor))
+
+    assert received == [{"model": "gemini-1.5-pro", "temperature": 0.2}]
+
+
+def test_compiled_plan_cache_is_bounded_lru(monkeypatch):
+    monkeypatch.setattr(workflow_compiler.settings, "WORKFLOW_COMPILED_CACHE_SIZE", 2)
+    monkeypatch.setattr(workflow_compiler, "_compiled_cache", workflow_compiler.OrderedDict())
+    workflows = [
+        WorkflowStored(id=f"wf-{i}", name=None, created_at="2025-01-01T00:00:00Z", workflow_tree=[llm("a")])
+        for i in range(3)
+    ]
+    first = workflow_compiler.get_compiled_workflow(workflows[0])
+    workflow_compiler.get_compiled_workflow(workflows[1])
+    assert workflow_compiler.get_compiled_workflow(workflows[0]) is first # Torna wf-0 o mais recente
+    workflow_compiler.get_compiled_workflow(workflows[2])
+
+    assert list(workflow_compiler._compiled_cache) == ["wf-0", "wf-2"]
+
+
+def test_compile_rejects_duplicate_node_ids():
+    tree = [WorkflowNode(id="p", type="parallelAgent", data={}, children=[llm("a"), llm("a")])]
+
+    with pytest.raises(workflow_compiler.WorkflowCompileError, match="duplicado"):
+        workflow_compiler.compile_workflow(tree)
@@ -0,0 +1,153 @@
+import asyncio
+
+import pytest
+
+from app.config import settings
+from app.services.llm_call_policy import (
+    CallPolicy, HedgeBudget, LatencyTracker, LLMDeadlineExceeded, call_with_policy, parse_call_policy,
+    stream_with_deadlines,
+)
+from app.services.llm_circuit_breaker import ModelGate
+
+
+def _warm_tracker(seconds=0.01):
+    tracker = LatencyTracker(min_samples=3)
+    for _ in range(3):
+        tracker.record("gemini", seconds)
+    return tracker
+
+
+def _scripted_call(delays):
+    """Cada chamada dorme o próximo atraso da lista e devolve seu índice."""
+    calls = []
+
+    async def call():
+        index = len(calls)
+        calls.append("started")
+        try:
+            await asyncio.sleep(delays[index])
+        except asyncio.CancelledError:
+            calls[index] = "cancelled"
+            raise
+        calls[index] = "finished"
+        return index
+
+    return call, calls
+
+
+def test_slow_primary_is_hedged_and_loser_cancelled():
+    call, calls = _scripted_call([1.0, 0.01])
+    budget = HedgeBudget()
+    budget.tokens = 1
+    details = {}
+    policy = CallPolicy(deadline_seconds=2, hedge_enabled=True, hedge_percentile=50, hedge_min_delay_seconds=0)
+
+    async def scenario():
+        result = await call_with_policy(call, "gemini", policy, _warm_tracker(), budget, details)
+        await asyncio.sleep(0) # Deixa o cancelamento da chamada original ser processado
+        return result
+
+    assert asyncio.run(scenario()) == 1
+    assert calls == ["cancelled", "finished"]
+    assert details['hedged'] is True and details['hedge_won'] is True and details['hedge_delay_ms'] == 10.0
+
+
+def test_hedge_takes_its_own_gate_slot_or_is_skipped():
+    policy = CallPolicy(deadline_seconds=2, hedge_enabled=True, hedge_percentile=50, hedge_min_delay_seconds=0)
+
+    async def scenario(max_concurrency):
+        gate = ModelGate("gemini", max_concurrency=max_concurrency)
+        call, calls = _scripted_call([0.1, 0.01])
+        budget = HedgeBudget()
+        budget.tokens = 1
+        details = {}
+        async with gate.slot():
+            result = await call_with_policy(call, "gemini", policy, _warm_tracker(), budget, details, gate)
+        await asyncio.sleep(0) # Processa o cancelamento e a devolução da vaga do hedge
+        return result, details, budget.tokens, gate._slots._value
+
+    result, details, tokens, free_slots = asyncio.run(scenario(1))
+    assert (result, details['hedged'], details['hedge_skipped']) == (0, False, 'no_capacity')
+    assert tokens == pytest.approx(1.1) # A ficha não é gasta quando falta vaga
+
+    result, details, tokens, free_slots = asyncio.run(scenario(2))
+    assert (result, details['hedged'], free_slots) == (1, True, 2)
+    assert tokens == pytest.approx(0.1)
+
+
+def test_hedge_rate_limit_and_deadline_are_recorded():
+    call, calls = _scripted_call([1.0])
+    details = {}
+    policy = CallPolicy(deadline_seconds=0.05, hedge_enabled=True, hedge_percentile=50, hedge_max_rate=0.1, hedge_min_delay_seconds=0)
+
+    tracker = _warm_tracker()
+
+    with pytest.raises(LLMDeadlineExceeded):
+        asyncio.run(call_with_policy(call, "gemini", policy, tracker, HedgeBudget(), details))
+    assert calls == ["cancelled"]
+    assert tracker.percentile("gemini", 100) == 0.05 # Timeout registrado como amostra censurada no prazo
+    assert details == {
+        'deadline_seconds': 0.05, 'hedged': False, 'timed_out': True, 'hedge_skipped': 'rate_limited',
+    }
+
+
+def test_no_hedge_while_warming_up_and_policy_parsing():
+    call, _ = _scripted_call([0.0])
+    details = {}
+    policy = CallPolicy(deadline_seconds=1, hedge_enabled=True)
+    assert asyncio.run(call_with_policy(call, "gemini", policy, LatencyTracker(), HedgeBudget(), details)) == 0
+    assert details['hedge_skipped'] == 'warming_up'
+
+    parsed = parse_call_policy({"latency": {"deadline_seconds": 5, "hedge": {"enabled": True}}})
+    assert (parsed.deadline_seconds, parsed.hedge_enabled, parsed.hedge_percentile) == (5, True, 95)
+    with pytest.raises(ValueError):
+        parse_call_policy({"latency": {"hedge": {"max_rate": 2}}})
+
+
+def _scripted_stream(open_delay, chunk_delays):
+    async def chunks():
+        for index, delay in enumerate(chunk_delays):
+            await asyncio.sleep(delay)
+            yield index
+
+    async def start():
+        await asyncio.sleep(open_delay)
+        return chunks()
+
+    return start
+
+
+def _collect(start, policy, details):
+    async def scenario():
+        received = []
+        try:
+            async for chunk in stream_with_deadlines(start, policy, details):
+                received.append(chunk)
+        finally:
+            details['received'] = received
+        return received
+
+    return asyncio.run(scenario())
+
+
+def test_stream_deadlines_bound_first_chunk_and_idle_gaps():
+    policy = CallPolicy(deadline_seconds=5, first_chunk_seconds=0.1, idle_seconds=0.1)
+
+    details = {}
+    assert _collect(_scripted_stream(0.02, [0.02, 0.05, 0.05]), policy, details) == [0, 1, 2]
+    assert details['timed_out'] is False and details['time_to_first_chunk_ms'] >= 40
+
+    details = {}
+    with pytest.raises(LLMDeadlineExceeded):
+        _collect(_scripted_stream(0.06, [0.06]), policy, details) # Abrir + primeiro chunk passa do prazo
+    assert (details['timed_out'], details['timeout_phase'], details['received']) == (True, 'first_chunk', [])
+
+    details = {}
+    with pytest.raises(LLMDeadlineExceeded):
+        _collect(_scripted_stream(0, [0, 0.5]), policy, details)
+    assert (details['timed_out'], details['timeout_phase'], details['received']) == (True, 'idle', [0])
+
+    parsed = parse_call_policy({"latency": {"deadline_seconds": 5, "idle_seconds": 2}})
+    assert (parsed.first_chunk_seconds, parsed.idle_seconds) == (settings.LLM_STREAM_FIRST_CHUNK_SECONDS, 2)
+    with pytest.raises(ValueError):
+        parse_call_policy({"latency": {"first_chunk_seconds": 0}})
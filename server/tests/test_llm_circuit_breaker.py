@@ -0,0 +1,115 @@
+import asyncio
+
+import pytest
+
+from app.services.llm_circuit_breaker import CLOSED, HALF_OPEN, OPEN, LLMUnavailableError, ModelGate
+
+
+class _APIError(Exception):
+    """Imita as exceções do google-api-core, que trazem o status HTTP em `code`."""
+
+    def __init__(self, code):
+        super().__init__(f"HTTP {code}")
+        self.code = code
+
+
+async def _fail(gate, error=None):
+    error = error or _APIError(429)
+    with pytest.raises(type(error)):
+        async with gate.slot():
+            raise error
+
+
+def test_circuit_opens_after_consecutive_failures_and_recovers_with_one_probe():
+    now = [0.0]
+    gate = ModelGate("gemini", failure_threshold=2, reset_seconds=10, clock=lambda: now[0])
+
+    async def scenario():
+        await _fail(gate)
+        assert gate.state == CLOSED
+        await _fail(gate)
+        assert gate.state == OPEN
+
+        with pytest.raises(LLMUnavailableError) as refused:
+            async with gate.slot():
+                pass
+        assert refused.value.reason == "circuit_open" and refused.value.retry_after_seconds == 10
+
+        # Meio-aberto: a chamada de teste falha e o circuito volta a abrir
+        now[0] = 10
+        await _fail(gate)
+        assert gate.state == OPEN
+
+        now[0] = 20
+        probe_started = asyncio.Event()
+        release_probe = asyncio.Event()
+
+        async def probe():
+            async with gate.slot():
+                probe_started.set()
+                await release_probe.wait()
+
+        task = asyncio.ensure_future(probe())
+        await probe_started.wait()
+        assert gate.state == HALF_OPEN
+        with pytest.raises(LLMUnavailableError): # Só uma chamada de teste por vez
+            async with gate.slot():
+                pass
+        release_probe.set()
+        await task
+        assert gate.state == CLOSED and gate.consecutive_failures == 0
+
+    asyncio.run(scenario())
+
+
+def test_queue_depth_is_limited():
+    gate = ModelGate("gemini", max_concurrency=1, max_queue=1)
+
+    async def scenario():
+        release = asyncio.Event()
+
+        async def hold():
+            async with gate.slot():
+                await release.wait()
+
+        running = asyncio.ensure_future(hold())
+        queued = asyncio.ensure_future(hold())
+        await asyncio.sleep(0)
+        assert gate.waiting == 1
+        with pytest.raises(LLMUnavailableError) as refused:
+            async with gate.slot():
+                pass
+        assert refused.value.reason == "queue_full"
+        release.set()
+        await asyncio.gather(running, queued)
+        assert gate.waiting == 0 and gate.state == CLOSED
+
+    asyncio.run(scenario())
+
+
+def test_only_backend_failures_count_toward_the_circuit():
+    gate = ModelGate("gemini", failure_threshold=1)
+
+    async def _hold(gate):
+        async with gate.slot():
+            await asyncio.sleep(10)
+
+    async def scenario():
+        for error in (_APIError(400), ValueError("bad prompt"), RuntimeError("bug")):
+            await _fail(gate, error)
+
+        cancelled = asyncio.ensure_future(_hold(gate))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await cancelled
+        assert gate.state == CLOSED and gate.consecutive_failures == 0
+
+        await _fail(gate, asyncio.TimeoutError())
+        assert gate.state == OPEN
+
+    asyncio.run(scenario())
+    for code, counts in ((503, True), (500, True), (429, True), (404, False)):
+        gate = ModelGate("gemini", failure_threshold=1)
+        asyncio.run(_fail(gate, _APIError(code)))
+        assert (gate.state == OPEN) is counts
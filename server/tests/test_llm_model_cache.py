@@ -0,0 +1,23 @@
+from app.services.llm_model_cache import ModelHandleCache
+
+
+def test_handles_are_reused_per_model_instruction_and_config_and_evicted_lru():
+    created = []
+
+    def factory(model_name, system_instruction, generation_config):
+        created.append((model_name, system_instruction))
+        return object()
+
+    cache = ModelHandleCache(factory, max_entries=2)
+    config = {"temperature": 0.7, "top_k": 40}
+
+    first = cache.get("gemini-1.5-flash", "Seja breve.", config)
+    assert cache.get("gemini-1.5-flash", "Seja breve.", {"top_k": 40, "temperature": 0.7}) is first
+    cache.get("gemini-1.5-flash", "Seja detalhado.", config)
+    cache.get("gemini-1.5-flash", "Seja breve.", config) # Torna o primeiro o mais recente
+    cache.get("gemini-1.5-pro", "Seja breve.", config) # Descarta "Seja detalhado."
+
+    assert len(cache) == 2
+    assert cache.get("gemini-1.5-flash", "Seja breve.", config) is first
+    assert (cache.hits, cache.misses) == (3, 3)
+    assert created[-1] == ("gemini-1.5-pro", "Seja breve.")
@@ -0,0 +1,44 @@
+import pytest
+
+from app.services.llm_response_cache import (
+    ENTRY_OVERHEAD_BYTES, ResponseCache, make_response_key, parse_response_cache_config
+)
+
+CONFIG = {"temperature": 0.0, "top_k": 40}
+
+
+def test_key_normalizes_whitespace_but_not_content():
+    tail = [("USER", "Oi"), ("AGENT", "Olá!  Como posso ajudar?")]
+    key = make_response_key("gemini-1.5-flash", "FAQ", CONFIG, tail, "Qual o  horário?\n")
+
+    assert key == make_response_key("gemini-1.5-flash", "FAQ", dict(CONFIG), [("USER", " Oi"), ("AGENT", "Olá! Como posso ajudar?")], "Qual o horário?")
+    assert key != make_response_key("gemini-1.5-flash", "FAQ", CONFIG, tail, "Qual o endereço?")
+    assert key != make_response_key("gemini-1.5-flash", "FAQ", CONFIG, tail[1:], "Qual o horário?")
+    assert key != make_response_key("gemini-1.5-flash", "FAQ", {**CONFIG, "temperature": 0.5}, tail, "Qual o horário?")
+
+
+def test_entries_expire_and_are_evicted_by_size():
+    now = [0.0]
+    cache = ResponseCache(max_bytes=2 * (10 + ENTRY_OVERHEAD_BYTES), clock=lambda: now[0])
+    usage = {"input_tokens": 100, "output_tokens": 20}
+
+    cache.put("a", "x" * 10, usage, ttl_seconds=60)
+    cache.put("b", "y" * 10, usage, ttl_seconds=60)
+    assert cache.get("a").text == "x" * 10 # Torna "a" a mais recente
+    cache.put("c", "z" * 10, usage, ttl_seconds=60) # Descarta "b"
+    assert cache.get("b") is None
+    assert cache.get("a").token_usage == usage
+
+    now[0] = 61
+    assert cache.get("a") is None
+    assert cache.size_bytes == 10 + ENTRY_OVERHEAD_BYTES # Só "c", que ainda não foi lida
+    assert (cache.hits, cache.misses) == (2, 2)
+
+
+def test_config_is_opt_in():
+    assert parse_response_cache_config(None) is None
+    assert parse_response_cache_config({"response_cache": {"enabled": False}}) is None
+    config = parse_response_cache_config({"response_cache": {"enabled": True, "ttl_seconds": 30}})
+    assert (config.ttl_seconds, config.history_messages) == (30, 2)
+    with pytest.raises(ValueError):
+        parse_response_cache_config({"response_cache": {"enabled": True, "ttl_seconds": 0}})
@@ -0,0 +1,70 @@
+import asyncio
+
+import pytest
+
+from app.services.model_router import FAST, STRONG, fetch_tool_names, parse_routing_policy, route_message
+
+
+def _policy(**overrides):
+    return parse_routing_policy({"routing": {"enabled": True, "max_fast_chars": 80, "max_fast_history": 4, **overrides}}, "gemini-1.5-pro")
+
+
+def test_trivial_turns_go_to_the_fast_model():
+    decision = route_message(_policy(), "Oi, bom dia!", history_depth=0)
+    assert decision == {'tier': FAST, 'model': 'gemini-1.5-flash', 'reasons': []}
+
+
+@pytest.mark.parametrize("message, depth, reason", [
+    ("x" * 81, 0, "long_message"),
+    ("Veja:\n```python\nprint(1)\n```", 0, "code_block"),
+    ("Ok", 5, "deep_history"),
+    ("Consulte o weather_lookup para Lisboa", 0, "tool_mention"),
+    ("Compare os dois planos", 0, "strong_keyword"),
+])
+def test_complex_turns_go_to_the_strong_model(message, depth, reason):
+    decision = route_message(_policy(), message, history_depth=depth, tool_names=["weather_lookup"])
+    assert decision['tier'] == STRONG and decision['model'] == 'gemini-1.5-pro'
+    assert decision['reasons'] == [reason]
+
+
+def test_keywords_match_whole_words_and_routing_is_opt_in():
+    assert route_message(_policy(), "Explique o plano de hoje", history_depth=0)['reasons'] == ["strong_keyword"]
+    assert route_message(_policy(), "Quero o planejamento", history_depth=0)['tier'] == FAST
+    assert route_message(_policy(strong_keywords=["urgente"]), "Compare", history_depth=0)['tier'] == FAST
+    assert parse_routing_policy({"routing": {"enabled": False}}, "gemini-1.5-pro") is None
+    assert parse_routing_policy(None, "gemini-1.5-pro") is None
+    with pytest.raises(ValueError):
+        _policy(strong_keywords="urgente")
+
+
+class _AgentToolsQuery:
+    """Imita a consulta encadeada do cliente Supabase sobre `agent_tools`."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.calls = []
+
+    def table(self, name):
+        self.calls.append(('table', name))
+        return self
+
+    def select(self, columns):
+        self.calls.append(('select', columns))
+        return self
+
+    def eq(self, column, value):
+        self.calls.append(('eq', column, value))
+        return self
+
+    async def execute(self):
+        return type("Response", (), {"data": self.rows})()
+
+
+def test_tool_names_are_loaded_from_the_junction_table_and_route_to_strong():
+    db = _AgentToolsQuery([{"tools": {"name": "weather_lookup"}}, {"tools": None}])
+    tool_names = asyncio.run(fetch_tool_names(db, "agent-1"))
+
+    assert tool_names == ["weather_lookup"]
+    assert db.calls == [('table', 'agent_tools'), ('select', 'tools(name)'), ('eq', 'agent_id', 'agent-1')]
+    decision = route_message(_policy(), "Use o weather_lookup", history_depth=0, tool_names=tool_names)
+    assert decision['reasons'] == ["tool_mention"]
@@ -0,0 +1,48 @@
+import asyncio
+
+import pytest
+
+from app.services.token_estimator import (
+    MIN_CALIBRATION_SAMPLES, PromptTooLargeError, TokenEstimator, context_limit, learn_chars_per_token, model_family
+)
+
+
+def _row(model, prompt_chars, input_tokens):
+    return {
+        'model_name': model, 'input_tokens': input_tokens,
+        'details': {'llm_call': {'preflight': {'prompt_chars': prompt_chars}}},
+    }
+
+
+def test_families_and_context_limits():
+    assert model_family("gemini-1.5-flash-002") == "gemini-1.5"
+    assert model_family("gemini-1.5-pro") == "gemini-1.5"
+    assert context_limit("gemini-1.5-flash-002") == 1_048_576
+    assert context_limit("modelo-desconhecido") == 32_760
+
+
+def test_calibration_uses_median_ratio_per_family_with_minimum_samples():
+    rows = [_row("gemini-1.5-flash", 300, 100)] * MIN_CALIBRATION_SAMPLES + [_row("gemini-1.5-pro", 600, 100)]
+    rows += [_row("gemini-1.0-pro", 500, 100)] * (MIN_CALIBRATION_SAMPLES - 1)
+    assert learn_chars_per_token(rows) == {"gemini-1.5": 3.0}
+
+    async def fetch_rows():
+        return rows
+
+    estimator = TokenEstimator(fetch_rows=fetch_rows)
+    asyncio.run(estimator.refresh())
+    assert estimator.estimate("gemini-1.5-pro", 301) == 101
+    assert estimator.estimate("gemini-1.0-pro", 400) == 100 # Sem amostras suficientes: 4 caracteres por token
+
+
+def test_preflight_estimates_cost_and_rejects_prompts_that_do_not_fit():
+    estimator = TokenEstimator()
+    estimate = estimator.preflight("gemini-1.5-flash", 4_000_000, 2048)
+    assert estimate['estimated_input_tokens'] == 1_000_000
+    assert estimate['estimated_min_cost'] == pytest.approx(0.5)
+    assert estimate['estimated_max_cost'] == pytest.approx(0.5 + 2048 * 1.5 / 1_000_000)
+
+    with pytest.raises(PromptTooLargeError) as too_large:
+        estimator.preflight("gemini-1.5-flash", 4_200_000, 2048)
+    assert too_large.value.limit == 1_048_576
+    assert estimator.estimate_prompt("gemini-1.5-flash", 4_200_000, 2048)['fits_context'] is False
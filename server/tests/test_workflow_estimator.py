@@ -0,0 +1,53 @@
+import asyncio
+
+from app.models.workflow import WorkflowNode
+from app.services import workflow_compiler
+from app.services.llm_pricing import calculate_cost
+from app.services.workflow_estimator import ModelStatsProvider, estimate_workflow, learn_model_stats
+
+
+def llm(node_id, **data):
+    return WorkflowNode(id=node_id, type="llmAgent", data={"instruction": node_id, **data})
+
+
+ROWS = [
+    {"model_name": "gemini-1.5-pro", "input_tokens": 100, "output_tokens": 40, "details": {"latency_ms": 2000}},
+    {"model_name": "gemini-1.5-pro", "input_tokens": 300, "output_tokens": 60, "details": {"latency_ms": 4000}},
+    {"model_name": "gemini-1.5-flash", "input_tokens": 50, "output_tokens": 10, "details": {"latency_ms": 500}},
+    {"model_name": "gemini-1.5-flash", "input_tokens": 50, "output_tokens": 10, "details": {}},
+]
+
+
+def test_estimate_follows_critical_path_and_loop_multipliers():
+    tree = [WorkflowNode(id="s", type="sequentialAgent", data={}, children=[
+        llm("plan", model="gemini-1.5-pro"),
+        WorkflowNode(id="p", type="parallelAgent", data={}, children=[
+            llm("a", model="gemini-1.5-flash"),
+            WorkflowNode(id="l", type="loopAgent", data={"iterations": 3}, children=[llm("b", model="gemini-1.5-flash")]),
+        ]),
+    ])]
+    stats = learn_model_stats(ROWS)
+
+    estimate = estimate_workflow(workflow_compiler.compile_workflow(tree), stats, latency_budget_ms=3000)
+
+    assert stats["gemini-1.5-pro"].latency_p50_ms == 2000
+    assert estimate["critical_path_ms"] == 2000 + 3 * 500
+    assert estimate["llm_calls"] == 5
+    assert estimate["models"]["gemini-1.5-flash"]["llm_calls"] == 4
+    expected_cost = calculate_cost("gemini-1.5-pro", 200, 50) + 4 * calculate_cost("gemini-1.5-flash", 50, 10)
+    assert abs(estimate["estimated_cost"] - expected_cost) < 1e-8
+    assert estimate["within_budget"] is False
+
+
+def test_stats_provider_falls_back_to_defaults_when_history_is_unavailable():
+    async def failing_fetch():
+        raise ConnectionError("sem rede")
+
+    provider = ModelStatsProvider(fetch_rows=failing_fetch)
+    plan = workflow_compiler.compile_workflow([llm("a", model="desconhecido")])
+
+    estimate = estimate_workflow(plan, asyncio.run(provider.get()))
+
+    assert estimate["llm_calls"] == 1
+    assert estimate["models"]["desconhecido"]["stats_samples"] == 0
+    assert estimate["within_budget"] is None
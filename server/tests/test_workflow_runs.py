@@ -0,0 +1,166 @@
+import asyncio
+
+import pytest
+
+from app.models.workflow import WorkflowNode
+from app.services import workflow_compiler
+from app.services.workflow_checkpoints import PersistentCheckpointStore
+from app.services.workflow_runs import RunNotActiveError, RunNotResumableError, RunQueueFullError, WorkflowRunManager
+from app.services.workflow_store import WorkflowStore
+
+
+@pytest.fixture(autouse=True)
+def slow_llm(use_llm):
+    async def fake_llm_call(instruction, input_data):
+        await asyncio.sleep(0.05)
+        return {"result": instruction}, {}
+
+    use_llm(fake_llm_call)
+
+
+def make_plan():
+    tree = [WorkflowNode(id="a", type="llmAgent", data={"instruction": "a"})]
+    return workflow_compiler.compile_workflow(tree)
+
+
+def test_runs_are_queued_beyond_worker_limit_and_complete():
+    async def scenario():
+        manager = WorkflowRunManager(max_workers=1)
+        first = manager.submit("wf-1", make_plan(), {})
+        second = manager.submit("wf-1", make_plan(), {})
+        await asyncio.sleep(0.01)
+        statuses = (first.status, second.status)
+        while manager.active_count():
+            await asyncio.sleep(0.01)
+        return statuses, first, second
+
+    statuses, first, second = asyncio.run(scenario())
+
+    assert statuses == ("running", "queued")
+    assert first.status == second.status == "succeeded"
+    assert first.final_outputs == [{"result": "a"}]
+    assert first.finished_at is not None
+
+
+def test_cancel_running_run_and_reject_finished():
+    async def scenario():
+        manager = WorkflowRunManager(max_workers=1)
+        run = manager.submit("wf-1", make_plan(), {})
+        await asyncio.sleep(0.01)
+        manager.cancel(run.id)
+        await asyncio.sleep(0.01)
+        with pytest.raises(RunNotActiveError):
+            manager.cancel(run.id)
+        return run
+
+    run = asyncio.run(scenario())
+
+    assert run.status == "cancelled"
+    assert run.final_outputs is None
+
+
+def test_submit_rejects_when_queue_is_full():
+    async def scenario():
+        manager = WorkflowRunManager(max_workers=1, max_queued=1)
+        manager.submit("wf-1", make_plan(), {})
+        with pytest.raises(RunQueueFullError):
+            manager.submit("wf-1", make_plan(), {})
+
+    asyncio.run(scenario())
+
+
+def test_batch_isolates_record_errors_and_bounds_concurrency():
+    from app.services.workflow_batch import run_batch
+
+    lines = [b'{"n": 1}\n', b'\n', b'not json\n', b'{"n": 2}\n', b'{"n": 3}\n']
+
+    async def scenario():
+        return [result async for result in run_batch(make_plan(), lines, concurrency=2)]
+
+    results = asyncio.run(scenario())
+
+    assert sorted(r["index"] for r in results) == [0, 1, 2, 3]
+    by_index = {r["index"]: r for r in results}
+    assert by_index[1]["status"] == "error"
+    assert by_index[3] == {"index": 3, "status": "ok", "final_outputs": [{"result": "a"}]}
+
+
+def test_batch_reads_spooled_records_off_the_event_loop():
+    import tempfile
+
+    from app.services.workflow_batch import read_lines, run_batch
+
+    spool = tempfile.SpooledTemporaryFile(max_size=16, mode="w+b")
+    spool.write(b'{"n": 1}\n\n{"n": 2}\n{"n": 3}')
+    spool.seek(0)
+
+    async def scenario():
+        return [result async for result in run_batch(make_plan(), read_lines(spool, hint=8), concurrency=2)]
+
+    results = asyncio.run(scenario())
+
+    assert sorted(r["index"] for r in results) == [0, 1, 2]
+    assert all(r["status"] == "ok" for r in results)
+
+
+@pytest.mark.parametrize("persistent", [False, True])
+def test_resume_replays_completed_nodes_from_checkpoints(use_llm, tmp_path, persistent):
+    calls = []
+    failures = {"b": 1}
+
+    async def flaky_llm_call(instruction, input_data):
+        calls.append(instruction)
+        if failures.get(instruction):
+            failures[instruction] -= 1
+            raise RuntimeError(f"falha transitória em {instruction}")
+        return f"{instruction}<{input_data}>", {}
+
+    use_llm(flaky_llm_call)
+    tree = [WorkflowNode(id="s", type="sequentialAgent", data={}, children=[
+        WorkflowNode(id=name, type="llmAgent", data={"instruction": name}) for name in ("a", "b", "c")
+    ])]
+    plan = workflow_compiler.compile_workflow(tree)
+
+    async def wait_idle(manager):
+        while manager.active_count():
+            await asyncio.sleep(0.01)
+
+    async def scenario():
+        checkpoints = None
+        if persistent:
+            store = WorkflowStore(f"sqlite:///{tmp_path / 'workflows.db'}")
+            checkpoints = PersistentCheckpointStore(lambda: store)
+        manager = WorkflowRunManager(max_workers=1, checkpoints=checkpoints)
+        run = manager.submit("wf-1", plan, "x")
+        await wait_idle(manager)
+        failed = (run.status, run.error, manager.checkpoints.count(run.id))
+        manager.resume(run.id)
+        await wait_idle(manager)
+        return manager, run, failed
+
+    manager, run, failed = asyncio.run(scenario())
+
+    assert failed == ("failed", "falha transitória em b", 1)
+    assert calls == ["a", "b", "b", "c"]
+    assert run.status == "succeeded"
+    assert run.attempts == 2
+    assert run.final_outputs == ["c<b<a<x>>>"]
+    assert manager.checkpoints.count(run.id) == 0
+    with pytest.raises(RunNotResumableError):
+        manager.resume(run.id)
+
+
+def test_persistent_checkpoints_survive_a_new_store_instance(tmp_path):
+    url = f"sqlite:///{tmp_path / 'workflows.db'}"
+    first = PersistentCheckpointStore(lambda: WorkflowStore(url))
+    asyncio.run(first.save("run-1", "s/a", {"texto": "ok", "itens": [1, 2]}))
+    asyncio.run(first.save("run-1", "s/a", {"texto": "substituído"}))
+    asyncio.run(first.save("run-1", "s/b", object())) # Não serializável: ignorado
+
+    reopened = PersistentCheckpointStore(lambda: WorkflowStore(url))
+    assert asyncio.run(reopened.load("run-1", "s/a")) == (True, {"texto": "substituído"})
+    assert asyncio.run(reopened.load("run-1", "s/b")) == (False, None)
+    assert reopened.count("run-1") == 1
+
+    reopened.clear("run-1")
+    assert first.count("run-1") == 0
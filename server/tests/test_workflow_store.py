@@ -0,0 +1,103 @@
+import pytest
+
+from app.models.workflow import WorkflowNode, WorkflowStored
+from app.services.workflow_store import InvalidCursorError, RevisionConflictError, WorkflowStore
+from app.services.workflow_versioning import WorkflowPatchError, apply_ops, diff_trees
+
+
+def make_workflow(index):
+    tree = [WorkflowNode(id="s", type="sequentialAgent", data={}, children=[
+        WorkflowNode(id=f"a{i}", type="llmAgent", data={"instruction": "x" * 100}) for i in range(index % 3 + 1)
+    ])]
+    return WorkflowStored(id=f"wf-{index:02d}", name=f"Workflow {index}", created_at=f"2025-01-{index % 5 + 1:02d}T00:00:00Z", workflow_tree=tree)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return WorkflowStore(f"sqlite:///{tmp_path / 'workflows.db'}")
+
+
+def test_saved_workflow_survives_a_new_store_instance(store, tmp_path):
+    store.save(make_workflow(1))
+
+    reopened = WorkflowStore(store.url)
+    workflow = reopened.get("wf-01")
+
+    assert workflow == make_workflow(1)
+    assert reopened.get(workflow.id) is workflow # Mesma instância: o plano compilado continua em cache
+    assert reopened.get("wf-99") is None
+
+
+def test_summaries_are_paginated_by_cursor_newest_first(store):
+    for index in range(12):
+        store.save(make_workflow(index))
+
+    pages, cursor = [], None
+    while True:
+        items, cursor = store.list_summaries(limit=5, cursor=cursor)
+        pages.append(items)
+        if cursor is None:
+            break
+
+    listed = [item for page in pages for item in page]
+    assert [len(page) for page in pages] == [5, 5, 2]
+    assert sorted(item.id for item in listed) == [f"wf-{i:02d}" for i in range(12)]
+    assert [(i.created_at, i.id) for i in listed] == sorted(((i.created_at, i.id) for i in listed), reverse=True)
+    assert {item.id: item.node_count for item in listed}["wf-02"] == 4
+
+
+def test_invalid_cursor_is_rejected(store):
+    with pytest.raises(InvalidCursorError):
+        store.list_summaries(cursor="not-a-cursor")
+
+
+def test_revisions_store_deltas_and_reconstruct_every_version(tmp_path):
+    store = WorkflowStore(f"sqlite:///{tmp_path / 'workflows.db'}", snapshot_interval=3)
+    workflow = make_workflow(2)
+    store.save(workflow)
+    trees = {1: workflow.workflow_tree}
+
+    current = workflow
+    for revision in range(2, 8):
+        new_tree = [node.copy(deep=True) for node in current.workflow_tree]
+        new_tree[0].children.insert(0, WorkflowNode(id=f"new{revision}", type="llmAgent", data={"instruction": "y"}))
+        new_tree[0].children[-1].data = {"instruction": f"edit {revision}"}
+        ops = diff_trees(current.workflow_tree, new_tree)
+        assert len(ops) == 2
+        current = WorkflowStored(**{**current.dict(), "workflow_tree": new_tree, "revision": revision, "name": f"v{revision}"})
+        store.commit_revision(current, ops, base_revision=revision - 1)
+        trees[revision] = new_tree
+
+    revisions = store.list_revisions(workflow.id)
+    assert [r.kind for r in reversed(revisions)] == ["snapshot", "delta", "delta", "snapshot", "delta", "delta", "snapshot"]
+    for revision, tree in trees.items():
+        assert store.get_revision(workflow.id, revision) == (tree, workflow.name if revision == 1 else f"v{revision}")
+    assert store.get_revision(workflow.id, 8) is None
+
+    with pytest.raises(RevisionConflictError):
+        store.commit_revision(current, [], base_revision=3)
+
+
+def test_apply_ops_rejects_invalid_operations():
+    tree = make_workflow(1).workflow_tree
+
+    for ops in ([{"op": "remove", "node_id": "missing"}], [{"op": "move", "node_id": "s", "parent_id": "a0"}],
+                [{"op": "insert", "parent_id": None, "node": {"id": "s", "type": "llmAgent"}}],
+                [{"op": "insert", "parent_id": None, "node": {"id": "n", "type": "llmAgent", "data": "x"}}],
+                [{"op": "insert", "parent_id": None, "node": {"id": "n", "type": "llmAgent", "data": [1]}}],
+                [{"op": "update", "node_id": "a0", "type": 1}]):
+        with pytest.raises(WorkflowPatchError):
+            apply_ops(tree, ops)
+
+
+def test_shared_store_is_created_lazily(tmp_path, monkeypatch):
+    from app.services import workflow_store as module
+
+    url = f"sqlite:///{tmp_path / 'lazy.db'}"
+    monkeypatch.setattr(module.settings, "WORKFLOW_STORE_URL", url)
+    monkeypatch.setattr(module, "_workflow_store", None)
+    assert not (tmp_path / "lazy.db").exists()
+
+    store = module.get_workflow_store()
+    assert store.url == url and module.get_workflow_store() is store
+    assert (tmp_path / "lazy.db").exists()
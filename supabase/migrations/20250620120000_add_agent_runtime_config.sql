@@ -0,0 +1,6 @@
+-- supabase/migrations/20250620120000_add_agent_runtime_config.sql
+
+ALTER TABLE public.agents
+ADD COLUMN runtime_config JSONB NULL;
+
+COMMENT ON COLUMN public.agents.runtime_config IS 'Stores runtime settings for chat turns (e.g. context_window token budget and summaries).';
@@ -0,0 +1,114 @@
+-- supabase/migrations/20250621120000_create_chat_turn_functions.sql
+
+-- Starts a chat turn in a single round-trip: gets or creates the caller's latest session with
+-- the agent, stores the user message and returns the agent config plus the session history.
+-- History is incremental (created_at >= p_history_after) when p_session_hint is the session
+-- that was resolved; otherwise it is the latest p_history_limit messages.
+-- SECURITY INVOKER: the caller's RLS policies apply to every statement.
+CREATE OR REPLACE FUNCTION public.chat_begin_turn(
+    p_agent_id UUID,
+    p_content TEXT,
+    p_content_metadata JSONB DEFAULT NULL,
+    p_session_hint UUID DEFAULT NULL,
+    p_history_after TIMESTAMPTZ DEFAULT NULL,
+    p_history_limit INTEGER DEFAULT 500
+)
+RETURNS JSONB AS $$
+DECLARE
+    v_user_id UUID := auth.uid();
+    v_agent public.agents%ROWTYPE;
+    v_session public.chat_sessions%ROWTYPE;
+    v_message public.chat_messages%ROWTYPE;
+    v_incremental BOOLEAN;
+    v_history JSONB;
+BEGIN
+    IF v_user_id IS NULL THEN
+        RAISE EXCEPTION 'Not authenticated' USING ERRCODE = '28000';
+    END IF;
+
+    SELECT * INTO v_agent FROM public.agents WHERE id = p_agent_id;
+    IF NOT FOUND THEN
+        RAISE EXCEPTION 'Agent not found' USING ERRCODE = 'P0002';
+    END IF;
+
+    UPDATE public.chat_sessions
+    SET updated_at = now()
+    WHERE id = (
+        SELECT id FROM public.chat_sessions
+        WHERE user_id = v_user_id AND agent_id = p_agent_id
+        ORDER BY updated_at DESC
+        LIMIT 1
+    )
+    RETURNING * INTO v_session;
+
+    IF NOT FOUND THEN
+        INSERT INTO public.chat_sessions (user_id, agent_id, session_title)
+        VALUES (v_user_id, p_agent_id, 'Chat with ' || v_agent.name)
+        RETURNING * INTO v_session;
+    END IF;
+
+    INSERT INTO public.chat_messages (session_id, sender_type, content, content_metadata)
+    VALUES (v_session.id, 'USER', p_content, p_content_metadata)
+    RETURNING * INTO v_message;
+
+    v_incremental := p_history_after IS NOT NULL AND p_session_hint IS NOT DISTINCT FROM v_session.id;
+
+    -- LIMIT NULL means no limit: an incremental fetch must not leave gaps in the cached history
+    SELECT COALESCE(jsonb_agg(to_jsonb(m) ORDER BY m.created_at, m.id), '[]'::jsonb) INTO v_history
+    FROM (
+        SELECT * FROM public.chat_messages
+        WHERE session_id = v_session.id
+          AND (NOT v_incremental OR created_at >= p_history_after)
+        ORDER BY created_at DESC, id DESC
+        LIMIT CASE WHEN v_incremental THEN NULL ELSE p_history_limit END
+    ) AS m;
+
+    RETURN jsonb_build_object(
+        'session', to_jsonb(v_session),
+        'user_message', to_jsonb(v_message),
+        'agent', to_jsonb(v_agent),
+        'history', v_history,
+        'history_incremental', v_incremental
+    );
+END;
+$$ LANGUAGE plpgsql;
+
+-- Finishes a chat turn: stores the agent reply and its usage_metrics row in one round-trip.
+-- A failed usage insert is reported as a warning and does not roll back the reply.
+CREATE OR REPLACE FUNCTION public.chat_complete_turn(
+    p_session_id UUID,
+    p_content TEXT,
+    p_usage JSONB DEFAULT NULL
+)
+RETURNS JSONB AS $$
+DECLARE
+    v_message public.chat_messages%ROWTYPE;
+BEGIN
+    INSERT INTO public.chat_messages (session_id, sender_type, content)
+    VALUES (p_session_id, 'AGENT', p_content)
+    RETURNING * INTO v_message;
+
+    IF p_usage IS NOT NULL THEN
+        BEGIN
+            INSERT INTO public.usage_metrics (
+                user_id, agent_id, session_id, event_type, model_name, input_tokens, output_tokens, cost, details
+            )
+            VALUES (
+                auth.uid(),
+                (p_usage->>'agent_id')::UUID,
+                p_session_id::TEXT,
+                p_usage->>'event_type',
+                p_usage->>'model_name',
+                COALESCE((p_usage->>'input_tokens')::INTEGER, 0),
+                COALESCE((p_usage->>'output_tokens')::INTEGER, 0),
+                COALESCE((p_usage->>'cost')::NUMERIC, 0),
+                p_usage->'details'
+            );
+        EXCEPTION WHEN OTHERS THEN
+            RAISE WARNING 'Could not log usage metrics for session %: %', p_session_id, SQLERRM;
+        END;
+    END IF;
+
+    RETURN to_jsonb(v_message);
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,79 @@
+-- supabase/migrations/20250622120000_add_tool_names_to_chat_begin_turn.sql
+
+-- chat_begin_turn also returns the names of the agent's tools (from agent_tools), which
+-- the model router needs to keep turns that mention a tool on the strong model.
+CREATE OR REPLACE FUNCTION public.chat_begin_turn(
+    p_agent_id UUID,
+    p_content TEXT,
+    p_content_metadata JSONB DEFAULT NULL,
+    p_session_hint UUID DEFAULT NULL,
+    p_history_after TIMESTAMPTZ DEFAULT NULL,
+    p_history_limit INTEGER DEFAULT 500
+)
+RETURNS JSONB AS $$
+DECLARE
+    v_user_id UUID := auth.uid();
+    v_agent public.agents%ROWTYPE;
+    v_session public.chat_sessions%ROWTYPE;
+    v_message public.chat_messages%ROWTYPE;
+    v_incremental BOOLEAN;
+    v_history JSONB;
+    v_tool_names JSONB;
+BEGIN
+    IF v_user_id IS NULL THEN
+        RAISE EXCEPTION 'Not authenticated' USING ERRCODE = '28000';
+    END IF;
+
+    SELECT * INTO v_agent FROM public.agents WHERE id = p_agent_id;
+    IF NOT FOUND THEN
+        RAISE EXCEPTION 'Agent not found' USING ERRCODE = 'P0002';
+    END IF;
+
+    UPDATE public.chat_sessions
+    SET updated_at = now()
+    WHERE id = (
+        SELECT id FROM public.chat_sessions
+        WHERE user_id = v_user_id AND agent_id = p_agent_id
+        ORDER BY updated_at DESC
+        LIMIT 1
+    )
+    RETURNING * INTO v_session;
+
+    IF NOT FOUND THEN
+        INSERT INTO public.chat_sessions (user_id, agent_id, session_title)
+        VALUES (v_user_id, p_agent_id, 'Chat with ' || v_agent.name)
+        RETURNING * INTO v_session;
+    END IF;
+
+    INSERT INTO public.chat_messages (session_id, sender_type, content, content_metadata)
+    VALUES (v_session.id, 'USER', p_content, p_content_metadata)
+    RETURNING * INTO v_message;
+
+    v_incremental := p_history_after IS NOT NULL AND p_session_hint IS NOT DISTINCT FROM v_session.id;
+
+    -- LIMIT NULL means no limit: an incremental fetch must not leave gaps in the cached history
+    SELECT COALESCE(jsonb_agg(to_jsonb(m) ORDER BY m.created_at, m.id), '[]'::jsonb) INTO v_history
+    FROM (
+        SELECT * FROM public.chat_messages
+        WHERE session_id = v_session.id
+          AND (NOT v_incremental OR created_at >= p_history_after)
+        ORDER BY created_at DESC, id DESC
+        LIMIT CASE WHEN v_incremental THEN NULL ELSE p_history_limit END
+    ) AS m;
+
+    -- Tools live in the agent_tools junction table, not on the agents row
+    SELECT COALESCE(jsonb_agg(t.name ORDER BY t.name), '[]'::jsonb) INTO v_tool_names
+    FROM public.agent_tools AS agt
+    JOIN public.tools AS t ON t.id = agt.tool_id
+    WHERE agt.agent_id = p_agent_id;
+
+    RETURN jsonb_build_object(
+        'session', to_jsonb(v_session),
+        'user_message', to_jsonb(v_message),
+        'agent', to_jsonb(v_agent),
+        'history', v_history,
+        'history_incremental', v_incremental,
+        'tool_names', v_tool_names
+    );
+END;
+$$ LANGUAGE plpgsql;